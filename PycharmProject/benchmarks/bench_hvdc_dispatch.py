@@ -0,0 +1,76 @@
+# Benchmark of the slack redistribution in set_hvdc_active_power, without PSS/E
+# Compares the old per-machine loops with dispatch.py on synthetic networks from Nordel size up to 10 000 buses
+# Usage: python benchmarks/bench_hvdc_dispatch.py (from PycharmProject)
+
+# Standard Python-packages
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dispatch
+
+
+def synthetic_network(n_buses, n_areas=20, seed=0):
+    # Bus numbers/areas and in-service machines (sorted by bus, as psspy.amach* returns them)
+    rng = np.random.RandomState(seed)
+    bus_numbers = np.sort(rng.choice(np.arange(1000, 1000 + 20 * n_buses), n_buses, replace=False))
+    bus_areas = rng.randint(1, n_areas + 1, n_buses)
+    machine_buses = rng.choice(bus_numbers, max(n_buses // 3, 1))
+    machine_numbers = np.sort(np.repeat(machine_buses, rng.randint(1, 4, len(machine_buses))))
+    mach_gen_cap = rng.uniform(50.0, 500.0, len(machine_numbers))
+    mach_gen = mach_gen_cap * rng.uniform(0.2, 0.9, len(machine_numbers))
+    return bus_numbers, bus_areas, machine_numbers, mach_gen, mach_gen_cap
+
+
+def legacy(bus_numbers, bus_areas, machine_numbers, mach_gen, mach_gen_cap, hvdc_bus_area, slack_p):
+    # The loops of the old set_hvdc_active_power (export direction), machine_chng_2 replaced by a counter
+    machine_areas = np.zeros(len(machine_numbers))
+    for i in range(len(machine_numbers)):
+        machine_areas[i] = bus_areas[np.where(bus_numbers == machine_numbers[i])[0][0]]
+    indices = np.where(machine_areas == hvdc_bus_area)[0]
+    mach_slack = mach_gen_cap - mach_gen
+    area_rem_gen_cap = sum(mach_slack[indices])
+    sys_rem_gen_cap = sum(mach_slack)
+    calls = 0
+    if area_rem_gen_cap > slack_p:
+        mach_slack = mach_slack * (slack_p / area_rem_gen_cap)
+        for i in indices:
+            calls += 1
+    else:
+        for i in indices:
+            calls += 1
+        slack_p = slack_p - sum(mach_slack[indices])
+        sys_rem_gen_cap = sys_rem_gen_cap - sum(mach_slack[indices])
+        mach_slack[indices] = 0
+        mach_slack = mach_slack * (slack_p / sys_rem_gen_cap)
+        for i in range(len(mach_slack)):
+            calls += 1
+    return calls
+
+
+def vectorized(bus_numbers, bus_areas, machine_numbers, mach_gen, mach_gen_cap, hvdc_bus_area, slack_p):
+    in_area = dispatch.machine_areas(machine_numbers, bus_numbers, bus_areas) == hvdc_bus_area
+    new_gen = dispatch.distribute_hvdc_slack(mach_gen, mach_gen_cap, in_area, slack_p)
+    return int(np.count_nonzero(np.abs(new_gen - mach_gen) > 1e-6))
+
+
+def main():
+    print("%8s %9s %9s %12s %12s %9s %12s %12s" % ("buses", "machines", "slack MW", "legacy ms", "vector ms",
+                                                 "speedup", "legacy calls", "vector calls"))
+    for n_buses in (500, 1000, 2000, 5000, 10000):
+        network = synthetic_network(n_buses)
+        hvdc_bus_area = network[1][0]
+        for slack_p in (200.0, 20000.0):  # Covered by the local area / overflow to the whole system
+            args = network + (hvdc_bus_area, slack_p)
+            repeat = 3 if n_buses > 2000 else 10
+            t_legacy = min(timeit.repeat(lambda: legacy(*args), number=1, repeat=repeat))
+            t_vector = min(timeit.repeat(lambda: vectorized(*args), number=1, repeat=repeat))
+            print("%8d %9d %9.0f %12.2f %12.3f %9.0f %12d %12d" % (
+                n_buses, len(network[2]), slack_p, 1e3 * t_legacy, 1e3 * t_vector, t_legacy / t_vector,
+                legacy(*args), vectorized(*args)))
+
+
+if __name__ == "__main__":
+    main()
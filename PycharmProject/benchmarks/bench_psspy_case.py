@@ -0,0 +1,184 @@
+# Benchmark of PsspyCase against the stand-in PSS/E in benchmarks/simpsse, runs anywhere numpy and matplotlib run
+# Times the main PsspyCase steps on synthetic networks of growing size, writes the results as JSON and
+# compares them with a baseline to flag regressions
+# Usage: python benchmarks/bench_psspy_case.py [--sizes small medium] [--save-baseline] (from PycharmProject)
+
+# Standard Python-packages
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import timeit
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, "simpsse"))  # psspy, dyntools and redirect stand-ins come first
+sys.path.insert(1, os.path.dirname(_HERE))
+os.environ.setdefault("MPLBACKEND", "Agg")  # plot_results loads matplotlib, no window is opened here
+
+import numpy as np
+import psspy
+import psspyObject
+from synthetic_network import SyntheticNetwork
+
+
+# Network size, monitored machine buses (4 channels each) and length of the dynamic run per tier
+SIZES = {
+    "small": {"network": {"buses": 500}, "monitored": 10, "end_time": 10.0},
+    "medium": {"network": {"buses": 2000, "loads_per_bus": 2}, "monitored": 50, "end_time": 20.0},
+    "large": {"network": {"buses": 10000, "machines_per_bus": 2, "loads_per_bus": 2}, "monitored": 100,
+              "end_time": 30.0},
+}
+QUANTITIES = (1, 2, 4, 7)  # ANGLE, PELEC, ETERM, SPEED as in set_monitor_channels
+TIME_STEP = 0.005
+HVDC_BUS = 5610
+LOAD_STEP_BUS = 7000
+
+_DEFAULT_OUTPUT = os.path.join(_HERE, "results", "bench_psspy_case.json")
+_DEFAULT_BASELINE = os.path.join(_HERE, "results", "bench_psspy_case_baseline.json")
+
+
+def new_case(work_dir, name):
+    # Fresh case from the synthetic network, as a script would start
+    case = psspyObject.PsspyCase(name, root_dir=work_dir, output_dir=work_dir)
+    case.filename = name
+    return case
+
+
+def monitored_buses(network, count):
+    # The first count generator buses, all of them have a machine with ID 1
+    return np.unique(network.families["machine"]["NUMBER"])[:count].tolist()
+
+
+def measure(setup, operation, repeat):
+    # Best and mean wall time of operation(setup()) and the psspy calls it makes, setup is not timed
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        psspy.calls.clear()
+        start = timeit.default_timer()
+        operation(state)
+        times.append(timeit.default_timer() - start)
+    return {"seconds": min(times), "mean": sum(times) / len(times), "psspy_calls": sum(psspy.calls.values())}
+
+
+def bench_size(name, size, work_dir, repeat):
+    network = SyntheticNetwork(**size["network"])
+    psspy.use_network(network)
+    buses = monitored_buses(network, size["monitored"])
+
+    def case_only():
+        return new_case(work_dir, name)
+
+    def monitored_case():
+        case = new_case(work_dir, name)
+        case.prepare_dynamic_simulation(TIME_STEP)
+        return case
+
+    def prepared_case():
+        case = monitored_case()
+        case.set_monitor_channels(buses, QUANTITIES)
+        case.add_fault(1.0, 2, LOAD_STEP_BUS, [100.0])
+        return case
+
+    def monitored_run_case():
+        case = prepared_case()
+        case.set_stop_monitor(max_speed_deviation=None)  # Synthetic SPEED channels are far from 0
+        return case
+
+    def simulated_case():
+        case = prepared_case()
+        case.run_dynamic_simulation(size["end_time"], nplt=1)
+        return case
+
+    def read_case():
+        case = simulated_case()
+        case.read_results("numpy")
+        return case
+
+    operations = [
+        ("set_hvdc_active_power", case_only, lambda case: case.set_hvdc_active_power(HVDC_BUS, 1400)),
+        ("_exec_load_step", case_only, lambda case: case._exec_load_step(LOAD_STEP_BUS, 100.0)),
+        ("set_monitor_channels", monitored_case, lambda case: case.set_monitor_channels(buses, QUANTITIES)),
+        ("run_dynamic_simulation", prepared_case, lambda case: case.run_dynamic_simulation(size["end_time"], nplt=1)),
+        ("run_dynamic_simulation_stop", monitored_run_case,
+         lambda case: case.run_dynamic_simulation(size["end_time"], nplt=1)),
+        ("read_results_chnf", simulated_case, lambda case: case.read_results("chnf")),
+        ("read_results_numpy", simulated_case, lambda case: case.read_results("numpy")),
+        ("compute_kpis", simulated_case, lambda case: case.compute_kpis()),
+        ("plot_results", read_case,
+         lambda case: case.plot_results(show_plots=False, plot_dir=os.path.join(work_dir, "Plots"))),
+    ]
+    result = {"network": network.size, "channels": len(buses) * len(QUANTITIES),
+              "samples": int(round(size["end_time"] / TIME_STEP)) + 1, "operations": {}}
+    for operation, setup, function in operations:
+        result["operations"][operation] = measure(setup, function, repeat)
+    return result
+
+
+def compare(results, baseline, threshold, noise=1e-3):
+    # [(size, operation, baseline s, now s)] of operations slower than baseline * (1 + threshold) and by more than noise
+    regressions = []
+    for size, values in sorted(results["sizes"].items()):
+        old_size = baseline.get("sizes", {}).get(size)
+        if old_size is None:
+            continue
+        for operation, value in sorted(values["operations"].items()):
+            old = old_size["operations"].get(operation)
+            if old is None:
+                continue
+            if value["seconds"] > old["seconds"] * (1.0 + threshold) and value["seconds"] - old["seconds"] > noise:
+                regressions.append((size, operation, old["seconds"], value["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PsspyCase against the stand-in PSS/E")
+    parser.add_argument("--sizes", nargs="+", default=sorted(SIZES), choices=sorted(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=_DEFAULT_OUTPUT, help="JSON file for the results")
+    parser.add_argument("--baseline", default=_DEFAULT_BASELINE, help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 = 25 %%")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_psspy_case_")
+    results = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+               "numpy": np.__version__, "platform": platform.platform(), "repeat": args.repeat,
+               "time_step": TIME_STEP, "sizes": {}}
+    try:
+        for name in args.sizes:
+            results["sizes"][name] = bench_size(name, SIZES[name], work_dir, args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("%-8s %-24s %12s %12s %12s" % ("size", "operation", "best ms", "mean ms", "psspy calls"))
+    for name in args.sizes:
+        for operation, value in sorted(results["sizes"][name]["operations"].items()):
+            print("%-8s %-24s %12.2f %12.2f %12d" % (name, operation, 1e3 * value["seconds"], 1e3 * value["mean"],
+                                                     value["psspy_calls"]))
+
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            os.makedirs(os.path.dirname(os.path.abspath(path)))
+        with open(path, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    print("Results written to " + args.output)
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for size, operation, old, new in regressions:
+        print("REGRESSION %-8s %-24s %.2f ms -> %.2f ms (%+.0f %%)" % (size, operation, 1e3 * old, 1e3 * new,
+                                                                   100.0 * (new / old - 1.0)))
+    if not regressions:
+        print("No regressions against " + args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
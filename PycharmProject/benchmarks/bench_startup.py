@@ -0,0 +1,87 @@
+# Benchmark of the start of a short-lived worker: import psspyObject, construct a case, first load flow
+# Every sample is a fresh Python process with the stand-in PSS/E of benchmarks/simpsse, so the numbers are the
+# Python side of the startup (imports, psseinit sizing, dyre_new, first array fetches)
+# Usage: python benchmarks/bench_startup.py [--repeat 5] [--output startup.json] (from PycharmProject)
+
+# Standard Python-packages
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Run in the child process, prints one JSON line
+_CHILD = r"""
+import os, sys, json, tempfile, timeit
+sys.path.insert(0, %(simpsse)r)
+sys.path.insert(1, %(project)r)
+import psspy
+from synthetic_network import SyntheticNetwork
+psspy.use_network(SyntheticNetwork(%(buses)d))
+setup = timeit.default_timer()
+import psspyObject
+imported = timeit.default_timer()
+work_dir = tempfile.mkdtemp()
+case = psspyObject.PsspyCase("startup", root_dir=work_dir, output_dir=work_dir, **%(options)r)
+constructed = timeit.default_timer()
+case.run_static_load_flow()
+solved = timeit.default_timer()
+print(json.dumps({"import": imported - setup, "construct": constructed - imported, "load_flow": solved - constructed,
+                  "matplotlib": "matplotlib" in sys.modules,
+                  "dyntools": "dyntools" in sys.modules, "dyre_new": psspy.calls["dyre_new"],
+                  "psspy_calls": sum(psspy.calls.values())}))
+"""
+
+# Constructor options per mode
+MODES = {
+    "dynamic": {},
+    "static_only": {"dynamics": False, "redirect_output": False},
+}
+
+
+def sample(mode, buses):
+    code = _CHILD % {"simpsse": os.path.join(_HERE, "simpsse"), "project": os.path.dirname(_HERE),
+                     "buses": buses, "options": MODES[mode]}
+    output = subprocess.check_output([sys.executable, "-c", code], env=dict(os.environ, MPLBACKEND="Agg"))
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def reference(module):
+    # Import time of a module on its own in a fresh process, ex. what a plot library adds to the startup
+    code = "import timeit; t = timeit.default_timer(); import %s; print(timeit.default_timer() - t)" % module
+    output = subprocess.check_output([sys.executable, "-c", code], env=dict(os.environ, MPLBACKEND="Agg"))
+    return float(output.decode("utf-8").strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from import psspyObject to the first load flow")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per mode, the best one counts")
+    parser.add_argument("--buses", type=int, default=2000, help="Size of the synthetic network")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    results = {"buses": args.buses, "modes": {}, "reference": {}}
+    print("%-12s %10s %10s %10s %10s %11s %9s" % ("mode", "import ms", "case ms", "fdns ms", "total ms",
+                                                "matplotlib", "dyre_new"))
+    for mode in sorted(MODES):
+        samples = [sample(mode, args.buses) for _ in range(args.repeat)]
+        best = min(samples, key=lambda s: s["import"] + s["construct"] + s["load_flow"])
+        best["total"] = best["import"] + best["construct"] + best["load_flow"]
+        results["modes"][mode] = best
+        print("%-12s %10.1f %10.1f %10.1f %10.1f %11s %9d" % (mode, 1e3 * best["import"], 1e3 * best["construct"],
+                                                            1e3 * best["load_flow"], 1e3 * best["total"],
+                                                            best["matplotlib"], best["dyre_new"]))
+    for module in ("numpy", "matplotlib.pyplot"):
+        results["reference"][module] = min(reference(module) for _ in range(args.repeat))
+        print("import %-20s %10.1f ms (not loaded by the modes above unless marked)" % (
+            module, 1e3 * results["reference"][module]))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
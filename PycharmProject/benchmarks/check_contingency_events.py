@@ -0,0 +1,73 @@
+# Check of the branch and bus trip handlers of PsspyCase as the contingency engine drives them, without PSS/E
+# Faults from contingency.Contingency go through add_fault and the event scheduler to psspy.dist_branch_trip and
+# psspy.dist_bus_trip of the stand-in in benchmarks/simpsse, which records every trip and rejects unknown branches
+# Usage: python benchmarks/check_contingency_events.py (from PycharmProject), exit code 1 if a check fails
+
+# Standard Python-packages
+import os
+import sys
+import tempfile
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, "simpsse"))  # psspy, dyntools and redirect stand-ins come first
+sys.path.insert(1, os.path.dirname(_HERE))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import psspy
+import psspyObject
+from contingency import Contingency
+from synthetic_network import SyntheticNetwork
+
+_i = psspy.getdefaultint()
+_f = psspy.getdefaultreal()
+
+
+def run_faults(work_dir, faults, parallel_circuit=None):
+    # Dynamic run with the faults, returns the trips psspy saw
+    case = psspyObject.PsspyCase("trips", root_dir=work_dir, output_dir=work_dir)
+    if parallel_circuit is not None:
+        bus, other_end, branch_id = parallel_circuit
+        case.network.branch_data(bus, other_end, branch_id, [_i] * 6, [_f] * 6)
+    case.run_static_load_flow()
+    case.prepare_dynamic_simulation(0.01, [10.0, 10.0], [10.0, 10.0])
+    for fault in faults:
+        case.add_fault(*fault)
+    case.set_monitor_channels([5600], [1])
+    case.run_dynamic_simulation(3.0)
+    return psspy.trips()
+
+
+def main():
+    network = SyntheticNetwork(300)  # Every psspy.case starts from a copy of it
+    psspy.use_network(network)
+    work_dir = tempfile.mkdtemp()
+    branches = network.families["branch"]
+    bus, other_end = int(branches["FROMNUMBER"][0]), int(branches["TONUMBER"][0])
+
+    failures = []
+
+    def check(name, passed, detail=""):
+        print("%-48s %s %s" % (name, "ok" if passed else "FAILED", detail))
+        if not passed:
+            failures.append(name)
+
+    # Circuit "2" in parallel with an existing line, given from the other end, and a bus trip
+    branch = Contingency(other_end, bus, "2")
+    station = Contingency(5600)
+    trips = run_faults(work_dir, [branch.fault(1.0), station.fault(2.0)], (bus, other_end, "2"))
+    check("dist_branch_trip with circuit ID 2", (1.0, "branch", bus, other_end, "2") in trips, trips)
+    check("dist_bus_trip through Contingency.fault", (2.0, "bus", 5600) in trips, trips)
+    check("one trip per fault", len(trips) == 2, len(trips))
+
+    # A circuit that does not exist must not pass silently
+    try:
+        trips = run_faults(work_dir, [Contingency(bus, other_end, "9").fault(1.0)])
+        check("unknown circuit ID raises", False, trips)
+    except RuntimeError as error:
+        check("unknown circuit ID raises", True, error)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
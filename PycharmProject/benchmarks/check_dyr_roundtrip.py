@@ -0,0 +1,57 @@
+# Check that DyrData.write keeps every parameter exactly: parse -> write -> parse gives the same arrays
+# The .dyr file is made here, with values that need more than 6 significant digits, tiny and large exponents
+# and records over several lines
+# Usage: python benchmarks/check_dyr_roundtrip.py (from PycharmProject), exit code 1 if a check fails
+
+# Standard Python-packages
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dyr_parser import DyrData
+
+_RECORDS = """ 1001 'GENROU' 1  7.123456789 0.0312345678 0.75 0.05 4.2345678901
+     0.0 1.812345678 1.75 0.3123456789 0.65 0.25 0.15 0.1 0.45 /
+ 1002 'GENROU' '2' 6.5 0.035 1.5 0.07 3.000000001 0.0 2.1 2.0 0.3 0.55 0.2 0.14 1.23456789e-7 0.4 /
+ 1001 'SEXS' 1 0.1 10.0 200.00000001 0.05 -4.5 5.25 /
+ 1002 'IEESGO' '2' 0.0 0.0 0.0 0.0 0.0 0.0 20.0 0.33333333333333331 1e+18 1.05 1E-300 /
+ 1003 'USRMDL' 1 1 2 3 4 5 6 7 8 9 10 11 0.1 0.2 /
+"""
+
+
+def main():
+    failures = []
+
+    def check(name, passed, detail=""):
+        print("%-48s %s %s" % (name, "ok" if passed else "FAILED", detail))
+        if not passed:
+            failures.append(name)
+
+    folder = tempfile.mkdtemp()
+    source, first, second = [os.path.join(folder, name) for name in ("source.dyr", "first.dyr", "second.dyr")]
+    with open(source, "w") as f:
+        f.write(_RECORDS)
+    original = DyrData.read(source)
+    original.write(first)
+    again = DyrData.read(first)
+    for model in sorted(original.tables):
+        a, b = original.table(model), again.table(model)
+        same = (np.array_equal(a.buses, b.buses) and list(a.ids) == list(b.ids) and
+                np.array_equal(a.params, b.params, equal_nan=True))
+        check("%s parameters unchanged" % model, same, "" if same else np.nanmax(np.abs(a.params - b.params)))
+    check("record order unchanged", original.order == again.order)
+
+    # Writing again gives the same file
+    again.write(second)
+    with open(first) as f, open(second) as g:
+        check("second write identical", f.read() == g.read())
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Check of the damping estimate of kpi.compute on synthetic ringdowns with known modes
+# The signals cover a 120 s run with the event at 10 s, long enough that a fit over the whole run at a coarse
+# sample rate would alias the 1-2 Hz modes to a slow drift
+# Usage: python benchmarks/check_kpi_ringdown.py (from PycharmProject), exit code 1 if a check fails
+
+# Standard Python-packages
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kpi
+
+
+def ringdown_signal(time, t_event, frequency, damping, amplitude=0.2, offset=50.0):
+    # Step at t_event followed by a decaying oscillation with the given frequency (Hz) and damping ratio
+    omega = 2.0 * np.pi * frequency / np.sqrt(1.0 - damping ** 2)  # Undamped natural frequency
+    after = np.clip(time - t_event, 0.0, None)
+    oscillation = amplitude * np.exp(-damping * omega * after) * np.cos(2.0 * np.pi * frequency * after)
+    return np.where(time >= t_event, offset - 0.1 + oscillation, offset)
+
+
+def main():
+    failures = []
+
+    def check(name, passed, detail=""):
+        print("%-48s %s %s" % (name, "ok" if passed else "FAILED", detail))
+        if not passed:
+            failures.append(name)
+
+    modes = [(0.5, 0.10), (1.2, 0.05), (1.8, 0.05), (2.0, 0.15)]
+    for time_step in [0.01, 0.05]:
+        time = np.arange(0.0, 120.0 + 0.5 * time_step, time_step)
+        values = np.array([ringdown_signal(time, 10.0, f, zeta) for f, zeta in modes])
+        result = kpi.compute(time, values, 10.0)
+        for (f, zeta), found_f, found_zeta in zip(modes, result["frequency"], result["damping"]):
+            name = "%.1f Hz at %.0f%%, %.2f s steps" % (f, 100.0 * zeta, time_step)
+            check(name, abs(found_f - f) < 0.02 and abs(found_zeta - zeta) < 0.01,
+                  "%.3f Hz %.3f" % (found_f, found_zeta))
+
+    # Short window up to the next event, resampled more densely than 10 Hz
+    time = np.arange(0.0, 13.0, 0.01)
+    result = kpi.compute(time, ringdown_signal(time, 10.0, 1.2, 0.05), 10.0)
+    check("1.2 Hz in a 2 s window", abs(result["frequency"] - 1.2) < 0.02, "%.3f Hz" % result["frequency"])
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Stand-in for dyntools on machines without PSS/E, used by the benchmarks
+# CHNF reads the whole channel file into Python lists, record by record, as dyntools does
+
+# Standard Python-packages
+import struct
+
+
+_MAGIC_LENGTH = 12
+_ID_WIDTH = 32
+_TITLE_WIDTH = 60
+
+
+class CHNF(object):
+    """Channel file(s) read into memory"""
+    def __init__(self, *outfiles):
+        self.outfiles = outfiles
+        self._data = {}
+        for outfile in outfiles:
+            self._data[outfile] = self._read(outfile)
+
+    def get_data(self, outfile=""):
+        # (short title, {channel: identifier}, {channel: list of samples}), "time" is the time axis
+        return self._data[outfile or self.outfiles[0]]
+
+    def _read(self, outfile):
+        with open(outfile, "rb") as f:
+            content = f.read()
+        n_channels = int(struct.unpack("<f", content[_MAGIC_LENGTH:_MAGIC_LENGTH + 4])[0])
+        position = _MAGIC_LENGTH + 8
+        ids = content[position:position + n_channels * _ID_WIDTH].decode("latin-1")
+        position += n_channels * _ID_WIDTH
+        title = content[position:position + 2 * _TITLE_WIDTH].decode("latin-1")
+        position += 2 * _TITLE_WIDTH
+
+        ch_id = {"time": "Time(s)"}
+        ch_data = {"time": []}
+        for k in range(n_channels):
+            ch_id[k + 1] = ids[k * _ID_WIDTH:(k + 1) * _ID_WIDTH].strip()
+            ch_data[k + 1] = []
+        record = struct.Struct("<%df" % (n_channels + 2))
+        while position + record.size <= len(content):
+            values = record.unpack_from(content, position)
+            position += record.size
+            if int(values[0]) != n_channels:  # End marker
+                break
+            ch_data["time"].append(values[1])
+            for k in range(n_channels):
+                ch_data[k + 1].append(values[k + 2])
+        sh_ttl = title[:_TITLE_WIDTH].strip() + "\n" + title[_TITLE_WIDTH:].strip()
+        return sh_ttl, ch_id, ch_data
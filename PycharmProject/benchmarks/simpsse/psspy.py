@@ -0,0 +1,359 @@
+# Stand-in for psspy on machines without PSS/E, used by the benchmarks
+# Same signatures and return values as PSS/E 33 for the functions PycharmProject calls, backed by a SyntheticNetwork
+# Pick the network with use_network() before psspy.case(), every call is counted in calls
+
+# Standard Python-packages
+import os
+import collections
+import numpy as np
+
+# Custom packages
+from synthetic_network import SyntheticNetwork, channel_id, signals, write_header, write_records
+
+
+_DEFAULT_INT = -100000
+_DEFAULT_REAL = 1.0e20
+_DEFAULT_CHAR = "\x01"
+
+throwPsseExceptions = False
+calls = collections.Counter()  # Function name -> number of calls
+
+_state = {"template": None,  # SyntheticNetwork every psspy.case starts from
+          "network": None,  # Network of the present case
+          "time_step": 0.01,  # Dynamic simulation time step (s)
+          "channels": {},  # Channel index -> identifier
+          "outfile": None,  # Channel file of the present run
+          "time": 0.0,  # Present simulation time (s)
+          "seed": 0,
+          "values": (None, []),  # (time, channel values) of the last chnval
+          "trips": []}  # (time, "branch", from bus, to bus, ID) and (time, "bus", bus) of the dist_*_trip calls
+
+
+def use_network(network):
+    # Network served by the following psspy.case calls
+    _state["template"] = network
+
+
+def network():
+    # Network of the present case, to check results in the benchmarks
+    return _state["network"]
+
+
+def trips():
+    # Branch and bus trips of the present case, in the order they were applied
+    return list(_state["trips"])
+
+
+def _counted(function):
+    def wrapper(*args, **kwargs):
+        calls[function.__name__] += 1
+        return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+
+def _error(ierr, message):
+    if throwPsseExceptions:
+        raise RuntimeError(message)
+    return ierr
+
+
+# Session and case
+@_counted
+def getdefaultint():
+    return _DEFAULT_INT
+
+
+@_counted
+def getdefaultreal():
+    return _DEFAULT_REAL
+
+
+@_counted
+def getdefaultchar():
+    return _DEFAULT_CHAR
+
+
+@_counted
+def psseinit(buses=150000):
+    return 0
+
+
+@_counted
+def case(sfile):
+    if _state["template"] is None:
+        _state["template"] = SyntheticNetwork()
+    _state["network"] = _state["template"].copy()
+    _state["channels"] = {}
+    _state["trips"] = []
+    return 0
+
+
+@_counted
+def dyre_new(startindx=None, dyrefile="", conecfile="", conetfile="", compilfile=""):
+    return 0
+
+
+@_counted
+def sysmva():
+    return 100.0
+
+
+@_counted
+def save(sfile):
+    return 0
+
+
+@_counted
+def snap(status=None, sfile=""):
+    return 0
+
+
+@_counted
+def rstr(sfile):
+    return 0
+
+
+# Array functions, (ierr, [one list per field])
+def _array_function(family, name):
+    def function(*args):
+        strings = args[-1]
+        fields = [strings] if isinstance(strings, (str, type(u""))) else strings
+        return 0, [_state["network"].column(family, field) for field in fields]
+    function.__name__ = name
+    return _counted(function)
+
+
+abusint = _array_function("bus", "abusint")
+abusreal = _array_function("bus", "abusreal")
+abuscplx = _array_function("bus", "abuscplx")
+aloadint = _array_function("load", "aloadint")
+aloadcplx = _array_function("load", "aloadcplx")
+aloadchar = _array_function("load", "aloadchar")
+amachint = _array_function("machine", "amachint")
+amachreal = _array_function("machine", "amachreal")
+amachchar = _array_function("machine", "amachchar")
+agenbusint = _array_function("plant", "agenbusint")
+agenbusreal = _array_function("plant", "agenbusreal")
+abrnint = _array_function("branch", "abrnint")
+abrnreal = _array_function("branch", "abrnreal")
+abrncplx = _array_function("branch", "abrncplx")
+abrnchar = _array_function("branch", "abrnchar")
+atrnint = _array_function("transformer", "atrnint")
+atrnreal = _array_function("transformer", "atrnreal")
+atrncplx = _array_function("transformer", "atrncplx")
+atrnchar = _array_function("transformer", "atrnchar")
+
+
+# Network changes
+@_counted
+def machine_chng_2(ibus, id, intgar, realar):
+    row = _state["network"].machine_row(ibus, id)
+    if row is None:
+        return _error(1, "Machine %s at bus %d not found" % (id, ibus))
+    machines = _state["network"].families["machine"]
+    for position, field in ((0, "PGEN"), (1, "QGEN"), (4, "PMAX"), (5, "PMIN")):
+        if len(realar) > position and realar[position] != _DEFAULT_REAL:
+            machines[field][row] = realar[position]
+    return 0
+
+
+@_counted
+def load_chng_4(ibus, id, intgar, realar):
+    row = _state["network"].load_row(ibus, "1" if id == _DEFAULT_CHAR else id)
+    if row is None:
+        return _error(1, "Load %s at bus %d not found" % (id, ibus))
+    loads = _state["network"].families["load"]
+    for field in ("MVAACT", "MVANOM", "TOTALACT"):
+        value = loads[field][row]
+        p = value.real if realar[0] == _DEFAULT_REAL else realar[0]
+        q = value.imag if len(realar) < 2 or realar[1] == _DEFAULT_REAL else realar[1]
+        loads[field][row] = complex(p, q)
+    return 0
+
+
+@_counted
+def load_data_4(ibus, id, intgar, realar):
+    network = _state["network"]
+    if network.load_row(ibus, id) is None:
+        p = 0.0 if realar[0] == _DEFAULT_REAL else realar[0]
+        network.append("load", {"NUMBER": ibus, "AREA": network.bus_area(ibus), "ID": str(id).ljust(2),
+                                "MVAACT": p, "MVANOM": p, "TOTALACT": p})
+    return 0
+
+
+@_counted
+def bus_data_3(ibus, intgar, realar, name=""):
+    network = _state["network"]
+    if not network.has_bus(ibus):
+        area = 1 if intgar[1] == _DEFAULT_INT else intgar[1]
+        base = 0.0 if realar[0] == _DEFAULT_REAL else realar[0]
+        network.append("bus", {"NUMBER": ibus, "AREA": area, "TYPE": 1, "BASE": base, "PU": 1.0, "ANGLED": 0.0,
+                               "SHUNTACT": 0.0})
+    return 0
+
+
+@_counted
+def branch_data(ibus, jbus, ckt, intgar, realar):
+    _state["network"].append("branch", {"FROMNUMBER": min(ibus, jbus), "TONUMBER": max(ibus, jbus),
+                                        "ID": str(ckt).ljust(2), "RX": 0.01j, "CHARGING": 0.0,
+                                        "RATEA": 0.0})
+    return 0
+
+
+@_counted
+def branch_chng(ibus, jbus, ckt, intgar, realar):
+    return 0
+
+
+@_counted
+def fdns(options):
+    _state["network"].solve()
+    return 0
+
+
+@_counted
+def fnsl(options):
+    _state["network"].solve()
+    return 0
+
+
+# Dynamic simulation
+@_counted
+def cong(opt=0):
+    return 0
+
+
+@_counted
+def conl(apiopt, all, status, loadin, rlodin=None):
+    return 0, None
+
+
+@_counted
+def dynamics_solution_params(intgar=None, realar=None, outfile=""):
+    if realar is not None and realar[2] != _DEFAULT_REAL:
+        _state["time_step"] = realar[2]
+    return 0
+
+
+@_counted
+def set_relang(switch, ibus, id=""):
+    return 0
+
+
+@_counted
+def machine_array_channel(status, id="", ident=""):
+    network = _state["network"]
+    _add_channel(status[0], channel_id(status[1], status[2], str(id).strip(), _base_kv(network, status[2])))
+    return 0
+
+
+@_counted
+def bus_frequency_channel(status, ident=""):
+    _add_channel(status[0], channel_id("FREQ", status[1], "", _base_kv(_state["network"], status[1])))
+    return 0
+
+
+@_counted
+def voltage_channel(status, ident=""):
+    _add_channel(status[0], channel_id("VOLT", status[3], "", _base_kv(_state["network"], status[3])))
+    return 0
+
+
+@_counted
+def branch_p_channel(status, id="", ident=""):
+    _add_channel(status[0], "POWR %d TO %d CKT '%s'" % (status[3], status[4], id))
+    return 0
+
+
+@_counted
+def branch_p_and_q_channel(status, id="", ident=None):
+    index = _add_channel(status[0], "POWR %d TO %d CKT '%s'" % (status[3], status[4], id))
+    _add_channel(index + 1, "VARS %d TO %d CKT '%s'" % (status[3], status[4], id))
+    return 0
+
+
+@_counted
+def strt(option=0, outfile=""):
+    # Initialize the run: write the channel file header and the sample at time 0
+    if outfile and not os.path.splitext(outfile)[1]:
+        outfile += ".out"
+    _state["outfile"] = outfile or None
+    _state["time"] = 0.0
+    if _state["outfile"] is not None:
+        with open(_state["outfile"], "wb") as f:
+            write_header(f, _channel_ids())
+            write_records(f, np.zeros(1), signals(np.zeros(1), len(_channel_ids()), _state["seed"]))
+    return 0
+
+
+@_counted
+def run(option=0, tpause=1.0, nprt=1, nplt=1, crtplt=0):
+    # Advance to tpause, one sample written every nplt time steps
+    time_step = _state["time_step"]
+    steps = int(round((tpause - _state["time"]) / time_step))
+    if steps > 0 and _state["outfile"] is not None:
+        time = _state["time"] + time_step * np.arange(nplt, steps + 1, max(int(nplt), 1))
+        with open(_state["outfile"], "ab") as f:
+            write_records(f, time, signals(time, len(_channel_ids()), _state["seed"]))
+    _state["time"] = max(_state["time"], tpause)
+    return 0
+
+
+@_counted
+def chnval(n):
+    # Value of channel n at the present simulation time, as written to the channel file
+    time, values = _state["values"]
+    if time != _state["time"]:  # Once per time for all channels
+        values = signals(np.array([_state["time"]]), len(_channel_ids()), _state["seed"])[:, 0].tolist()
+        _state["values"] = (_state["time"], values)
+    return 0, values[n - 1]
+
+
+@_counted
+def dist_branch_trip(ibus, jbus, id):
+    # ierr 1 = bus not found, 2 = no branch with this circuit ID between the buses (either order, as PSS/E)
+    network = _state["network"]
+    if not network.has_bus(ibus) or not network.has_bus(jbus):
+        return _error(1, "dist_branch_trip: bus %d or %d not found" % (ibus, jbus))
+    branches = network.families["branch"]
+    match = (branches["FROMNUMBER"] == min(ibus, jbus)) & (branches["TONUMBER"] == max(ibus, jbus)) & \
+        (np.array([str(i).strip() for i in branches["ID"]]) == str(id).strip())
+    if not np.any(match):
+        return _error(2, "dist_branch_trip: no branch %d-%d circuit %r" % (ibus, jbus, id))
+    _state["trips"].append((_state["time"], "branch", min(ibus, jbus), max(ibus, jbus), str(id).strip()))
+    return 0
+
+
+@_counted
+def dist_bus_trip(ibus):
+    # ierr 1 = bus not found
+    if not _state["network"].has_bus(ibus):
+        return _error(1, "dist_bus_trip: bus %d not found" % ibus)
+    _state["trips"].append((_state["time"], "bus", ibus))
+    return 0
+
+
+# Private functions
+def _add_channel(index, identifier):
+    channels = _state["channels"]
+    if index is None or index < 1:  # -1: next free index
+        index = max(channels) + 1 if channels else 1
+    channels[index] = identifier
+    _state["values"] = (None, [])
+    return index
+
+
+def _channel_ids():
+    # Identifiers in index order, indices nobody set up are written as VAR channels like PSS/E does
+    channels = _state["channels"]
+    last = max(channels) if channels else 0
+    return [channels.get(index, "VAR %d" % index) for index in range(1, last + 1)]
+
+
+def _base_kv(network, bus):
+    bus_data = network.families["bus"]
+    row = int(np.searchsorted(bus_data["NUMBER"], bus))
+    if row < len(bus_data["NUMBER"]) and bus_data["NUMBER"][row] == bus:
+        return bus_data["BASE"][row]
+    return 0.0
@@ -0,0 +1,9 @@
+# Stand-in for redirect on machines without PSS/E, used by the benchmarks
+
+
+def psse2py():
+    return None
+
+
+def py2psse():
+    return None
@@ -0,0 +1,215 @@
+# Synthetic networks and channel files for the stand-in psspy, nothing here needs PSS/E
+# Array layout as psspy returns it: one entry per in-service element, sorted by bus number
+
+# Standard Python-packages
+import numpy as np
+
+
+# Buses the scripts in PycharmProject use by default: swing 3300, machines at 5600/7000, HVDC load at 5610
+_KNOWN_MACHINE_BUSES = (3300, 5600, 7000)
+_KNOWN_LOAD_BUSES = (5610, 7000)
+_KNOWN_BUSES = (3300, 5600, 5610, 6000, 7000)
+
+# Machine channel identifiers as PSS/E writes them, by quantity code of machine_array_channel
+_ID_ABBREVIATIONS = ("ANGL", "POWR", "VARS", "ETRM", "EFD", "PMEC", "SPD")
+
+_MAGIC = b"FuP_pHySPCD%"  # First 12 bytes of a PSS/E 33 channel file
+_ID_WIDTH = 32
+_TITLE_WIDTH = 60
+
+
+class SyntheticNetwork(object):
+    """Random but reproducible network of a given size, with the fields of the psspy array functions"""
+    # Constructor
+    def __init__(self, buses=2000, machines_per_bus=1, loads_per_bus=1, areas=20, branches_per_bus=1.5, seed=0):
+        """
+            Input:
+                buses: number of buses, the known buses of the scripts (3300, 5600, ...) are always included
+                machines_per_bus: machines at every generator bus, a third of the buses has generators
+                loads_per_bus: loads at every load bus, two thirds of the buses have loads
+                areas: number of areas, every bus gets a random one
+                branches_per_bus: lines per bus, a ring plus random chords
+                seed: seed of the random numbers, the same arguments give the same network
+        """
+        rng = np.random.RandomState(seed)
+        numbers = np.setdiff1d(np.arange(1000, 1000 + 20 * buses, 10), _KNOWN_BUSES)
+        numbers = np.sort(np.concatenate((rng.choice(numbers, buses - len(_KNOWN_BUSES), replace=False),
+                                          _KNOWN_BUSES)))
+        n = len(numbers)
+        bus_types = np.where(np.isin(numbers, _KNOWN_MACHINE_BUSES), 2, 1)
+        bus_types[numbers == _KNOWN_MACHINE_BUSES[0]] = 3  # Swing bus
+        self.families = {
+            "bus": {"NUMBER": numbers,
+                    "AREA": rng.randint(1, areas + 1, n),
+                    "TYPE": bus_types,
+                    "BASE": rng.choice([132.0, 300.0, 420.0], n),
+                    "PU": rng.uniform(0.97, 1.03, n),
+                    "ANGLED": rng.uniform(-30.0, 30.0, n),
+                    "SHUNTACT": np.zeros(n, dtype=complex)}}
+
+        # Machines, a third of the buses and the known generator buses
+        generator_buses = np.union1d(rng.choice(numbers, n // 3, replace=False), _KNOWN_MACHINE_BUSES)
+        machine_numbers = np.repeat(generator_buses, machines_per_bus)
+        m = len(machine_numbers)
+        pmax = rng.uniform(50.0, 500.0, m)
+        self.families["machine"] = {"NUMBER": machine_numbers,
+                                    "ID": np.array(_ids(machines_per_bus) * len(generator_buses), dtype=object),
+                                    "PGEN": pmax * rng.uniform(0.3, 0.8, m),
+                                    "QGEN": pmax * rng.uniform(-0.1, 0.2, m),
+                                    "PMAX": pmax,
+                                    "PMIN": np.zeros(m)}
+
+        # Loads, two thirds of the buses and the known load buses, total load below the total generation
+        load_buses = np.union1d(rng.choice(numbers, 2 * n // 3, replace=False), _KNOWN_LOAD_BUSES)
+        load_numbers = np.repeat(load_buses, loads_per_bus)
+        p = rng.uniform(10.0, 200.0, len(load_numbers))
+        p *= 0.98 * self.families["machine"]["PGEN"].sum() / p.sum()
+        power = p + 1j * 0.2 * p
+        self.families["load"] = {"NUMBER": load_numbers,
+                                 "AREA": self._areas(load_numbers),
+                                 "ID": np.array(_ids(loads_per_bus) * len(load_buses), dtype=object),
+                                 "MVAACT": power,
+                                 "MVANOM": power.copy(),
+                                 "TOTALACT": power.copy()}
+
+        # Lines, a ring so every bus is connected and random chords
+        chords = max(int(branches_per_bus * n) - n, 0)
+        ends = np.concatenate((np.column_stack((np.arange(n), np.roll(np.arange(n), -1))),
+                               rng.randint(0, n, (chords, 2))))
+        ends = np.sort(ends[ends[:, 0] != ends[:, 1]], axis=1)
+        ends = ends[np.lexsort((ends[:, 1], ends[:, 0]))]
+        self.families["branch"] = {"FROMNUMBER": numbers[ends[:, 0]],
+                                   "TONUMBER": numbers[ends[:, 1]],
+                                   "ID": np.array(["1 "] * len(ends), dtype=object),
+                                   "RX": rng.uniform(0.001, 0.01, len(ends)) + 1j * rng.uniform(0.01, 0.1, len(ends)),
+                                   "CHARGING": rng.uniform(0.0, 0.2, len(ends)),
+                                   "RATEA": rng.choice([500.0, 1000.0, 2000.0], len(ends))}
+        self.families["transformer"] = {"FROMNUMBER": np.zeros(0, dtype=int), "TONUMBER": np.zeros(0, dtype=int),
+                                        "ID": np.zeros(0, dtype=object), "RXACT": np.zeros(0, dtype=complex),
+                                        "RATIO": np.zeros(0), "ANGLE": np.zeros(0), "RATEA": np.zeros(0)}
+        self.size = {"buses": n, "machines": m, "loads": len(load_numbers), "branches": len(ends), "areas": areas}
+        self._machine_rows = None
+        self._load_rows = None
+
+    # Public functions
+    def copy(self):
+        # Independent copy, psspy.case starts every case from one of these
+        network = SyntheticNetwork.__new__(SyntheticNetwork)
+        network.families = dict((family, dict((field, values.copy()) for field, values in fields.items()))
+                                for family, fields in self.families.items())
+        network.size = dict(self.size)
+        network._machine_rows = None
+        network._load_rows = None
+        return network
+    def column(self, family, field):
+        # Values as the psspy array functions return them: a Python list
+        if family == "plant":
+            return self._plant(field).tolist()
+        return self.families[family][field].tolist()
+    def machine_row(self, bus, machine_id):
+        if self._machine_rows is None:
+            machines = self.families["machine"]
+            self._machine_rows = dict(((int(bus_), str(id_).strip()), row) for row, (bus_, id_)
+                                      in enumerate(zip(machines["NUMBER"], machines["ID"])))
+        return self._machine_rows.get((int(bus), str(machine_id).strip()))
+    def load_row(self, bus, load_id):
+        if self._load_rows is None:
+            loads = self.families["load"]
+            self._load_rows = dict(((int(bus_), str(id_).strip()), row) for row, (bus_, id_)
+                                   in enumerate(zip(loads["NUMBER"], loads["ID"])))
+        return self._load_rows.get((int(bus), str(load_id).strip()))
+    def append(self, family, values):
+        # Add one element (bus_data_3, load_data_4, branch_data), rows stay sorted by bus number
+        fields = self.families[family]
+        key = "FROMNUMBER" if family == "branch" else "NUMBER"
+        row = int(np.searchsorted(fields[key], values[key], side="right"))
+        for field in fields:
+            fields[field] = np.insert(fields[field], row, values[field])
+        self._machine_rows = None
+        self._load_rows = None
+    def has_bus(self, bus):
+        numbers = self.families["bus"]["NUMBER"]
+        row = int(np.searchsorted(numbers, bus))
+        return row < len(numbers) and numbers[row] == bus
+    def bus_area(self, bus):
+        return self._areas([bus])[0]
+    def solve(self):
+        # Stand-in for a load flow: the swing machines take up the power mismatch
+        machines = self.families["machine"]
+        swing = np.isin(machines["NUMBER"], self.families["bus"]["NUMBER"][self.families["bus"]["TYPE"] == 3])
+        mismatch = self.families["load"]["MVAACT"].real.sum() - machines["PGEN"].sum()
+        machines["PGEN"][swing] += mismatch / max(np.count_nonzero(swing), 1)
+
+    # Private functions
+    def _areas(self, buses):
+        bus = self.families["bus"]
+        return bus["AREA"][np.searchsorted(bus["NUMBER"], buses)]
+    def _plant(self, field):
+        machines = self.families["machine"]
+        numbers, rows = np.unique(machines["NUMBER"], return_inverse=True)
+        if field == "NUMBER":
+            return numbers
+        if field == "AREA":
+            return self._areas(numbers)
+        return np.bincount(rows, weights=machines[field], minlength=len(numbers))
+
+
+def channel_id(quantity, bus, machine_id="1", base_kv=300.0):
+    # Identifier of a channel as PSS/E writes it, ex. channel_id(7, 5600) = "SPD   5600[BUS5600  300.00]1"
+    if isinstance(quantity, int):
+        quantity = _ID_ABBREVIATIONS[quantity - 1] if quantity <= len(_ID_ABBREVIATIONS) else "MACH%d" % quantity
+    return "%-5s %5d[%-8s%6.2f]%s" % (quantity, bus, "BUS%d" % bus, base_kv, machine_id)
+
+
+def signals(time, n_channels, seed=0):
+    """
+        Samples of n_channels channels at the given times (channels x time): an offset and a damped
+        oscillation starting at 1 s, so the KPIs and the decimation have something to find.
+    """
+    rng = np.random.RandomState(seed)
+    offset = rng.uniform(-1.0, 1.0, (n_channels, 1))
+    amplitude = rng.uniform(0.01, 0.2, (n_channels, 1))
+    frequency = rng.uniform(0.2, 2.0, (n_channels, 1))
+    damping = rng.uniform(0.1, 1.0, (n_channels, 1))
+    after = np.maximum(np.asarray(time, dtype=float) - 1.0, 0.0)
+    return offset + amplitude * np.exp(-damping * after) * np.sin(2.0 * np.pi * frequency * after)
+
+
+def write_header(f, channel_ids, title=("Synthetic network", "simpsse")):
+    # Header of a channel file: identifier, channel count, format word, channel identifiers and the two title lines
+    f.write(_MAGIC)
+    f.write(np.array([len(channel_ids), 2.0], dtype="<f4").tobytes())
+    f.write("".join(c[:_ID_WIDTH].ljust(_ID_WIDTH) for c in channel_ids).encode("latin-1"))
+    f.write("".join(t[:_TITLE_WIDTH].ljust(_TITLE_WIDTH) for t in title).encode("latin-1"))
+
+
+def write_records(f, time, values):
+    # Records [channel count, time, value 1, ..., value n] of samples values (channels x time)
+    records = np.empty((len(time), values.shape[0] + 2), dtype="<f4")
+    records[:, 0] = values.shape[0]
+    records[:, 1] = time
+    records[:, 2:] = values.T
+    f.write(records.tobytes())
+
+
+def write_out_file(path, n_channels=12, n_samples=2000, time_step=0.05, channel_ids=None, seed=0):
+    """
+        Write a synthetic .out file readable by channel_reader.ChannelFile and the stand-in dyntools.
+        Input:
+            n_channels: number of channels, ignored when channel_ids is given
+            n_samples: number of records, time runs from 0 with time_step
+            channel_ids: identifiers, None = SPD channels of made-up machines
+        Output:
+            path
+    """
+    if channel_ids is None:
+        channel_ids = [channel_id(7, 1000 + 10 * k) for k in range(n_channels)]
+    time = np.arange(n_samples) * time_step
+    with open(path, "wb") as f:
+        write_header(f, channel_ids)
+        write_records(f, time, signals(time, len(channel_ids), seed))
+    return path
+
+
+def _ids(count):
+    return ["%-2d" % (k + 1) for k in range(count)]
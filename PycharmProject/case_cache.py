@@ -0,0 +1,134 @@
+# Standard Python-packages
+import os
+import json
+import time
+import shutil
+import hashlib
+
+
+_file_hashes = {}  # (path, size, mtime) -> content hash, so a sweep hashes the .sav/.dyr once per process
+
+
+class CaseCache(object):
+    """Content-addressed cache of solved, converted, dynamics-ready cases"""
+    # Constructor
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, grace=600.0):
+        """
+            Input:
+                root: folder holding one sub folder per cached state
+                max_bytes: disk budget, least recently used states are removed above it
+                grace: folders used or changed less than this long ago (s) are never removed, another worker may
+                       be restoring or still building them
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.grace = grace
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    # Public functions
+    def key(self, case, hvdc=(), time_step=0.005, p_zip=(10.0, 10.0), q_zip=(10.0, 10.0), add_hvdc_buses=True):
+        # Hash of everything that decides the state before the first time step
+        inputs = {"sav": hash_file(case.casefile),
+                  "dyr": hash_file(case.dyrfile),
+                  "hvdc": [[int(bus), float(limit)] for bus, limit in hvdc],
+                  "p_zip": [float(p) for p in p_zip],
+                  "q_zip": [float(q) for q in q_zip],
+                  "time_step": float(time_step),
+                  "add_hvdc_buses": bool(add_hvdc_buses)}
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+    def prepare(self, case, hvdc=(), time_step=0.005, p_zip=(10.0, 10.0), q_zip=(10.0, 10.0), add_hvdc_buses=True):
+        """
+            Bring a case (constructed with load_case=False) to the state after prepare_dynamic_simulation.
+            Output:
+                True if the state was restored from the cache, False if it was built (and stored)
+        """
+        key = self.key(case, hvdc, time_step, p_zip, q_zip, add_hvdc_buses)
+        entry = os.path.join(self.root, key)
+        casefile = os.path.join(entry, "case.sav")
+        snapfile = os.path.join(entry, "case.snp")
+
+        if os.path.exists(os.path.join(entry, "meta.json")):
+            try:
+                os.utime(os.path.join(entry, "meta.json"), None)  # Mark as recently used, before evict can see it
+                case.restore_state(casefile, snapfile, [bus for bus, _ in hvdc], [limit for _, limit in hvdc],
+                                   time_step)
+                return True
+            except Exception:  # Evicted by another worker in the meantime or damaged, build it again
+                # (psspy raises its own PsseException with throwPsseExceptions, restore_state ValueError)
+                shutil.rmtree(entry, ignore_errors=True)
+
+        case.load_case()
+        for hvdc_bus_nr, hvdc_limit in hvdc:
+            case.set_hvdc_active_power(hvdc_bus_nr, hvdc_limit)
+        if add_hvdc_buses:
+            case.add_hvdc_buses()
+        case.run_static_load_flow()
+        case.prepare_dynamic_simulation(time_step, list(p_zip), list(q_zip))
+
+        # Write to a private folder first, parallel workers may build the same state
+        building = entry + ".tmp%d" % os.getpid()
+        if not os.path.isdir(building):
+            os.makedirs(building)
+        case.save_state(os.path.join(building, "case.sav"), os.path.join(building, "case.snp"))
+        with open(os.path.join(building, "meta.json"), "w") as f:
+            json.dump({"casefile": case.casefile, "hvdc": [list(pair) for pair in hvdc], "created": time.time()}, f)
+        try:
+            os.rename(building, entry)
+        except OSError:
+            if os.path.exists(os.path.join(entry, "meta.json")):  # Another worker was first
+                shutil.rmtree(building, ignore_errors=True)
+            else:  # What is left of a partly removed entry, take its place
+                shutil.rmtree(entry, ignore_errors=True)
+                try:
+                    os.rename(building, entry)
+                except OSError:
+                    shutil.rmtree(building, ignore_errors=True)
+        self.evict()
+        return False
+    def evict(self):
+        # Remove left-over folders and the least recently used states until the cache fits in max_bytes
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            meta = os.path.join(folder, "meta.json")
+            try:
+                if os.path.exists(meta):
+                    entries.append((os.path.getmtime(meta), _folder_size(folder), name))
+                elif now - os.path.getmtime(folder) > self.grace:  # Partly removed entry or abandoned .tmp build
+                    shutil.rmtree(folder, ignore_errors=True)
+            except OSError:  # Removed by another worker while looking at it
+                continue
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for used, size, name in entries[:-1]:  # Never evict the newest state
+            if total <= self.max_bytes:
+                break
+            if now - used <= self.grace:  # Recently used, maybe being restored right now
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+    def clear(self):
+        for name in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+def hash_file(path, block_size=1 << 20):
+    # SHA-1 of the file content, computed once per process for an unchanged file
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if signature not in _file_hashes:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            block = f.read(block_size)
+            while block:
+                digest.update(block)
+                block = f.read(block_size)
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+# Private functions
+def _folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
@@ -0,0 +1,297 @@
+# Standard Python-packages
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+# Custom packages
+from case_cache import hash_file
+import kpi
+
+
+# One row per run, details in child tables with indexes for the usual questions
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    scenario TEXT,
+    input_network TEXT,
+    network_hash TEXT,
+    outputfile TEXT,
+    status TEXT,
+    created REAL,
+    elapsed REAL,
+    time_step REAL,
+    end_time REAL,
+    settings TEXT,
+    channels TEXT);
+CREATE INDEX IF NOT EXISTS runs_network ON runs (network_hash);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, created);
+
+CREATE TABLE IF NOT EXISTS hvdc (
+    run_id INTEGER NOT NULL,
+    bus INTEGER NOT NULL,
+    setpoint REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS hvdc_setpoint ON hvdc (bus, setpoint);
+CREATE INDEX IF NOT EXISTS hvdc_run ON hvdc (run_id);
+
+CREATE TABLE IF NOT EXISTS events (
+    run_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    type INTEGER NOT NULL,
+    bus INTEGER NOT NULL,
+    extras TEXT);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, bus, time);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id);
+
+CREATE TABLE IF NOT EXISTS kpis (
+    run_id INTEGER NOT NULL,
+    event_time REAL,
+    channel INTEGER,
+    quantity TEXT,
+    bus INTEGER,
+    nadir REAL,
+    nadir_time REAL,
+    peak_deviation REAL,
+    peak_time REAL,
+    rocof REAL,
+    settling_time REAL,
+    steady_state_deviation REAL,
+    frequency REAL,
+    damping REAL,
+    angle_separation REAL);
+CREATE INDEX IF NOT EXISTS kpis_run ON kpis (run_id);
+CREATE INDEX IF NOT EXISTS kpis_nadir ON kpis (quantity, nadir);
+CREATE INDEX IF NOT EXISTS kpis_damping ON kpis (quantity, damping);
+
+CREATE TABLE IF NOT EXISTS summary (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL);
+CREATE INDEX IF NOT EXISTS summary_value ON summary (name, value);
+CREATE INDEX IF NOT EXISTS summary_run ON summary (run_id);
+"""
+
+_KPI_FIELDS = ("event_time", "channel", "quantity", "bus", "nadir", "nadir_time", "peak_deviation", "peak_time",
+               "rocof", "settling_time", "steady_state_deviation", "frequency", "damping", "angle_separation")
+_CHILD_TABLES = ("hvdc", "events", "kpis", "summary")
+
+
+class Catalog(object):
+    """Embedded SQLite catalog of runs: inputs, settings, events, channels, output files and KPIs"""
+    # Constructor
+    def __init__(self, path, timeout=60.0):
+        """
+            Open (or create) a catalog file.
+            Input:
+                path: SQLite file, ex. root_dir/Output/catalog.sqlite
+                timeout: seconds a writer waits for another process holding the lock
+        """
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer and the other way round
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    # Public functions
+    def add_runs(self, records):
+        """
+            Insert (or replace, by name) many runs in one transaction.
+            Input:
+                records: list of dictionaries as made by run_record
+            Output:
+                list of run ids
+        """
+        ids = []
+        hvdc, events, kpis, summary = [], [], [], []
+        with self.connection:  # One transaction, committed at the end or rolled back on an error
+            cursor = self.connection.cursor()
+            for record in records:
+                self._delete(cursor, record["name"])
+                cursor.execute("INSERT INTO runs (name, scenario, input_network, network_hash, outputfile, status, "
+                               "created, elapsed, time_step, end_time, settings, channels) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (record["name"], record.get("scenario"), record.get("input_network"),
+                                record.get("network_hash"), record.get("outputfile"), record.get("status", "ok"),
+                                record.get("created", time.time()), record.get("elapsed"),
+                                record.get("time_step"), record.get("end_time"),
+                                json.dumps(record.get("settings", {})), json.dumps(record.get("channels", []))))
+                run_id = cursor.lastrowid
+                ids.append(run_id)
+                hvdc.extend((run_id, int(bus), float(setpoint)) for bus, setpoint in record.get("hvdc", ()))
+                events.extend((run_id, float(event[0]), int(event[1]), int(event[2]), json.dumps(list(event[3])))
+                              for event in record.get("events", ()))
+                kpis.extend((run_id,) + tuple(row) for row in record.get("kpis", ()))
+                summary.extend((run_id, name, _number(value)) for name, value in record.get("summary", {}).items())
+            cursor.executemany("INSERT INTO hvdc VALUES (?, ?, ?)", hvdc)
+            cursor.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", events)
+            cursor.executemany("INSERT INTO kpis VALUES (%s)" % ", ".join(["?"] * (len(_KPI_FIELDS) + 1)), kpis)
+            cursor.executemany("INSERT INTO summary VALUES (?, ?, ?)", summary)
+        return ids
+    def add_run(self, record):
+        return self.add_runs([record])[0]
+    def remove_run(self, name):
+        with self.connection:
+            self._delete(self.connection.cursor(), name)
+    def find(self, hvdc=(), events=(), summary=None, network_hash=None, status="ok"):
+        """
+            Names of the runs that match all conditions.
+            Input:
+                hvdc: (bus, setpoint) pairs, setpoint a value or a (low, high) range, None for any value
+                events: (type, bus) pairs, ex. (2, 5610) for a load step at 5610, bus None for any bus
+                summary: name -> (low, high) range on run_summary values, None for an open end
+                network_hash: only runs of this input network
+                status: "ok", "failed" or None for all
+            Output:
+                list of run names, sorted
+        """
+        where, parameters = [], []  # Every condition is an index range scan, done once and not per run
+        if status is not None:
+            where.append("runs.status = ?")
+            parameters.append(status)
+        if network_hash is not None:
+            where.append("runs.network_hash = ?")
+            parameters.append(network_hash)
+        for bus, setpoint in hvdc:
+            condition, values = _range("setpoint", setpoint)
+            where.append("runs.id IN (SELECT run_id FROM hvdc WHERE bus = ?%s)" % condition)
+            parameters.extend([bus] + values)
+        for event_type, bus in events:
+            condition, values = _range("bus", bus)
+            where.append("runs.id IN (SELECT run_id FROM events WHERE type = ?%s)" % condition)
+            parameters.extend([event_type] + values)
+        for name, limits in sorted((summary or {}).items()):
+            condition, values = _range("value", tuple(limits))
+            where.append("runs.id IN (SELECT run_id FROM summary WHERE name = ?%s)" % condition)
+            parameters.extend([name] + values)
+        sql = "SELECT name FROM runs" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY name"
+        return [row[0] for row in self.connection.execute(sql, parameters)]
+    def run(self, name):
+        # Everything stored about one run, as a dictionary like the record it was made from
+        row = self.connection.execute("SELECT id, name, scenario, input_network, network_hash, outputfile, status, "
+                                      "created, elapsed, time_step, end_time, settings, channels "
+                                      "FROM runs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError("No run named " + name)
+        keys = ("id", "name", "scenario", "input_network", "network_hash", "outputfile", "status", "created",
+                "elapsed", "time_step", "end_time", "settings", "channels")
+        record = dict(zip(keys, row))
+        record["settings"] = json.loads(record["settings"])
+        record["channels"] = json.loads(record["channels"])
+        run_id = record["id"]
+        record["hvdc"] = self.connection.execute("SELECT bus, setpoint FROM hvdc WHERE run_id = ?",
+                                                 (run_id,)).fetchall()
+        record["events"] = [(t, event_type, bus, json.loads(extras)) for t, event_type, bus, extras in
+                            self.connection.execute("SELECT time, type, bus, extras FROM events WHERE run_id = ? "
+                                                    "ORDER BY time", (run_id,))]
+        record["kpis"] = self.connection.execute("SELECT %s FROM kpis WHERE run_id = ?" % ", ".join(_KPI_FIELDS),
+                                                 (run_id,)).fetchall()
+        record["summary"] = dict(self.connection.execute("SELECT name, value FROM summary WHERE run_id = ?",
+                                                         (run_id,)))
+        return record
+    def ranking(self, name, names=None, ascending=True, limit=None):
+        # [(run name, value)] of a run_summary value over all (or the given) runs, best first
+        sql = ("SELECT runs.name, summary.value FROM summary JOIN runs ON runs.id = summary.run_id "
+               "WHERE summary.name = ? AND summary.value IS NOT NULL ORDER BY summary.value " +
+               ("ASC" if ascending else "DESC"))
+        if names is None and limit is not None:
+            return self.connection.execute(sql + " LIMIT ?", (name, limit)).fetchall()
+        rows = self.connection.execute(sql, (name,)).fetchall()
+        if names is not None:
+            names = set(names)
+            rows = [row for row in rows if row[0] in names]
+        return rows[:limit] if limit is not None else rows
+    def query(self, sql, parameters=()):
+        # Any other question, ex. query("SELECT quantity, MIN(damping) FROM kpis GROUP BY quantity")
+        return self.connection.execute(sql, parameters).fetchall()
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+    def close(self):
+        self.connection.close()
+
+    # Private functions
+    def _delete(self, cursor, name):
+        row = cursor.execute("SELECT id FROM runs WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            for table in _CHILD_TABLES:
+                cursor.execute("DELETE FROM %s WHERE run_id = ?" % table, (row[0],))
+            cursor.execute("DELETE FROM runs WHERE id = ?", (row[0],))
+
+
+def network_hash(case):
+    # Identity of the input network: content of the .sav and .dyr files
+    return hashlib.sha1((hash_file(case.casefile) + hash_file(case.dyrfile)).encode("utf-8")).hexdigest()
+
+
+def run_record(case, spec=None, elapsed=None, status="ok", kpis=True):
+    """
+        Catalog record of a PsspyCase after run_dynamic_simulation. Made in the worker, inserted by the caller.
+        Input:
+            spec: ScenarioSpec of the run, gives the solver settings
+            kpis: True to compute the KPI table (case.compute_kpis) if the case has none yet
+    """
+    record = {"name": case.input_network + "_" + case.output_name,  # Same name when the scenario is run again
+              "scenario": case.output_name,
+              "input_network": case.input_network,
+              "network_hash": network_hash(case),
+              "outputfile": case.outputfile + ".out",
+              "status": status,
+              "created": time.time(),
+              "elapsed": elapsed,
+              "hvdc": list(zip(case.hvdc_bus_nrs, case.hvdc_limits)),
+              "events": list(case.events_overview),
+              "channels": case.channels.channels,
+              "settings": {}}
+    if spec is not None:
+        record["time_step"] = spec.time_step
+        record["end_time"] = spec.end_time
+        record["settings"] = {"p_zip": spec.p_zip, "q_zip": spec.q_zip, "sampling": spec.sampling,
+                              "add_hvdc_buses": spec.add_hvdc_buses, "stop": spec.stop}
+    table = getattr(case, "kpi_table", None)
+    if table is None and kpis and os.path.exists(case.outputfile + ".out"):
+        table = case.compute_kpis()
+    if table is not None:
+        record["kpis"] = [tuple(_number(row[field]) for field in _KPI_FIELDS) for row in table]
+        record["summary"] = kpi.run_summary(table)
+    if case.stop_reason is not None:  # Run ended early by its StopMonitor
+        record["settings"]["stop_reason"] = case.stop_reason
+        record.setdefault("summary", {})["stop_time"] = case.stop_time
+    return record
+
+
+def failed_record(spec, elapsed=None, error=None):
+    # Catalog record of a scenario that did not finish, so failures can be found as well
+    return {"name": spec.input_network + "_" + spec.name, "scenario": spec.name,
+            "input_network": spec.input_network, "status": "failed", "elapsed": elapsed,
+            "time_step": spec.time_step, "end_time": spec.end_time,
+            "hvdc": spec.hvdc, "events": [], "settings": {"error": error}}
+
+
+# Private functions
+def _range(column, limits):
+    # SQL condition for a value, a (low, high) range with None for an open end, or None for anything
+    if limits is None:
+        return "", []
+    if not isinstance(limits, (tuple, list)):
+        return " AND %s = ?" % column, [limits]
+    condition, values = "", []
+    if limits[0] is not None:
+        condition += " AND %s >= ?" % column
+        values.append(limits[0])
+    if limits[1] is not None:
+        condition += " AND %s <= ?" % column
+        values.append(limits[1])
+    return condition, values
+
+
+def _number(value):
+    # Plain Python values for SQLite, NaN becomes NULL
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
@@ -0,0 +1,195 @@
+# Standard Python-packages
+import os
+import re
+import json
+import numpy as np
+
+
+# Layout of the binary channel file (.out) written by psspy.strt/psspy.run
+# All words are little-endian float32 (PSS/E only runs on Windows/x86)
+_MAGIC_LENGTH = 12  # File identifier at the start of the file
+_ID_OFFSET = _MAGIC_LENGTH + 2 * 4  # Identifier, channel count and format word
+_ID_WIDTH = 32  # Every channel identifier is a fixed width text field
+_TITLE_WIDTH = 60  # The two case title lines follow the channel identifiers
+_END_MARKER = -9999.0  # Time of the record PSS/E writes when the file is closed
+
+# Machine quantities in the order of the quantity codes used by machine_array_channel (1 = ANGLE)
+MACHINE_QUANTITIES = ("ANGLE", "PELEC", "QELEC", "ETERM", "EFD", "PMECH",
+                      "SPEED", "XADIFD", "ECOMP", "VOTHSG", "VREF", "VUELL",
+                      "VOEL", "GREF", "LCREF", "WVLCTY", "WTRBSP", "WPITCH",
+                      "WAEROT", "WROTRV", "WROTRI", "WPCMND", "WQCMND")
+
+# Abbreviations PSS/E writes in the channel identifiers of machine channels
+ID_QUANTITIES = {"ANGL": "ANGLE", "POWR": "PELEC", "VARS": "QELEC", "ETRM": "ETERM",
+                 "EFD": "EFD", "PMEC": "PMECH", "SPD": "SPEED"}
+
+_REGISTRY_SUFFIX = ".channels.json"  # Channel metadata written next to the .out file by ChannelRegistry
+
+# Channel identifiers look like "SPD   5600[            300.00]1 "
+_ID_PATTERN = re.compile(r"^\s*(\S+)\s+(\d+)\s*\[(.*)\](.*)$")
+
+
+def parse_channel_id(channel_id):
+    """
+        Split a channel identifier into its parts.
+        Input:
+            channel_id: identifier as stored in the .out file, ex. "SPD   5600[            300.00]1 "
+        Output:
+            (quantity, bus number, bus name, base kV, machine ID), None for parts that are not present
+    """
+    match = _ID_PATTERN.match(channel_id)
+    if match is None:  # Not a bus/machine channel, ex. a user defined VAR
+        return channel_id.strip(), None, None, None, None
+
+    quantity, bus, bracket, machine_id = match.groups()
+    bus_name = bracket[:-6].strip() or None  # Name is padded, base kV uses the last 6 characters
+    try:
+        base_kv = float(bracket[-6:])
+    except ValueError:
+        base_kv = None
+    return quantity, int(bus), bus_name, base_kv, machine_id.strip() or None
+
+
+def registry_path(out_file):
+    # Channel metadata file of a run, out_file with or without the .out extension
+    if out_file.endswith(".out"):
+        out_file = out_file[:-4]
+    return out_file + _REGISTRY_SUFFIX
+
+
+def read_registry(out_file):
+    # Channel metadata dictionaries saved by ChannelRegistry.save, None for runs without them
+    path = registry_path(out_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["channels"]
+
+
+def channel_label(channel):
+    # Legend text of a channel from its ChannelRegistry metadata
+    if channel["kind"] == "branch":
+        label = "Branch %d-%d" % (channel["bus"], channel["to_bus"])
+        return label if channel["branch_id"] == "1" else label + " (%s)" % channel["branch_id"]
+    if channel["kind"] == "machine" and channel["machine_id"] != "1":
+        return "Bus %d (%s)" % (channel["bus"], channel["machine_id"])
+    return "Bus %d" % channel["bus"]
+
+
+def channels_from_ids(channel_file):
+    # Channel metadata (as ChannelRegistry) rebuilt from the channel identifiers of a .out file
+    channels = []
+    for k, channel_id in enumerate(channel_file.channel_ids):
+        quantity, bus, _, _, machine_id = parse_channel_id(channel_id)
+        quantity = ID_QUANTITIES.get(quantity, quantity)
+        if bus is None:
+            continue
+        if quantity in MACHINE_QUANTITIES:
+            kind = "machine"
+        elif quantity in ("FREQ", "VOLT"):
+            kind = "bus"
+        else:
+            continue
+        channels.append({"index": k + 1, "kind": kind, "quantity": quantity, "bus": bus,
+                         "machine_id": machine_id or "1", "to_bus": None, "branch_id": None})
+    return channels
+
+
+def channels_from_monitor(machine_monitor):
+    # Channel metadata of a machine_monitor table (channel index, quantity code, bus)
+    return [{"index": int(row[0]), "kind": "machine", "quantity": MACHINE_QUANTITIES[int(row[1]) - 1],
+             "bus": int(row[2]), "machine_id": "1", "to_bus": None, "branch_id": None}
+            for row in np.asarray(machine_monitor)]
+
+
+class ChannelFile(object):
+    """Memory-mapped reader for PSS/E channel output files (.out)"""
+    # Constructor
+    def __init__(self, path):
+        """
+            Decode the header once and map the samples without reading them.
+            Input:
+                path: name of the .out file, the extension may be left out
+        """
+        if not os.path.exists(path) and os.path.exists(path + ".out"):
+            path = path + ".out"
+        self.path = path
+
+        with open(path, "rb") as f:
+            f.seek(_MAGIC_LENGTH)
+            head = np.frombuffer(f.read(8), dtype="<f4")
+            self.n_channels = int(head[0])
+            self.format_word = float(head[1])  # 2.0 for files written by PSS/E 33
+            raw_ids = f.read(self.n_channels * _ID_WIDTH).decode("latin-1")
+            raw_title = f.read(2 * _TITLE_WIDTH).decode("latin-1")
+
+        self.channel_ids = [raw_ids[i * _ID_WIDTH:(i + 1) * _ID_WIDTH].strip() for i in range(self.n_channels)]
+        self.title = [raw_title[:_TITLE_WIDTH].strip(), raw_title[_TITLE_WIDTH:].strip()]
+        header_length = _ID_OFFSET + self.n_channels * _ID_WIDTH + 2 * _TITLE_WIDTH
+        self._lookup = dict((" ".join(c.split()), i) for i, c in enumerate(self.channel_ids))
+
+        # Each record is [channel count, time, value 1, ..., value n]
+        record_words = self.n_channels + 2
+        n_records = (os.path.getsize(path) - header_length) // (4 * record_words)
+        if n_records > 0:
+            records = np.memmap(path, dtype="<f4", mode="r", offset=header_length, shape=(n_records, record_words))
+        else:  # Run stopped before the first sample was written, numpy can not map zero bytes
+            records = np.zeros((0, record_words), dtype="<f4")
+        n_samples = n_records
+        while n_samples > 0 and records[n_samples - 1, 0] != self.n_channels:  # Drop the end marker
+            n_samples -= 1
+        if n_samples < n_records and records[n_samples, 1] != _END_MARKER and records[n_samples, 0] != 0.0:
+            raise IOError("Corrupt record %d in %s" % (n_samples, path))
+
+        self._records = records[:n_samples]
+        self.time = self._records[:, 1]  # Views into the mapped file, nothing is copied
+        self.data = self._records[:, 2:]
+        self.n_samples = n_samples
+
+    # Public functions
+    def index(self, key):
+        # Column of a channel in self.data
+        # Integers are PSS/E channel numbers (1-based as in ch_data), strings are channel identifiers
+        if isinstance(key, (str, type(u""))):
+            try:
+                return self._lookup[" ".join(key.split())]
+            except KeyError:
+                raise KeyError("No channel named %r in %s" % (key, self.path))
+        if not 1 <= key <= self.n_channels:
+            raise IndexError("Channel %d outside 1..%d" % (key, self.n_channels))
+        return int(key) - 1
+    def channel(self, key):
+        return self.data[:, self.index(key)]
+    def find(self, quantity=None, bus=None, machine_id=None):
+        # Channel numbers (1-based) of all channels matching the given identifier parts
+        matches = []
+        for i, channel_id in enumerate(self.channel_ids):
+            ch_quantity, ch_bus, _, _, ch_machine = parse_channel_id(channel_id)
+            if quantity is not None and ch_quantity != quantity:
+                continue
+            if bus is not None and ch_bus != bus:
+                continue
+            if machine_id is not None and ch_machine != str(machine_id):
+                continue
+            matches.append(i + 1)
+        return matches
+    def window(self, t_start=None, t_end=None, channels=None):
+        # Time axis and samples in [t_start, t_end], the time axis does not need to be uniform
+        first = 0 if t_start is None else int(np.searchsorted(self.time, t_start, side="left"))
+        last = self.n_samples if t_end is None else int(np.searchsorted(self.time, t_end, side="right"))
+        if channels is None:
+            return self.time[first:last], self.data[first:last]
+        columns = [self.index(c) for c in channels]
+        return self.time[first:last], self.data[first:last, columns]  # Fancy indexing copies only the window
+    def get_data(self):
+        # Same layout as dyntools.CHNF(...).get_data(), but the channels are views into the file
+        sh_ttl = "\n".join(self.title)
+        ch_id = {"time": "Time(s)"}
+        ch_data = {"time": self.time}
+        for i in range(self.n_channels):
+            ch_id[i + 1] = self.channel_ids[i]
+            ch_data[i + 1] = self.data[:, i]
+        return sh_ttl, ch_id, ch_data
+    def close(self):
+        # Drop the references to the mapping, it is unmapped once views handed out earlier are gone too
+        self._records = self.time = self.data = None
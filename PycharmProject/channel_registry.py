@@ -0,0 +1,191 @@
+# Standard Python-packages
+import json
+import numpy as np
+
+# PSSPY-related packages
+import psspy
+
+# Custom packages
+from channel_reader import MACHINE_QUANTITIES, registry_path, channel_label
+import dispatch
+
+
+BUS_QUANTITIES = ("FREQ", "VOLT")  # Bus frequency deviation (p.u.) and bus voltage magnitude (p.u.)
+BRANCH_QUANTITIES = ("PBRANCH", "QBRANCH")  # Active (MW) and reactive (Mvar) flow from the first bus
+
+
+class ChannelRegistry(object):
+    """Channels of a dynamic simulation with their metadata, indices are handed out in increasing order"""
+    # Constructor
+    def __init__(self, network=None, first_index=1):
+        """
+            Input:
+                network: NetworkSnapshot for the selectors, None if only known buses are registered
+                first_index: index of the first channel, channels set up elsewhere must lie below it
+        """
+        self.network = network
+        self.next_index = first_index
+        self.channels = []  # Metadata dictionary of every channel, in index order
+        self._by_index = {}
+
+    # Selectors, every one is a single query on the network arrays
+    def select_buses(self, area=None, min_kv=None, max_kv=None, buses=None):
+        # Bus numbers in area (one or a list), with min_kv <= base kV <= max_kv, among buses if given
+        numbers = self.network.get("bus", "NUMBER")
+        mask = self._bus_mask(numbers, self.network.get("bus", "AREA"), self.network.get("bus", "BASE"),
+                              area, min_kv, max_kv, buses)
+        return numbers[mask]
+    def select_machines(self, area=None, min_kv=None, max_kv=None, buses=None):
+        # (bus numbers, machine IDs) of the in-service machines selected by their bus
+        numbers = self.network.get("machine", "NUMBER")
+        rows = dispatch.lookup_rows(self.network.get("bus", "NUMBER"), numbers)
+        mask = self._bus_mask(numbers, self.network.get("bus", "AREA")[rows], self.network.get("bus", "BASE")[rows],
+                              area, min_kv, max_kv, buses)
+        return numbers[mask], np.array([i.strip() for i in self.network.get("machine", "ID")[mask]], dtype=object)
+    def select_branches(self, area=None, min_kv=None, max_kv=None, buses=None):
+        # (from buses, to buses, IDs) of the in-service lines with at least one end selected
+        bus_numbers = self.network.get("bus", "NUMBER")
+        from_buses = self.network.get("branch", "FROMNUMBER")
+        to_buses = self.network.get("branch", "TONUMBER")
+        mask = np.zeros(len(from_buses), dtype=bool)
+        for ends in (from_buses, to_buses):
+            rows = dispatch.lookup_rows(bus_numbers, ends)
+            mask |= self._bus_mask(ends, self.network.get("bus", "AREA")[rows], self.network.get("bus", "BASE")[rows],
+                                   area, min_kv, max_kv, buses)
+        ids = np.array([i.strip() for i in self.network.get("branch", "ID")[mask]], dtype=object)
+        return from_buses[mask], to_buses[mask], ids
+
+    # Registration, each function adds many channels and returns their indices
+    def add_machines(self, quantities, buses, ids=None):
+        """
+            Machine channels, every quantity of every machine, ordered by machine then quantity.
+            Input:
+                quantities: quantity codes of machine_array_channel (1 = ANGLE) or names, ex. "SPEED"
+                buses: bus number of every machine
+                ids: machine ID of every machine, None = "1" for all
+        """
+        codes = [self._machine_code(quantity) for quantity in quantities]
+        if ids is None:
+            ids = ["1"] * len(buses)
+        indices = []
+        for bus, machine_id in zip(buses, ids):
+            for code in codes:
+                index = self._allocate()
+                psspy.machine_array_channel([index, code, int(bus)], str(machine_id), "")
+                indices.append(self._register(index, "machine", MACHINE_QUANTITIES[code - 1], bus=bus,
+                                              machine_id=machine_id))
+        return indices
+    def add_buses(self, quantities, buses):
+        # Bus channels, quantities from BUS_QUANTITIES
+        indices = []
+        for bus in buses:
+            for quantity in quantities:
+                index = self._allocate()
+                if quantity == "FREQ":
+                    psspy.bus_frequency_channel([index, int(bus)], "")
+                elif quantity == "VOLT":
+                    psspy.voltage_channel([index, -1, -1, int(bus)], "")
+                else:
+                    raise ValueError("Unknown bus quantity %r, expected one of %r" % (quantity, BUS_QUANTITIES))
+                indices.append(self._register(index, "bus", quantity, bus=bus))
+        return indices
+    def add_branches(self, from_buses, to_buses, ids=None, reactive=False):
+        # Active power flow channels of branches, reactive=True adds the reactive flow as the next channel
+        if ids is None:
+            ids = ["1"] * len(from_buses)
+        indices = []
+        for from_bus, to_bus, branch_id in zip(from_buses, to_buses, ids):
+            status = [self._allocate(), -1, -1, int(from_bus), int(to_bus)]
+            if reactive:
+                self._allocate()  # branch_p_and_q_channel writes P and Q to two channels after each other
+                psspy.branch_p_and_q_channel(status, str(branch_id), ["", ""])
+                quantities = BRANCH_QUANTITIES
+            else:
+                psspy.branch_p_channel(status, str(branch_id), "")
+                quantities = BRANCH_QUANTITIES[:1]
+            for k, quantity in enumerate(quantities):
+                indices.append(self._register(status[0] + k, "branch", quantity, bus=from_bus, to_bus=to_bus,
+                                              branch_id=branch_id))
+        return indices
+    def add_area_machines(self, quantities, area=None, min_kv=None, max_kv=None):
+        # Ex. add_area_machines(["SPEED"], area=13): every in-service machine in area 13
+        buses, ids = self.select_machines(area, min_kv, max_kv)
+        return self.add_machines(quantities, buses, ids)
+    def add_area_buses(self, quantities, area=None, min_kv=None, max_kv=None):
+        # Ex. add_area_buses(["VOLT"], min_kv=400): every bus of 400 kV and up
+        return self.add_buses(quantities, self.select_buses(area, min_kv, max_kv))
+
+    # Metadata
+    def channel(self, index):
+        return self._by_index[int(index)]
+    def find(self, kind=None, quantity=None, bus=None):
+        # Indices of the channels that match all given arguments
+        return [c["index"] for c in self.channels
+                if (kind is None or c["kind"] == kind) and (quantity is None or c["quantity"] == quantity)
+                and (bus is None or c["bus"] == bus)]
+    def quantities(self):
+        # Quantities in the order they were first registered
+        found = []
+        for c in self.channels:
+            if c["quantity"] not in found:
+                found.append(c["quantity"])
+        return found
+    def label(self, index):
+        return channel_label(self.channel(index))
+    def legend(self, indices):
+        return [self.label(index) for index in indices]
+    def machine_monitor(self):
+        # Machine channels as (channel index, quantity code, bus) rows, the table of set_monitor_channels
+        rows = [(c["index"], MACHINE_QUANTITIES.index(c["quantity"]) + 1, c["bus"])
+                for c in self.channels if c["kind"] == "machine"]
+        return np.array(rows, dtype=float).reshape(-1, 3)
+    def __len__(self):
+        return len(self.channels)
+
+    # Persistence, next to the .out file so plots and stores can read it without PSS/E (channel_reader.read_registry)
+    def save(self, out_file):
+        with open(registry_path(out_file), "w") as f:
+            json.dump({"next_index": self.next_index, "channels": self.channels}, f)
+    @classmethod
+    def load(cls, out_file):
+        with open(registry_path(out_file)) as f:
+            values = json.load(f)
+        registry = cls(first_index=values["next_index"])
+        for c in values["channels"]:
+            registry.channels.append(c)
+            registry._by_index[c["index"]] = c
+        return registry
+
+    # Private functions
+    def _allocate(self):
+        index = self.next_index
+        self.next_index += 1
+        return index
+    def _register(self, index, kind, quantity, bus=None, machine_id=None, to_bus=None, branch_id=None):
+        c = {"index": index, "kind": kind, "quantity": quantity,
+             "bus": None if bus is None else int(bus),
+             "machine_id": None if machine_id is None else str(machine_id).strip(),
+             "to_bus": None if to_bus is None else int(to_bus),
+             "branch_id": None if branch_id is None else str(branch_id).strip()}
+        self.channels.append(c)
+        self._by_index[index] = c
+        return index
+    def _machine_code(self, quantity):
+        if isinstance(quantity, (str, type(u""))):
+            if quantity not in MACHINE_QUANTITIES:
+                raise ValueError("Unknown machine quantity " + quantity)
+            return MACHINE_QUANTITIES.index(quantity) + 1
+        if not 1 <= int(quantity) <= len(MACHINE_QUANTITIES):
+            raise ValueError("Machine quantity code must be 1-%d, got %r" % (len(MACHINE_QUANTITIES), quantity))
+        return int(quantity)
+    def _bus_mask(self, numbers, areas, base_kv, area, min_kv, max_kv, buses):
+        mask = np.ones(len(numbers), dtype=bool)
+        if area is not None:
+            mask &= np.isin(areas, area)
+        if min_kv is not None:
+            mask &= base_kv >= min_kv
+        if max_kv is not None:
+            mask &= base_kv <= max_kv
+        if buses is not None:
+            mask &= np.isin(numbers, buses)
+        return mask
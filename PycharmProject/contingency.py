@@ -0,0 +1,328 @@
+# Standard Python-packages
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.sparse.csgraph as csgraph
+
+# Custom packages
+import dispatch
+import events
+from loadflow import hvdc_candidates
+
+
+_ISLANDING_TOLERANCE = 1e-8  # 1 - PTDF of the branch itself below this: the outage splits the network
+_LOADING_TOLERANCE = 1e-6  # Loadings up to 1 + this are not an overload (unchanged flows without ratings)
+_CHUNK = 256  # Branch outages solved per call of the factorized DC matrix
+
+
+class Contingency(object):
+    """One N-1 outage: a branch (bus, other_end, branch_id) or, without other_end, a bus"""
+    def __init__(self, bus, other_end=None, branch_id="1"):
+        self.bus = int(bus)
+        self.other_end = int(other_end) if other_end is not None else None
+        self.branch_id = str(branch_id).strip()
+        self.type = events.BUS_TRIP if other_end is None else events.BRANCH_TRIP
+        if self.type == events.BUS_TRIP:
+            self.name = "bus_%d" % self.bus
+        else:
+            self.name = "branch_%d_%d_%s" % (self.bus, self.other_end, self.branch_id)
+    def fault(self, time):
+        # (time, type, bus, extras) for PsspyCase.add_fault and ScenarioSpec.faults
+        if self.type == events.BUS_TRIP:
+            return (time, self.type, self.bus, [])
+        return (time, self.type, self.bus, [self.other_end, self.branch_id])
+    def __repr__(self):
+        return "Contingency(%s)" % self.name
+
+
+class DcScreening(object):
+    """DC load flow of the intact network, factorized once, with post-outage flows from distribution factors"""
+    # Constructor
+    def __init__(self, network, min_flow=10.0):
+        """
+            Input:
+                network: NetworkData of the case, ex. NetworkData.from_psspy() after the load flow
+                min_flow: only for networks without branch ratings (RATEA = 0 everywhere): every branch is then
+                          measured against its pre-outage flow, but at least this many MW
+            Branches without a rating in a network that has ratings are not monitored.
+        """
+        self.network = network
+        self.n_buses = len(network.bus_numbers)
+        self._from = dispatch.lookup_rows(network.bus_numbers, network.branch_from)
+        self._to = dispatch.lookup_rows(network.bus_numbers, network.branch_to)
+        x = network.branch_x.astype(float) * network.branch_ratio.astype(float)
+        self._b = 1.0 / np.where(np.abs(x) > 1e-6, x, 1e-6)  # Series susceptance (p.u.)
+        self._shift = np.deg2rad(network.branch_shift.astype(float))
+        self._branch_index = None
+
+        ref = np.nonzero(np.asarray(network.bus_types) == 3)[0]
+        if len(ref) == 0:
+            raise ValueError("The network has no swing bus (type 3)")
+        self.ref = ref[0]
+        self._keep = np.setdiff1d(np.arange(self.n_buses), [self.ref])
+
+        m = len(self._from)
+        self._incidence = sp.csr_matrix((np.concatenate((np.ones(m), -np.ones(m))),
+                                         (np.concatenate((np.arange(m), np.arange(m))),
+                                          np.concatenate((self._from, self._to)))), shape=(m, self.n_buses))
+        self._bbus = self._incidence.T.dot(sp.diags(self._b)).dot(self._incidence).tocsc()
+        self._solver = spla.splu(self._bbus[self._keep][:, self._keep].tocsc(), permc_spec="MMD_AT_PLUS_A",
+                                 diag_pivot_thresh=0.0, options={"SymmetricMode": True})
+
+        self.injections = self._injections(network)  # p.u. per bus
+        self._theta = np.zeros(self.n_buses)  # Bus angles (rad) of the intact network, swing angle 0
+        p = self.injections + self._incidence.T.dot(self._b * self._shift)  # Phase shifts as injections
+        self._theta[self._keep] = self._solver.solve(p[self._keep])
+        self.flows = network.sbase * self._branch_flows(self._theta)
+        rating = network.branch_rating.astype(float)
+        if np.any(rating > 0.0):
+            self.reference = np.where(rating > 0.0, rating, np.inf)  # MW, loading = |flow| / reference
+        else:
+            self.reference = np.maximum(np.abs(self.flows), min_flow)
+
+    # Public functions
+    def contingencies(self, branches=True, buses=False, exclude_buses=()):
+        # Every in-service branch of the network (and every bus but the swing bus) as a Contingency
+        network = self.network
+        exclude = set(int(bus) for bus in exclude_buses)
+        result = []
+        if branches:
+            for bus, other_end, branch_id in zip(network.branch_from, network.branch_to, network.branch_ids):
+                if int(bus) not in exclude and int(other_end) not in exclude:
+                    result.append(Contingency(bus, other_end, branch_id))
+        if buses:
+            for row, bus in enumerate(network.bus_numbers):
+                if row != self.ref and int(bus) not in exclude:
+                    result.append(Contingency(bus))
+        return result
+    def screen(self, contingencies):
+        """
+            Post-outage DC flows of every contingency, worst first.
+            Input:
+                contingencies: list of Contingency, ex. contingencies(buses=True)
+            Output:
+                list of dictionaries, see _static_row, sorted by severity (largest loading of a remaining
+                branch against its rating, inf when the outage splits the network) and disconnected MW
+        """
+        rows = []
+        branch_outages = [c for c in contingencies if c.type == events.BRANCH_TRIP]
+        for start in range(0, len(branch_outages), _CHUNK):
+            rows.extend(self._screen_branches(branch_outages[start:start + _CHUNK]))
+        bus_outages = [c for c in contingencies if c.type == events.BUS_TRIP]
+        for start in range(0, len(bus_outages), _CHUNK // 4):  # About four columns per bus
+            rows.extend(self._screen_buses(bus_outages[start:start + _CHUNK // 4]))
+        rows.sort(key=lambda row: (-row["severity"], -row["disconnected_mw"], row["name"]))
+        for rank, row in enumerate(rows):
+            row["static_rank"] = rank + 1
+        return rows
+
+    # Private functions
+    def _injections(self, network):
+        machine_rows = dispatch.lookup_rows(network.bus_numbers, network.machine_buses)
+        load_rows = dispatch.lookup_rows(network.bus_numbers, network.load_buses)
+        p = np.zeros(self.n_buses)
+        np.add.at(p, machine_rows, network.machine_pgen.astype(float))
+        np.add.at(p, load_rows, -np.asarray(network.load_power).real)
+        self._disconnected = np.zeros(self.n_buses)  # Generation and load (MW) lost with each bus
+        np.add.at(self._disconnected, machine_rows, np.abs(network.machine_pgen.astype(float)))
+        np.add.at(self._disconnected, load_rows, np.abs(np.asarray(network.load_power).real))
+        return p / network.sbase
+    def _branch_flows(self, theta):
+        return self._b * (self._incidence.dot(theta) - self._shift)
+    def _screen_branches(self, contingencies):
+        outaged = self._branch_rows(contingencies)
+        columns = np.arange(len(outaged))
+        transfers = np.zeros((self.n_buses, len(outaged)))  # +1 at the from bus, -1 at the to bus
+        transfers[self._from[outaged], columns] = 1.0
+        transfers[self._to[outaged], columns] = -1.0
+        theta = np.zeros_like(transfers)
+        theta[self._keep] = self._solver.solve(np.ascontiguousarray(transfers[self._keep]))
+        ptdf = self._b[:, None] * self._incidence.dot(theta)  # Flow change per branch and unit transfer
+
+        rows = []
+        for k, (contingency, branch) in enumerate(zip(contingencies, outaged)):
+            denominator = 1.0 - ptdf[branch, k]
+            if abs(denominator) < _ISLANDING_TOLERANCE:
+                in_service = np.setdiff1d(np.arange(len(self._from)), [branch])
+                rows.append(self._islanded_row(contingency, self._lost_buses(in_service, ())))
+                continue
+            flows = self.flows + ptdf[:, k] * (self.flows[branch] / denominator)
+            flows[branch] = 0.0
+            rows.append(_static_row(contingency, flows, self.reference, self.network, 0.0))
+        return rows
+    def _screen_buses(self, contingencies):
+        # Bus outage = its branches out and the bus grounded with no injection, a low-rank change of the
+        # factorized matrix (Woodbury), so every bus is solved with the base factorization
+        rows = []
+        outages = []
+        for contingency in contingencies:
+            row = dispatch.lookup_rows(self.network.bus_numbers, [contingency.bus])[0]
+            removed = np.nonzero((self._from == row) | (self._to == row))[0]
+            lost = self._lost_buses(np.setdiff1d(np.arange(len(self._from)), removed), (row,))
+            if len(lost) > 1:
+                rows.append(self._islanded_row(contingency, lost))
+            else:
+                outages.append((contingency, row, removed))
+        if not outages:
+            return rows
+
+        # Columns of U: incidence of each removed branch, then the bus itself
+        columns = np.concatenate([np.append(removed, -1 - row) for _, row, removed in outages])
+        u = np.zeros((self.n_buses, len(columns)))
+        branch_columns = np.nonzero(columns >= 0)[0]
+        u[self._from[columns[branch_columns]], branch_columns] = 1.0
+        u[self._to[columns[branch_columns]], branch_columns] = -1.0
+        bus_columns = np.nonzero(columns < 0)[0]
+        u[-1 - columns[bus_columns], bus_columns] = 1.0
+        u[self.ref] = 0.0
+        z = np.zeros_like(u)
+        z[self._keep] = self._solver.solve(np.ascontiguousarray(u[self._keep]))
+
+        start = 0
+        for contingency, row, removed in outages:
+            part = slice(start, start + len(removed) + 1)
+            start += len(removed) + 1
+            z_k, u_k = z[:, part], u[:, part]
+            # Angles without the injections of the bus and of the phase shifts of its branches
+            lost = np.append(self._b[removed] * self._shift[removed], self.injections[row])
+            theta = self._theta - z_k.dot(lost)
+            c_inverse = np.diag(np.append(-1.0 / self._b[removed], 1.0))
+            theta -= z_k.dot(np.linalg.solve(c_inverse + u_k.T.dot(z_k), u_k.T.dot(theta)))
+            flows = self.network.sbase * self._branch_flows(theta)
+            flows[removed] = 0.0
+            rows.append(_static_row(contingency, flows, self.reference, self.network, self._disconnected[row]))
+        return rows
+    def _branch_rows(self, contingencies):
+        index = self._branch_index
+        if index is None:  # (lower bus, higher bus, ID) -> branch row
+            network = self.network
+            index = self._branch_index = {}
+            for row, (bus, other_end, branch_id) in enumerate(zip(network.branch_from, network.branch_to,
+                                                                  network.branch_ids)):
+                index.setdefault((min(bus, other_end), max(bus, other_end), str(branch_id).strip()), row)
+        try:
+            return np.array([index[(min(c.bus, c.other_end), max(c.bus, c.other_end), c.branch_id)]
+                             for c in contingencies], dtype=int)
+        except KeyError as error:
+            raise ValueError("No in-service branch %s %s %r" % error.args[0])
+    def _lost_buses(self, in_service, removed_buses):
+        # Rows of the buses cut off from the swing bus when only the in_service branches (rows) are left
+        adjacency = sp.csr_matrix((np.ones(len(in_service)), (self._from[in_service], self._to[in_service])),
+                                  shape=(self.n_buses, self.n_buses))
+        _, labels = csgraph.connected_components(adjacency, directed=False)
+        lost = labels != labels[self.ref]
+        lost[list(removed_buses)] = True
+        return np.nonzero(lost)[0]
+    def _islanded_row(self, contingency, lost):
+        row = _static_row(contingency, None, self.reference, self.network, self._disconnected[lost].sum())
+        row["islanded"] = True
+        row["island_buses"] = len(lost) - (1 if contingency.type == events.BUS_TRIP else 0)
+        row["severity"] = np.inf
+        return row
+
+
+def with_hvdc(network, hvdc):
+    # Network after set_hvdc_active_power for each (bus number, limit) of hvdc, the added HVDC buses are left out
+    for hvdc_bus_nr, hvdc_limit in hvdc:
+        pgen, loads = hvdc_candidates(network, hvdc_bus_nr, [hvdc_limit])
+        network = network.copy(machine_pgen=pgen[:, 0], load_power=loads[:, 0])
+    return network
+
+
+def screen(network, hvdc=(), branches=True, buses=False, exclude_buses=(), min_flow=10.0):
+    """
+        Static N-1 pass: every in-service branch (and optionally every bus) ranked by DC post-outage loading.
+        Input:
+            network: NetworkData of the case before the HVDC changes, ex. NetworkData.from_psspy()
+            hvdc: (bus number, limit) pairs applied as set_hvdc_active_power would, ex. ScenarioSpec.hvdc
+            buses: True to screen bus trips too
+        Output:
+            list of dictionaries, worst first, see DcScreening.screen
+    """
+    screening = DcScreening(with_hvdc(network, hvdc), min_flow)
+    return screening.screen(screening.contingencies(branches, buses, exclude_buses))
+
+
+def run_contingencies(bases, network, top=10, fault_time=1.0, buses=False, exclude_buses=(),
+                      rank_by="frequency_nadir", ascending=True, processes=None, root_dir=None, output_dir=None,
+                      cache_dir=None, catalog_path=None):
+    """
+        N-1 study: static screening of every contingency, dynamic simulation of the top ranked ones on a pool
+        of workers (scenario_sweep.run_sweep), one table of the results.
+        Input:
+            bases: ScenarioSpec, or a list of them, ex. one per HVDC setpoint; hvdc, channels, end_time and
+                   any faults of the base are kept, the contingency is added at fault_time
+            network: NetworkData of the case before the HVDC changes
+            top: contingencies simulated per base, the most severe of the static pass
+            rank_by, ascending: run_summary value that orders the simulated contingencies, worst first
+            processes, root_dir, output_dir, cache_dir, catalog_path: as in run_sweep
+        Output:
+            list of dictionaries, one per (base, contingency): failed simulations first, then the simulated
+            contingencies by rank_by, then the rest in static order. Keys of the static pass plus "scenario",
+            "status" ("static", "ok" or "failed"), "outputfile", "elapsed", "error", "post_error" and the
+            run_summary values
+        Scripts calling this on Windows must be guarded with if __name__ == "__main__".
+    """
+    from scenario_sweep import ScenarioSpec, kpi_summary, run_sweep  # Workers are only started here
+
+    if isinstance(bases, ScenarioSpec):
+        bases = [bases]
+    table = []
+    specs = []
+    simulated = []
+    for base in bases:
+        for row in screen(network, base.hvdc, True, buses, exclude_buses):
+            row.update({"scenario": base.name, "status": "static", "outputfile": None, "elapsed": 0.0,
+                        "error": None, "post_error": None})
+            table.append(row)
+            if row["static_rank"] <= top:
+                specs.append(base.copy(name=base.name + "_" + row["name"],
+                                       faults=base.faults + [row["contingency"].fault(fault_time)]))
+                simulated.append(row)
+
+    results = run_sweep(specs, processes, root_dir, output_dir, kpi_summary, cache_dir, catalog_path)
+    for row, result in zip(simulated, results):
+        row.update({"status": result.status, "outputfile": result.outputfile, "elapsed": result.elapsed,
+                    "error": result.error, "post_error": result.post_error})
+        row.update(result.values)
+
+    def order(row):
+        if row["status"] == "failed":
+            return (0, 0.0, row["static_rank"])
+        if row["status"] == "ok":
+            value = row.get(rank_by, np.nan)
+            value = np.inf if value is None or np.isnan(value) else (value if ascending else -value)
+            return (1, value, row["static_rank"])
+        return (2, -row["severity"], row["static_rank"])
+    table.sort(key=order)
+    for rank, row in enumerate(table):
+        row["rank"] = rank + 1
+    return table
+
+
+def format_table(table, limit=20, values=("frequency_nadir", "max_rocof", "min_damping")):
+    # Text table of the first limit rows of run_contingencies or screen
+    lines = ["%5s %-16s %-28s %8s %9s %6s %10s  %s" % ("rank", "scenario", "contingency", "severity", "overloads",
+                                                       "status", "lost MW", " ".join("%14s" % v for v in values))]
+    for row in table[:limit]:
+        lines.append("%5d %-16s %-28s %8.3f %9d %6s %10.1f  %s" % (
+            row.get("rank", row["static_rank"]), row.get("scenario", ""), row["name"], row["severity"],
+            row["overloads"], row.get("status", "static"), row["disconnected_mw"],
+            " ".join("%14.5g" % row[v] if row.get(v) is not None else "%14s" % "-" for v in values)))
+    return "\n".join(lines)
+
+
+# Private functions
+def _static_row(contingency, flows, reference, network, disconnected):
+    row = {"name": contingency.name, "contingency": contingency, "type": contingency.type, "bus": contingency.bus,
+           "other_end": contingency.other_end, "branch_id": contingency.branch_id, "islanded": False,
+           "island_buses": 0, "disconnected_mw": float(disconnected), "severity": 0.0, "overloads": 0,
+           "worst_branch": None}
+    if flows is not None and len(flows):
+        loading = np.abs(flows) / reference
+        worst = int(np.argmax(loading))
+        row["severity"] = float(loading[worst])
+        row["overloads"] = int(np.count_nonzero(loading > 1.0 + _LOADING_TOLERANCE))
+        row["worst_branch"] = (int(network.branch_from[worst]), int(network.branch_to[worst]),
+                               str(network.branch_ids[worst]).strip())
+    return row
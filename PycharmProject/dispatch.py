@@ -0,0 +1,92 @@
+# Standard Python-packages
+import numpy as np
+
+
+def lookup_rows(keys, values):
+    """
+        Row of each value in keys, using one sort instead of one np.where per value.
+        Input:
+            keys: array of unique keys, ex. all bus numbers
+            values: keys to look up, ex. the bus number of every machine
+        Output:
+            integer array with the row in keys of each value
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    order = np.argsort(keys, kind="mergesort")
+    positions = np.searchsorted(keys, values, sorter=order)
+    positions = np.minimum(positions, len(keys) - 1)
+    rows = order[positions]
+    missing = keys[rows] != values
+    if np.any(missing):
+        raise KeyError("Not found: " + str(values[missing][:10].tolist()))
+    return rows
+
+
+def machine_areas(machine_numbers, bus_numbers, bus_areas):
+    # psspy.amachint can not return "AREA", so the area of a machine is the area of its bus
+    return np.asarray(bus_areas)[lookup_rows(bus_numbers, machine_numbers)]
+
+
+def distribute_hvdc_slack(mach_gen, mach_gen_cap, in_area, slack_p):
+    """
+        New machine dispatch that covers a change slack_p (MW) of the HVDC exchange.
+        slack_p > 0 (more export): machines are increased in proportion to their headroom PMAX - PGEN
+        slack_p < 0 (more import): machines are decreased in proportion to their generation PGEN
+        Machines in the HVDC area take all of it if they can, otherwise they go to PMAX (or 0) and the
+        rest of the system takes the remainder. What can not be covered at all is left to the slack bus.
+        Input:
+            mach_gen, mach_gen_cap: PGEN and PMAX of every machine
+            in_area: boolean array, True for machines in the area of the HVDC bus
+            slack_p: MW to distribute
+        Output:
+            array with the new PGEN of every machine
+    """
+    mach_gen = np.asarray(mach_gen, dtype=float)
+    in_area = np.asarray(in_area, dtype=bool)
+    if slack_p > 0.0:
+        mach_slack = np.maximum(np.asarray(mach_gen_cap, dtype=float) - mach_gen, 0.0)  # Headroom
+    else:
+        mach_slack = np.maximum(mach_gen, 0.0)  # Generation that can be reduced
+    direction = 1.0 if slack_p > 0.0 else -1.0
+    slack_p = abs(slack_p)
+
+    area_slack = mach_slack[in_area].sum()
+    share = np.zeros(len(mach_gen))
+    if area_slack > slack_p:  # Distribute slack over local area
+        share[in_area] = slack_p / area_slack
+    else:  # Local area to PMAX (or 0), the rest of the system takes the remainder
+        share[in_area] = 1.0
+        rest_slack = mach_slack[~in_area].sum()
+        if rest_slack > 0.0:
+            share[~in_area] = min((slack_p - area_slack) / rest_slack, 1.0)
+
+    return mach_gen + direction * share * mach_slack
+
+
+def distribute_with_limits(mach_gen, mach_gen_min, mach_gen_cap, factors, amount):
+    """
+        Add amount (MW, may be negative) to the machines in proportion to factors, keeping PMIN <= PGEN <= PMAX.
+        What a machine can not take because of its limits is shared by the others.
+        Input:
+            mach_gen, mach_gen_min, mach_gen_cap: PGEN, PMIN and PMAX of every machine
+            factors: participation factors (>= 0), 0 for machines that do not participate
+            amount: MW to distribute
+        Output:
+            (array with the new PGEN of every machine, MW that could not be placed within the limits)
+    """
+    new_gen = np.array(mach_gen, dtype=float)
+    low = np.minimum(np.asarray(mach_gen_min, dtype=float), new_gen)  # Machines already outside stay where they are
+    high = np.maximum(np.asarray(mach_gen_cap, dtype=float), new_gen)
+    free = np.asarray(factors, dtype=float) > 0.0
+    factors = np.where(free, factors, 0.0)
+
+    remaining = float(amount)
+    while abs(remaining) > 1e-9 and np.any(free):
+        weights = factors * free
+        step = remaining * weights / weights.sum()
+        target = np.clip(new_gen + step, low, high)
+        remaining -= (target - new_gen).sum()
+        new_gen = target
+        free &= (new_gen < high) if remaining > 0.0 else (new_gen > low)  # Machines at a limit drop out
+    return new_gen, remaining
@@ -0,0 +1,153 @@
+# Standard Python-packages
+import re
+import numpy as np
+
+# Custom packages
+import dispatch
+
+
+# Parameter (CON) names of the models in our .dyr files, other models get P1, P2, ...
+MODEL_PARAMETERS = {
+    "GENROU": ("T'do", "T''do", "T'qo", "T''qo", "H", "D", "Xd", "Xq", "X'd", "X'q", "X''d", "Xl", "S(1.0)", "S(1.2)"),
+    "GENSAL": ("T'do", "T''do", "T''qo", "H", "D", "Xd", "Xq", "X'd", "X''d", "Xl", "S(1.0)", "S(1.2)"),
+    "HYGOV": ("R", "r", "Tr", "Tf", "Tg", "VELM", "GMAX", "GMIN", "TW", "At", "Dturb", "qNL"),
+    "IEESGO": ("T1", "T2", "T3", "T4", "T5", "T6", "K1", "K2", "K3", "PMAX", "PMIN"),
+    "SCRX": ("TA/TB", "TB", "K", "TE", "EMIN", "EMAX", "CSWITCH", "rc/rfd"),
+    "SEXS": ("TA/TB", "TB", "K", "TE", "EMIN", "EMAX"),
+    "IEEET2": ("TR", "KA", "TA", "VRMAX", "VRMIN", "KE", "TE", "KF", "TF1", "TF2", "E1", "SE(E1)", "E2", "SE(E2)"),
+    "STAB1": ("K/T", "T", "T1/T3", "T3", "T2/T4", "T4", "HLIM"),
+}
+
+GENERATOR_MODELS = ("GENROU", "GENSAL")  # Models with the inertia constant H
+
+# bus 'MODEL' id con1 con2 ... /   (the record may continue over several lines)
+_RECORD_PATTERN = re.compile(r"^\s*(\d+)\s+'([^']+)'\s+('[^']*'|\S+)(.*)$", re.DOTALL)
+
+
+def _format(value):
+    # Shortest text that reads back as the same float, in a 12 character field that widens for long values
+    return "%12s" % repr(float(value))
+
+
+class ModelTable(object):
+    """All records of one model type: one row per (bus, machine ID), one column per parameter"""
+    def __init__(self, model, buses, ids, params):
+        self.model = model
+        self.buses = np.asarray(buses, dtype=int)
+        self.ids = np.asarray(ids, dtype=object)
+        self.params = np.asarray(params, dtype=float)  # NaN where a record has fewer parameters
+        names = MODEL_PARAMETERS.get(model, ())
+        if len(names) != self.params.shape[1]:
+            names = tuple("P%d" % (k + 1) for k in range(self.params.shape[1]))
+        self.names = names
+        self._rows = dict(((int(bus), str(machine_id)), row) for row, (bus, machine_id) in enumerate(zip(self.buses, self.ids)))
+
+    # Public functions
+    def row(self, bus, machine_id):
+        return self._rows[(int(bus), str(machine_id).strip("' "))]
+    def column(self, name):
+        # View of one parameter for all rows, changing it changes the table
+        return self.params[:, self.names.index(name)]
+    def __len__(self):
+        return len(self.buses)
+
+
+class DyrData(object):
+    """Dynamic model data of a .dyr file as per-model NumPy tables"""
+    # Constructor
+    def __init__(self, tables, order):
+        self.tables = tables  # Model name -> ModelTable
+        self.order = order  # (model, row) of every record in file order, so writing keeps the layout
+
+    # Public functions
+    @classmethod
+    def read(cls, path):
+        with open(path) as f:
+            text = "\n".join(line for line in f.read().splitlines() if not line.lstrip().startswith("@"))
+
+        records = {}
+        order = []
+        for record in text.split("/"):
+            if not record.strip():
+                continue
+            match = _RECORD_PATTERN.match(record)
+            if match is None:
+                raise ValueError("Can not read .dyr record: " + record.strip()[:60])
+            bus, model, machine_id, rest = match.groups()
+            values = [float(value) for value in rest.split()]
+            buses, ids, params = records.setdefault(model, ([], [], []))
+            order.append((model, len(buses)))
+            buses.append(int(bus))
+            ids.append(machine_id.strip("' "))
+            params.append(values)
+
+        tables = {}
+        for model, (buses, ids, params) in records.items():
+            width = max(len(p) for p in params)
+            table = np.full((len(params), width), np.nan)
+            for row, values in enumerate(params):
+                table[row, :len(values)] = values
+            tables[model] = ModelTable(model, buses, ids, table)
+        return cls(tables, order)
+    def write(self, path, per_line=5):
+        # Write all records back in their original order, PSS/E reads this with dyre_new
+        lines = []
+        for model, row in self.order:
+            table = self.tables[model]
+            values = table.params[row]
+            values = values[~np.isnan(values)]
+            chunks = [" ".join(_format(value) for value in values[start:start + per_line])
+                      for start in range(0, len(values), per_line)]
+            lines.append("%7d '%s' %s  " % (table.buses[row], model, table.ids[row]) +
+                         ("\n" + " " * 9).join(chunks) + "  /")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    def table(self, model):
+        return self.tables[model]
+    def column(self, model, name):
+        return self.tables[model].column(name)
+    def models_at(self, bus, machine_id):
+        # Model names attached to one machine
+        found = []
+        for model, table in sorted(self.tables.items()):
+            try:
+                table.row(bus, machine_id)
+            except KeyError:
+                continue
+            found.append(model)
+        return found
+    def set(self, model, name, values, buses=None):
+        # Set a parameter for all rows, or for the rows at the given buses (every machine ID at those buses)
+        table = self.tables[model]
+        column = table.column(name)
+        if buses is None:
+            column[:] = values
+        else:
+            column[np.isin(table.buses, buses)] = values
+    def inertia(self):
+        # (buses, machine IDs, H) of all generator models
+        buses, ids, h = [], [], []
+        for model in GENERATOR_MODELS:
+            if model in self.tables:
+                table = self.tables[model]
+                buses.append(table.buses)
+                ids.append(table.ids)
+                h.append(table.column("H"))
+        if not buses:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=object), np.zeros(0)
+        return np.concatenate(buses), np.concatenate(ids), np.concatenate(h)
+    def inertia_by_area(self, bus_numbers, bus_areas, mbase=None):
+        """
+            Total inertia per area.
+            Input:
+                bus_numbers, bus_areas: bus arrays, ex. from NetworkSnapshot
+                mbase: optional machine MVA base per generator model row (order of inertia()),
+                       gives MWs instead of the sum of H (s)
+            Output:
+                (areas, total inertia of each area)
+        """
+        buses, _, h = self.inertia()
+        areas = np.asarray(bus_areas)[dispatch.lookup_rows(bus_numbers, buses)]
+        energy = h if mbase is None else h * np.asarray(mbase, dtype=float)
+        unique_areas, positions = np.unique(areas, return_inverse=True)
+        return unique_areas, np.bincount(positions, weights=energy)
@@ -0,0 +1,402 @@
+# Standard Python-packages
+import bisect
+import heapq
+import itertools
+import math
+import numpy as np
+
+# PSSPY-related packages
+import psspy
+
+
+# Fault types of PsspyCase.add_fault and events_overview
+BRANCH_TRIP = 1
+LOAD_STEP = 2
+BUS_TRIP = 3
+FAULT_TYPES = (BRANCH_TRIP, LOAD_STEP, BUS_TRIP)
+
+_TIME_DIGITS = 9  # Times closer than 1e-9 s are the same run segment
+
+
+class Event(object):
+    """Something that happens once at a given time of the dynamic simulation"""
+    type = None  # Fault type in events_overview, None for events that add_fault can not create
+    dense_output = True  # A SamplingPolicy writes densely around this event
+
+    # Constructor
+    def __init__(self, time):
+        self.time = _check_time(time)
+
+    # Public functions
+    def apply(self, case, time, occurrence):
+        # Change the network of case, called with the simulation standing at time
+        raise NotImplementedError
+    def next_time(self, occurrence):
+        # Time of the next occurrence, None when there is none
+        return None
+    def as_tuple(self):
+        # (time, type, bus, extras) as stored in events_overview
+        return None
+    def active_interval(self):
+        # (first, last) time at which the event changes the network
+        return self.time, self.time
+
+
+class BranchTrip(Event):
+    """Disconnect the branch between bus and other_end"""
+    type = BRANCH_TRIP
+    def __init__(self, time, bus, other_end, branch_id="1"):
+        Event.__init__(self, time)
+        self.bus = _check_bus(bus)
+        self.other_end = _check_bus(other_end)
+        if self.bus == self.other_end:
+            raise ValueError("Branch trip needs two different buses, got %d twice" % self.bus)
+        self.branch_id = str(branch_id)
+    def apply(self, case, time, occurrence):
+        case._exec_branch_trip(self.bus, self.other_end, self.branch_id)
+    def as_tuple(self):
+        return (self.time, self.type, self.bus, [self.other_end, self.branch_id])
+    def __repr__(self):
+        return "BranchTrip(%g, %d, %d, %r)" % (self.time, self.bus, self.other_end, self.branch_id)
+
+
+class LoadStep(Event):
+    """Change the active power of the loads at a bus by mw (split evenly over the loads)"""
+    type = LOAD_STEP
+    def __init__(self, time, bus, mw):
+        Event.__init__(self, time)
+        self.bus = _check_bus(bus)
+        self.mw = _check_number(mw, "Load step")
+    def apply(self, case, time, occurrence):
+        case._exec_load_step(self.bus, self.mw)
+    def as_tuple(self):
+        return (self.time, self.type, self.bus, [self.mw])
+    def __repr__(self):
+        return "LoadStep(%g, %d, %g)" % (self.time, self.bus, self.mw)
+
+
+class BusTrip(Event):
+    """Disconnect a bus"""
+    type = BUS_TRIP
+    def __init__(self, time, bus):
+        Event.__init__(self, time)
+        self.bus = _check_bus(bus)
+    def apply(self, case, time, occurrence):
+        case._exec_bus_trip(self.bus)
+    def as_tuple(self):
+        return (self.time, self.type, self.bus, [])
+    def __repr__(self):
+        return "BusTrip(%g, %d)" % (self.time, self.bus)
+
+
+class RecurringEvent(Event):
+    """Call action(case, time, occurrence) every period seconds from start, ex. stochastic load noise"""
+    dense_output = False  # Background changes, not a disturbance to look at
+    def __init__(self, start, period, action, count=None, end=None):
+        """
+            Input:
+                start: time of the first occurrence (s)
+                period: time between occurrences (s), > 0
+                action: function action(case, time, occurrence), occurrence counts from 0
+                count: number of occurrences, None = until end or the end of the simulation
+                end: no occurrences after this time (s), None = until the end of the simulation
+        """
+        Event.__init__(self, start)
+        self.period = _check_number(period, "Period")
+        if self.period <= 0.0:
+            raise ValueError("Period must be positive, got %g" % self.period)
+        if count is not None and count < 1:
+            raise ValueError("Count must be at least 1, got %d" % count)
+        self.action = action
+        self.count = count
+        self.end = end
+    def apply(self, case, time, occurrence):
+        self.action(case, time, occurrence)
+    def next_time(self, occurrence):
+        if self.count is not None and occurrence + 1 >= self.count:
+            return None
+        time = self.time + (occurrence + 1) * self.period  # No accumulated rounding errors
+        if self.end is not None and time > self.end:
+            return None
+        return time
+    def active_interval(self):
+        if self.count is not None:
+            last = self.time + (self.count - 1) * self.period
+            return self.time, last if self.end is None else min(last, self.end)
+        return self.time, float("inf") if self.end is None else self.end
+    def __repr__(self):
+        return "RecurringEvent(%g, %g, %r, count=%r, end=%r)" % (self.time, self.period, self.action,
+                                                                 self.count, self.end)
+
+
+class LoadRamp(RecurringEvent):
+    """Change the loads at a bus by mw in equal steps over duration, ex. a staged HVDC ramp at an HVDC bus"""
+    dense_output = True
+    def __init__(self, start, duration, bus, mw, steps=10):
+        if steps < 1:
+            raise ValueError("A ramp needs at least one step, got %d" % steps)
+        duration = _check_number(duration, "Duration")
+        if duration <= 0.0:
+            raise ValueError("Duration must be positive, got %g" % duration)
+        RecurringEvent.__init__(self, start, duration / steps, self._step, count=steps)
+        self.bus = _check_bus(bus)
+        self.mw = _check_number(mw, "Ramp")
+        self.steps = steps
+    def _step(self, case, time, occurrence):
+        case._exec_load_step(self.bus, self.mw / self.steps)
+    def __repr__(self):
+        return "LoadRamp(%g, %g, %d, %g, steps=%d)" % (self.time, self.period * self.steps, self.bus, self.mw,
+                                                      self.steps)
+
+
+def make_event(time, type, bus, extras=()):
+    """
+        Typed event from the arguments of PsspyCase.add_fault.
+        Input:
+            type: BRANCH_TRIP (extras = [other end, optional branch ID]), LOAD_STEP (extras = [MW]) or BUS_TRIP
+            extras: list, or a single value
+        Output:
+            Event
+    """
+    if not isinstance(extras, (list, tuple)):
+        extras = [extras]
+    if type == BRANCH_TRIP:
+        if len(extras) < 1:
+            raise ValueError("Branch trip needs the bus at the other end in extras")
+        return BranchTrip(time, bus, *extras[:2])
+    elif type == LOAD_STEP:
+        if len(extras) < 1:
+            raise ValueError("Load step needs the step (MW) in extras")
+        return LoadStep(time, bus, extras[0])
+    elif type == BUS_TRIP:
+        return BusTrip(time, bus)
+    raise ValueError("Unknown fault type %r, expected one of %r" % (type, FAULT_TYPES))
+
+
+class SamplingPolicy(object):
+    """Output density of a dynamic simulation: every dense_nplt time steps around events, else every sparse_nplt"""
+    def __init__(self, dense_nplt=1, sparse_nplt=20, before=0.1, after=5.0, nprt=100):
+        """
+            Input:
+                dense_nplt, sparse_nplt: plot interval (time steps) of psspy.run inside and outside the windows
+                before, after: window around each event (s), from before the first to after the last change
+                nprt: print interval (time steps)
+        """
+        if dense_nplt < 1 or sparse_nplt < 1:
+            raise ValueError("Plot intervals must be at least 1 time step")
+        self.dense_nplt = int(dense_nplt)
+        self.sparse_nplt = int(sparse_nplt)
+        self.before = before
+        self.after = after
+        self.nprt = nprt
+
+    # Public functions
+    def window_edges(self, events, end_time):
+        # Sorted [start, end, start, end, ...] of the merged dense windows of events that want dense output
+        windows = []
+        for event in events:
+            if event.dense_output:
+                first, last = event.active_interval()
+                if first <= end_time:
+                    windows.append((max(first - self.before, 0.0), min(last + self.after, end_time)))
+        edges = []
+        for start, end in sorted(windows):
+            if edges and start <= edges[-1]:  # Overlaps the previous window
+                edges[-1] = max(edges[-1], end)
+            else:
+                edges.extend([start, end])
+        return edges
+    def nplt_at(self, edges, time):
+        # Plot interval for a run ending at time, dense inside a window
+        return self.dense_nplt if bisect.bisect_left(edges, time) % 2 == 1 else self.sparse_nplt
+    def pieces(self, edges, t_from, t_to):
+        # (end time, nplt) of the psspy.run calls from t_from to t_to, split where a window starts or ends
+        first = bisect.bisect_right(edges, t_from)
+        last = bisect.bisect_left(edges, t_to)
+        targets = edges[first:last] + [t_to]
+        return [(target, self.nplt_at(edges, target)) for target in targets]
+    def __repr__(self):
+        return "SamplingPolicy(dense_nplt=%d, sparse_nplt=%d, before=%g, after=%g)" % (
+            self.dense_nplt, self.sparse_nplt, self.before, self.after)
+
+
+class StopMonitor(object):
+    """Ends a dynamic run before end_time once it has settled or lost synchronism, checked after the last event"""
+    # Constructor
+    def __init__(self, segment=0.2, hold=5.0, frequency_band=0.01, angle_band=1.0, max_angle_separation=180.0,
+                 max_speed_deviation=0.05):
+        """
+            Input:
+                segment: length (s) of the psspy.run pieces after the last event, the channels are read after each
+                         with psspy.chnval; oscillations faster than 1 / (2 * segment) Hz are not seen
+                hold: settled when every monitored value stayed inside its band for this long (s)
+                frequency_band: peak-to-peak band (Hz) of the SPEED and FREQ channels
+                angle_band: peak-to-peak band (degrees) of the ANGLE channels, taken relative to their mean
+                max_angle_separation: unstable when the ANGLE channels spread more than this (degrees), None = off
+                max_speed_deviation: unstable when a SPEED channel is further than this from 0 (p.u.), None = off
+        """
+        if segment <= 0.0 or hold < segment:
+            raise ValueError("Need 0 < segment <= hold, got segment %g and hold %g" % (segment, hold))
+        self.segment = float(segment)
+        self.hold = float(hold)
+        self.frequency_band = frequency_band
+        self.angle_band = angle_band
+        self.max_angle_separation = max_angle_separation
+        self.max_speed_deviation = max_speed_deviation
+        self.indices = []  # Channel indices read after every segment
+
+    # Public functions
+    def start(self, channels):
+        # Pick the SPEED, FREQ and ANGLE channels of the case (ChannelRegistry.channels), False if there are none
+        import kpi  # Nominal frequency and frequency quantities, as for the KPIs
+        self._nominal = kpi.NOMINAL_FREQUENCY
+        frequency = [c["index"] for c in channels if c["quantity"] in kpi.FREQUENCY_QUANTITIES]
+        angle = [c["index"] for c in channels if c["quantity"] == "ANGLE"]
+        self._speed = np.array([c["quantity"] == "SPEED" for c in channels
+                                if c["quantity"] in kpi.FREQUENCY_QUANTITIES], dtype=bool)
+        self.indices = frequency + angle
+        self._n_frequency = len(frequency)
+        self._times = []
+        self._samples = np.zeros((0, len(self.indices)))
+        return len(self.indices) > 0
+    def check(self, time, values):
+        """
+            Input:
+                time: simulation time of the values (s)
+                values: present values of the channels in indices
+            Output:
+                None to go on, else the stop reason: "settled", "angle_separation" or "speed_deviation"
+        """
+        values = np.asarray(values, dtype=float)
+        frequency, angle = values[:self._n_frequency], values[self._n_frequency:]
+        if self.max_speed_deviation is not None and np.any(np.abs(frequency[self._speed]) > self.max_speed_deviation):
+            return "speed_deviation"
+        if len(angle) > 1 and self.max_angle_separation is not None and \
+                angle.max() - angle.min() > self.max_angle_separation:
+            return "angle_separation"
+
+        # Hz and angles relative to their mean, the window keeps the newest samples inside the bands
+        sample = np.concatenate((self._nominal * (1.0 + frequency),
+                                 angle - angle.mean() if len(angle) else angle))
+        self._times.append(time)
+        self._samples = np.vstack((self._samples, sample))
+        bands = np.array([self.frequency_band] * self._n_frequency + [self.angle_band] * len(angle))
+        while len(self._times) > 1 and np.any(np.ptp(self._samples, axis=0) > bands):
+            self._times.pop(0)
+            self._samples = self._samples[1:]
+        if time - self._times[0] >= self.hold - 1e-9:
+            return "settled"
+        return None
+    def __repr__(self):
+        return "StopMonitor(segment=%g, hold=%g, frequency_band=%g, angle_band=%g)" % (
+            self.segment, self.hold, self.frequency_band, self.angle_band)
+
+
+class EventScheduler(object):
+    """Events in a priority queue on time, the simulation is run once to every distinct event time"""
+    # Constructor
+    def __init__(self):
+        self._heap = []  # (time key, sequence, time, occurrence, event)
+        self._sequence = itertools.count()  # Events at the same time fire in the order they were added
+        self.segments = 0  # Number of psspy.run calls of the last run
+        self.stop = None  # (reason, time) when a StopMonitor ended the last run early
+
+    # Public functions
+    def add(self, event):
+        self._push(self._heap, event.time, 0, event)
+        return event
+    def clear(self):
+        self._heap = []
+    def __len__(self):
+        return len(self._heap)
+    def times(self):
+        # Distinct times of the first occurrences, sorted
+        return sorted(set(item[0] for item in self._heap))
+    def run(self, case, end_time, nprt=100, nplt=10, sampling=None, monitor=None):
+        """
+            Run the dynamic simulation of case to end_time and fire the events on the way.
+            The queue is not used up, the same events can be run again after a new strt.
+            Input:
+                case: PsspyCase, after psspy.strt
+                end_time: end of the simulation (s), later events are not fired
+                nprt, nplt: print and plot interval (time steps) of psspy.run
+                sampling: SamplingPolicy, replaces nprt and nplt, None = the same nplt everywhere
+                monitor: StopMonitor, ends the run after the last event once it settles or goes unstable,
+                         the reason and time are kept in stop
+            Output:
+                number of events fired
+        """
+        heap = list(self._heap)  # A copy of a heap is a heap
+        edges = None
+        if sampling is not None:
+            edges = sampling.window_edges([item[4] for item in heap], end_time)
+            nprt = sampling.nprt
+        fired = 0
+        key = None
+        now = 0.0
+        self.segments = 0
+        self.stop = None
+        while heap and heap[0][2] <= end_time:
+            key, time = heap[0][0], heap[0][2]
+            now = self._run_to(now, time, nprt, nplt, sampling, edges)  # Once for all events at this time
+            # The simulation moved the voltage dependent loads and machine outputs: events read them again
+            # Bus and branch arrays stay cached, the trip handlers invalidate everything themselves
+            case.network.invalidate(["load", "machine", "plant"])
+            while heap and heap[0][0] == key:
+                _, _, _, occurrence, event = heapq.heappop(heap)
+                event.apply(case, time, occurrence)
+                fired += 1
+                next_time = event.next_time(occurrence)
+                if next_time is not None:
+                    self._push(heap, next_time, occurrence + 1, event)
+        if key != round(end_time, _TIME_DIGITS):  # Unless the last events were at end_time
+            if monitor is not None and monitor.start(case.channels.channels):
+                self.stop = self._run_monitored(now, end_time, nprt, nplt, sampling, edges, monitor)
+            else:
+                self._run_to(now, end_time, nprt, nplt, sampling, edges)
+        return fired
+
+    # Private functions
+    def _run_to(self, now, time, nprt, nplt, sampling, edges):
+        pieces = [(time, nplt)] if sampling is None else sampling.pieces(edges, now, time)
+        for target, piece_nplt in pieces:
+            psspy.run(0, target, nprt, piece_nplt, 0)
+            self.segments += 1
+        return time
+    def _run_monitored(self, now, end_time, nprt, nplt, sampling, edges, monitor):
+        # Run to end_time in segments, reading the monitored channels after each, until the monitor stops it
+        start = now
+        k = 0
+        while now < end_time:
+            k += 1
+            now = self._run_to(now, min(round(start + k * monitor.segment, _TIME_DIGITS), end_time), nprt, nplt,
+                               sampling, edges)
+            reason = monitor.check(now, [psspy.chnval(index)[1] for index in monitor.indices])
+            if reason is not None:
+                return reason, now
+        return None
+    def _push(self, heap, time, occurrence, event):
+        heapq.heappush(heap, (round(time, _TIME_DIGITS), next(self._sequence), time, occurrence, event))
+
+
+def _check_time(time):
+    time = _check_number(time, "Event time")
+    if time < 0.0:
+        raise ValueError("Event time can not be negative, got %g" % time)
+    return time
+
+
+def _check_bus(bus):
+    if isinstance(bus, bool) or int(bus) != bus or bus <= 0:
+        raise ValueError("Bus number must be a positive integer, got %r" % (bus,))
+    return int(bus)
+
+
+def _check_number(value, what):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("%s must be a number, got %r" % (what, value))
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError("%s must be finite, got %r" % (what, value))
+    return value
@@ -0,0 +1,338 @@
+# Local job-queue service: scenarios are submitted as JSON, queued on priority and run on a fixed number of
+# long-lived PSS/E worker processes (one per license seat), events stream back to the clients as jobs progress.
+# Protocol: one JSON object per line over TCP, both ways. Requests:
+#   {"op": "submit", "specs": [ScenarioSpec.to_dict(), ...], "priority": 0, "follow": true}
+#       -> a "queued" event per job, then (follow) "started" and "finished" events until all of them are done
+#   {"op": "status"} or {"op": "status", "job": 3}  -> {"event": "status", "jobs": [...]}
+#   {"op": "cancel", "job": 3}  -> a "cancelled" event if the job was still queued
+#   {"op": "watch"}  -> every event of every job, until the client disconnects
+# Events are the job's dictionary (Job.to_dict) with "event" and "time" added, results carry the output file and
+# the values of the post-processing hook (scenario_sweep.kpi_summary by default).
+# Python 3.7+ only (asyncio), the clients below only need a socket and run on Python 2 as well.
+# Usage: python job_service.py --seats 2 [--port 8765] [--root-dir ..] [--cache-dir cache] [--catalog runs.db]
+
+# Standard Python-packages
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import itertools
+from concurrent.futures.process import BrokenProcessPool
+
+# Custom packages
+import scenario_sweep
+
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+QUEUED = "queued"
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+CANCELLED = "cancelled"
+_DONE = (OK, FAILED, CANCELLED)
+
+
+class Job(object):
+    """One submitted scenario and what became of it"""
+    def __init__(self, job_id, spec, priority, order):
+        self.id = job_id
+        self.spec = spec
+        self.priority = priority  # Higher runs first, submission order among equal priorities
+        self.order = order
+        self.state = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None  # ScenarioResult once the job ran
+    def to_dict(self):
+        values = {"job": self.id, "name": self.spec.name, "state": self.state, "priority": self.priority,
+                  "submitted": self.submitted, "started": self.started, "finished": self.finished}
+        if self.result is not None:
+            result = self.result
+            values.update(outputfile=result.outputfile + ".out" if result.outputfile else None,
+                          elapsed=result.elapsed, worker=result.worker, error=result.error, values=result.values,
+                          stop_reason=result.stop_reason, stop_time=result.stop_time, post_error=result.post_error)
+        return values
+    def __repr__(self):
+        return "Job(%d, %r, %s)" % (self.id, self.spec.name, self.state)
+
+
+class JobService(object):
+    """Priority queue of scenarios in front of a fixed pool of PSS/E workers"""
+    # Constructor
+    def __init__(self, seats=1, root_dir=None, output_dir=None, post=None, cache_dir=None, catalog_path=None):
+        """
+            Input:
+                seats: PSS/E licenses to use, the number of workers and of scenarios running at the same time
+                root_dir, output_dir, cache_dir: as run_sweep, every worker writes to output_dir/worker_<pid>
+                post: module-level function post(case, spec) -> dict run in the worker,
+                      None = scenario_sweep.kpi_summary
+                catalog_path: Catalog that gets every finished job
+        """
+        if seats < 1:
+            raise ValueError("Need at least one seat, got %r" % (seats,))
+        self.seats = seats
+        self.root_dir = root_dir
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.post = post if post is not None else scenario_sweep.kpi_summary
+        self.catalog_path = catalog_path
+        self.jobs = {}  # Job ID -> Job, kept for status requests
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+        self._queue = None  # asyncio.PriorityQueue of (-priority, order, job ID), made on the running loop
+        self._subscribers = []  # asyncio.Queue per connection that follows events
+        self._executor = None
+        self._dispatchers = []
+
+    # Public functions
+    async def start(self):
+        # Start the workers and one dispatcher per seat
+        self._queue = asyncio.PriorityQueue()
+        self._executor = self._start_executor()
+        self._dispatchers = [asyncio.ensure_future(self._dispatch()) for _ in range(self.seats)]
+    async def close(self):
+        # Stop dispatching, running scenarios finish before the workers exit
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+    async def serve(self, host=HOST, port=PORT):
+        # TCP server of the JSON-lines protocol, the caller keeps it running (serve_forever) and closes it
+        return await asyncio.start_server(self._handle, host, port)
+    def submit(self, spec, priority=0):
+        # Queue a ScenarioSpec, returns its Job
+        job = Job(next(self._ids), spec, priority, next(self._order))
+        self.jobs[job.id] = job
+        self._queue.put_nowait((-priority, job.order, job.id))
+        self._publish("queued", job, position=self.position(job))
+        return job
+    def cancel(self, job_id):
+        # Cancel a job that has not started, returns False if it is running or done
+        job = self._job(job_id)
+        if job.state != QUEUED:
+            return False
+        job.state = CANCELLED
+        job.finished = time.time()
+        self._publish("cancelled", job)
+        return True
+    def position(self, job):
+        # Queued jobs that run before this one
+        key = (-job.priority, job.order)
+        return sum(1 for other in self.jobs.values() if other.state == QUEUED and (-other.priority, other.order) < key)
+    def subscribe(self):
+        # Queue that gets every event from now on, until unsubscribe
+        events = asyncio.Queue()
+        self._subscribers.append(events)
+        return events
+    def unsubscribe(self, events):
+        self._subscribers.remove(events)
+
+    # Private functions
+    def _start_executor(self):
+        return scenario_sweep.start_executor(self.seats, self.root_dir, self.output_dir, self.cache_dir)
+    def _job(self, job_id):
+        if job_id not in self.jobs:
+            raise ValueError("No job %r" % (job_id,))
+        return self.jobs[job_id]
+    def _publish(self, name, job, **extra):
+        event = dict(job.to_dict(), event=name, time=time.time(), **extra)
+        for events in self._subscribers:
+            events.put_nowait(event)
+    async def _dispatch(self):
+        # One seat: take the highest-priority queued job, run it on a worker, publish the result
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs[job_id]
+            if job.state != QUEUED:  # Cancelled while it waited
+                continue
+            job.state = RUNNING
+            job.started = time.time()
+            self._publish("started", job)
+            executor = self._executor
+            try:
+                result = await loop.run_in_executor(executor, scenario_sweep.run_in_worker, job.spec, self.post,
+                                                    self.catalog_path is not None)
+            except BrokenProcessPool:
+                # A worker died (ex. PSS/E crashed), every job on the pool fails and the workers are started again
+                result = self._lost(job)
+                if self._executor is executor:
+                    self._executor = self._start_executor()
+            job.result = result
+            job.state = OK if result.status == "ok" else FAILED
+            job.finished = time.time()
+            if self.catalog_path is not None and result.record is not None:
+                await loop.run_in_executor(None, _catalog_add, self.catalog_path, result.record)
+            self._publish("finished", job)
+    def _lost(self, job):
+        import catalog
+        error = "Worker process ended while running the scenario"
+        elapsed = time.time() - job.started
+        record = catalog.failed_record(job.spec, elapsed, error) if self.catalog_path is not None else None
+        return scenario_sweep.ScenarioResult(job.spec, "failed", elapsed=elapsed, error=error, record=record)
+    async def _handle(self, reader, writer):
+        # One client connection: requests in, events out, jobs keep running if the client goes away
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    await self._request(json.loads(line.decode("utf-8")), writer)
+                except (ValueError, TypeError, KeyError) as error:  # Bad request, the connection stays usable
+                    await _send(writer, {"event": "error", "error": "%s: %s" % (type(error).__name__, error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    async def _request(self, request, writer):
+        op = request.get("op")
+        if op == "submit":
+            specs = request["specs"] if "specs" in request else [request["spec"]]
+            specs = [scenario_sweep.ScenarioSpec.from_dict(spec) for spec in specs]  # All valid before any queued
+            events = self.subscribe() if request.get("follow", True) else None
+            try:
+                jobs = [self.submit(spec, int(request.get("priority", 0))) for spec in specs]
+                if events is None:
+                    for job in jobs:
+                        await _send(writer, dict(job.to_dict(), event="queued", time=time.time(),
+                                                 position=self.position(job)))
+                else:
+                    await self._follow(events, set(job.id for job in jobs), writer)
+            finally:
+                if events is not None:
+                    self.unsubscribe(events)
+        elif op == "status":
+            jobs = [self._job(request["job"])] if "job" in request else sorted(self.jobs.values(),
+                                                                               key=lambda job: job.id)
+            await _send(writer, {"event": "status", "time": time.time(), "seats": self.seats,
+                                 "jobs": [job.to_dict() for job in jobs]})
+        elif op == "cancel":
+            name = "cancelled" if self.cancel(request["job"]) else "not_cancelled"
+            await _send(writer, dict(self._job(request["job"]).to_dict(), event=name, time=time.time()))
+        elif op == "watch":
+            events = self.subscribe()
+            try:
+                await self._follow(events, None, writer)
+            finally:
+                self.unsubscribe(events)
+        else:
+            raise ValueError("Unknown op %r, expected submit, status, cancel or watch" % (op,))
+    async def _follow(self, events, job_ids, writer):
+        # Send the events of these jobs (all jobs for None) until they are all done
+        pending = set(job_ids) if job_ids is not None else None
+        while pending is None or pending:
+            event = await events.get()
+            if pending is not None and event["job"] not in pending:
+                continue
+            await _send(writer, event)
+            if pending is not None and event["state"] in _DONE:
+                pending.discard(event["job"])
+
+
+def submit(specs, priority=0, follow=True, host=HOST, port=PORT):
+    """
+        Client: submit scenarios and yield the events of their jobs as they come.
+        Input:
+            specs: list of ScenarioSpec or of their dictionaries
+            priority: higher runs first
+            follow: False = only the "queued" events, the jobs run without this client
+        Output:
+            generator of event dictionaries, ends when every job is done (or queued if not follow)
+    """
+    specs = [spec if isinstance(spec, dict) else spec.to_dict() for spec in specs]
+    return _events({"op": "submit", "specs": specs, "priority": priority, "follow": follow}, host, port,
+                   len(specs) if not follow else None)
+
+
+def status(job=None, host=HOST, port=PORT):
+    # Client: dictionaries of all jobs, or of one job
+    request = {"op": "status"} if job is None else {"op": "status", "job": job}
+    return next(_events(request, host, port, 1))["jobs"]
+
+
+def cancel(job, host=HOST, port=PORT):
+    # Client: True if the job was cancelled before it started
+    return next(_events({"op": "cancel", "job": job}, host, port, 1))["event"] == "cancelled"
+
+
+# Private functions
+async def _send(writer, event):
+    writer.write((json.dumps(event, default=_plain) + "\n").encode("utf-8"))
+    await writer.drain()
+
+
+def _plain(value):
+    # numpy scalars and arrays in the values of post-processing hooks
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _catalog_add(catalog_path, record):
+    from catalog import Catalog
+    catalog = Catalog(catalog_path)
+    try:
+        catalog.add_runs([record])
+    finally:
+        catalog.close()
+
+
+def _events(request, host, port, count=None):
+    # Send one request and yield the events that come back, until count events, every submitted job done or the
+    # server disconnects
+    connection = socket.create_connection((host, port))
+    try:
+        connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        stream = connection.makefile("rb")
+        received = done = 0
+        for line in stream:
+            event = json.loads(line.decode("utf-8"))
+            if event["event"] == "error":
+                raise ValueError(event["error"])
+            yield event
+            received += 1
+            done += request["op"] == "submit" and event["state"] in _DONE
+            if received == count or done == len(request.get("specs", ())):
+                break
+        stream.close()
+    finally:
+        connection.close()
+
+
+async def _main(args):
+    service = JobService(args.seats, args.root_dir, args.output_dir, cache_dir=args.cache_dir,
+                         catalog_path=args.catalog)
+    await service.start()
+    server = await service.serve(args.host, args.port)
+    print("Serving %d seat(s) on %s:%d" % (args.seats, args.host, args.port))
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue PsspyCase scenarios on a fixed pool of PSS/E workers")
+    parser.add_argument("--seats", type=int, default=1, help="PSS/E licenses to use, scenarios run at the same time")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--root-dir", default=None, help="Folder holding Models, default the parent folder")
+    parser.add_argument("--output-dir", default=None, help="Default root-dir/Output")
+    parser.add_argument("--cache-dir", default=None, help="CaseCache shared by the workers")
+    parser.add_argument("--catalog", default=None, help="SQLite Catalog of the finished jobs")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# Standard Python-packages
+import numpy as np
+
+
+# Stability indicators of dynamic simulation results, computed without plotting.
+# Signals are arrays with time as the last axis: (time,), (channels, time) or (runs, channels, time),
+# all sharing one time axis, which does not need to be uniform. ChannelFile.data is (time, channels):
+# pass channel_file.data.T. Every function works on all leading axes at once.
+
+NOMINAL_FREQUENCY = 50.0  # Hz
+FREQUENCY_QUANTITIES = ("SPEED", "FREQ")  # Deviations in p.u., converted to Hz before the indicators
+
+_TABLE_FIELDS = [("event_time", "f8"), ("channel", "i4"), ("quantity", "U8"), ("bus", "i4"),
+                 ("nadir", "f8"), ("nadir_time", "f8"), ("peak_deviation", "f8"), ("peak_time", "f8"),
+                 ("rocof", "f8"), ("settling_time", "f8"), ("steady_state_deviation", "f8"),
+                 ("frequency", "f8"), ("damping", "f8"), ("angle_separation", "f8")]
+
+
+def event_times(events_overview):
+    # Distinct event times of PsspyCase.events_overview, sorted
+    return np.unique([event[0] for event in events_overview])
+
+
+def pre_event_value(time, values, t_event, window=1.0):
+    # Mean over the window before the event (samples at the event time are left out), the first sample if empty
+    first = np.searchsorted(time, t_event - window, side="left")
+    last = np.searchsorted(time, t_event, side="left")
+    if last <= first:
+        return values[..., 0]
+    return values[..., first:last].mean(axis=-1)
+
+
+def nadir(time, values, t_event, t_end=None):
+    # (lowest value, its time) from t_event to t_end
+    first, last = _rows(time, t_event, t_end)
+    k = np.argmin(values[..., first:last], axis=-1)
+    return np.min(values[..., first:last], axis=-1), time[first + k]
+
+
+def peak_deviation(time, values, t_event, t_end=None, pre_window=1.0):
+    # (largest deviation from the pre-event value with its sign, its time)
+    first, last = _rows(time, t_event, t_end)
+    deviation = values[..., first:last] - pre_event_value(time, values, t_event, pre_window)[..., None]
+    k = np.argmax(np.abs(deviation), axis=-1)
+    return np.take_along_axis(deviation, k[..., None], axis=-1)[..., 0], time[first + k]
+
+
+def rocof(time, values, t_event, t_end=None, window=0.5):
+    """
+        Rate of change (ex. of frequency, Hz/s) averaged over window seconds, the largest after the event.
+        Output:
+            rate with the largest magnitude, with its sign
+    """
+    first, last = _rows(time, t_event, t_end)
+    start = np.arange(first, last)
+    end = np.minimum(np.searchsorted(time, time[start] + window, side="left"), last - 1)
+    dt = time[end] - time[start]
+    valid = dt >= 0.5 * window  # Windows cut short by t_end are left out
+    if not np.any(valid):
+        return np.full(values.shape[:-1], np.nan)
+    start, end, dt = start[valid], end[valid], dt[valid]
+    slope = (values[..., end] - values[..., start]) / dt
+    k = np.argmax(np.abs(slope), axis=-1)
+    return np.take_along_axis(slope, k[..., None], axis=-1)[..., 0]
+
+
+def steady_state_deviation(time, values, t_event, t_end=None, final_window=5.0, pre_window=1.0):
+    # Mean over the last final_window seconds before t_end minus the pre-event value
+    return _final_value(time, values, t_end, final_window) - pre_event_value(time, values, t_event, pre_window)
+
+
+def settling_time(time, values, t_event, t_end=None, tolerance=None, band=0.05, final_window=5.0):
+    """
+        Time after the event until the signal stays within tolerance of its final value.
+        Input:
+            tolerance: absolute band, None = band times the largest deviation from the final value
+        Output:
+            settling time (s), 0 if it never leaves the band, NaN if it is still outside at t_end
+    """
+    first, last = _rows(time, t_event, t_end)
+    final = _final_value(time, values, t_end, final_window)
+    deviation = np.abs(values[..., first:last] - final[..., None])
+    if tolerance is None:
+        tolerance = np.maximum(band * deviation.max(axis=-1), 1e-9)
+    outside = deviation > np.asarray(tolerance)[..., None] if np.ndim(tolerance) else deviation > tolerance
+    n = last - first
+    last_outside = n - 1 - np.argmax(outside[..., ::-1], axis=-1)
+    settled_at = time[np.minimum(first + last_outside + 1, last - 1)]
+    result = np.where(outside.any(axis=-1), settled_at - t_event, 0.0)
+    return np.where(outside[..., -1], np.nan, result)
+
+
+def angle_separation(time, angles, t_event, t_end=None):
+    # (largest angle difference between any two machines, its time), machines on the second last axis
+    first, last = _rows(time, t_event, t_end)
+    window = angles[..., first:last]
+    spread = window.max(axis=-2) - window.min(axis=-2)
+    k = np.argmax(spread, axis=-1)
+    return spread.max(axis=-1), time[first + k]
+
+
+def resample(time, values, grid):
+    # Linear interpolation of all signals onto grid, the weights are computed once for the shared time axis
+    right = np.clip(np.searchsorted(time, grid, side="right"), 1, len(time) - 1)
+    left = right - 1
+    span = time[right] - time[left]
+    weight = np.where(span > 0.0, (grid - time[left]) / np.where(span > 0.0, span, 1.0), 0.0)
+    weight = np.clip(weight, 0.0, 1.0)
+    return values[..., left] * (1.0 - weight) + values[..., right] * weight
+
+
+def ringdown(time, values, t_start, t_end=None, window=20.0, rate=10.0, modes=10, min_frequency=0.1,
+             max_frequency=None):
+    """
+        Dominant oscillation mode of every signal by the matrix pencil method, all signals in one batch.
+        Input:
+            t_start, t_end: ringdown window (s), ex. from a second after the event to the next event
+            window: longest fit (s) from t_start, the oscillation has mostly died out after it on long runs
+            rate: uniform sample rate (Hz) of the fit, 10 Hz keeps the electromechanical modes below Nyquist
+            modes: model order of the pencil (real modes and conjugate pairs together)
+            min_frequency, max_frequency: band (Hz) for the dominant mode, max None = Nyquist
+        Output:
+            (frequency (Hz), damping ratio) of the mode with the most energy, NaN where none is found
+    """
+    if t_end is None:
+        t_end = time[-1]
+    t_end = min(t_end, t_start + window)
+    rate = max(rate, 3.0 * modes / (t_end - t_start))  # Short windows between events need more samples for the pencil
+    dt = 1.0 / rate
+    samples = int(np.floor((t_end - t_start) * rate + 1e-9)) + 1
+    grid = t_start + dt * np.arange(samples)
+    shape = values.shape[:-1]
+    signals = resample(time, values, grid).reshape(-1, samples)
+    signals = signals - signals.mean(axis=-1)[:, None]
+    flat = signals.std(axis=-1) > 1e-12  # Constant signals have no modes
+    frequency = np.full(len(signals), np.nan)
+    damping = np.full(len(signals), np.nan)
+    if not np.any(flat):
+        return frequency.reshape(shape), damping.reshape(shape)
+    signals = signals[flat]
+
+    # Hankel matrices of all signals, (signals, L - P, P + 1)
+    pencil = samples // 3
+    rows = np.arange(samples - pencil)[:, None] + np.arange(pencil + 1)[None, :]
+    hankel = signals[:, rows]
+    # Right singular vectors of the Hankel matrices are the eigenvectors of H'H, a batched eigh is much faster
+    gram = np.matmul(np.transpose(hankel, (0, 2, 1)), hankel)
+    _, vectors = np.linalg.eigh(gram)  # Ascending eigenvalues
+    v = vectors[:, :, ::-1][:, :, :modes]  # Dominant right singular vectors, (signals, P + 1, M)
+    poles = np.linalg.eigvals(np.matmul(np.linalg.pinv(v[:, :-1, :]), v[:, 1:, :]))  # (signals, M)
+
+    # Amplitudes by least squares on the Vandermonde matrix of the poles
+    log_poles = np.log(poles.astype(complex))
+    vandermonde = np.exp(log_poles[:, None, :] * np.arange(samples)[None, :, None])  # (signals, samples, M)
+    amplitudes = np.matmul(np.linalg.pinv(vandermonde), signals[:, :, None].astype(complex))[:, :, 0]
+    energy = np.abs(amplitudes) ** 2 * (np.abs(vandermonde) ** 2).sum(axis=1)
+
+    s = log_poles / dt
+    mode_frequency = s.imag / (2.0 * np.pi)
+    if max_frequency is None:
+        max_frequency = 0.5 / dt
+    in_band = (mode_frequency >= min_frequency) & (mode_frequency <= max_frequency)  # Positive half of each pair
+    energy = np.where(in_band, energy, -1.0)
+    k = np.argmax(energy, axis=-1)
+    found = energy[np.arange(len(k)), k] > 0.0
+    best = s[np.arange(len(k)), k]
+    frequency[flat] = np.where(found, best.imag / (2.0 * np.pi), np.nan)
+    damping[flat] = np.where(found, -best.real / np.abs(best), np.nan)
+    return frequency.reshape(shape), damping.reshape(shape)
+
+
+def compute(time, values, t_event, t_end=None, ringdown_delay=1.0, ringdown_window=20.0, final_window=5.0,
+            rocof_window=0.5):
+    """
+        All channel indicators for one event window.
+        Input:
+            time: shared time axis
+            values: (..., time) signals, frequencies in Hz
+            t_event, t_end: window, t_end None = end of the run
+            ringdown_delay: seconds after the event before the damping estimate starts
+            ringdown_window: longest damping estimate window (s)
+        Output:
+            dictionary indicator name -> array with the shape of values without the time axis
+    """
+    time = np.asarray(time, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if t_end is None:
+        t_end = time[-1]
+    result = {}
+    result["nadir"], result["nadir_time"] = nadir(time, values, t_event, t_end)
+    result["peak_deviation"], result["peak_time"] = peak_deviation(time, values, t_event, t_end)
+    result["rocof"] = rocof(time, values, t_event, t_end, rocof_window)
+    result["settling_time"] = settling_time(time, values, t_event, t_end, final_window=final_window)
+    result["steady_state_deviation"] = steady_state_deviation(time, values, t_event, t_end, final_window)
+    if t_end - t_event > ringdown_delay + 1.0:
+        result["frequency"], result["damping"] = ringdown(time, values, t_event + ringdown_delay, t_end,
+                                                          window=ringdown_window)
+    else:  # Window too short for a mode estimate
+        result["frequency"] = result["damping"] = np.full(values.shape[:-1], np.nan)
+    return result
+
+
+def run_table(time, data, channels, events_overview, end_time=None, **options):
+    """
+        Indicators of one run as a table with one row per (event, channel).
+        Every event is looked at until the next event time (or end_time).
+        angle_separation is the largest spread of all ANGLE channels in the event window, on the ANGLE rows
+        (NaN on the others).
+        Input:
+            time, data: time axis and (channels, time) data, ex. ChannelFile.time and ChannelFile.data.T
+            channels: channel metadata (ChannelRegistry.channels), row k of data is channel channels[k]["index"]
+            events_overview: list of (time, type, bus, extras) of the case
+            options: passed on to compute
+        Output:
+            numpy structured array, fields as in _TABLE_FIELDS
+    """
+    time = np.asarray(time, dtype=float)
+    data = np.asarray(data, dtype=float)
+    if end_time is None:
+        end_time = time[-1]
+    quantities = [c["quantity"] for c in channels]
+    angle_rows = np.array([q == "ANGLE" for q in quantities], dtype=bool)
+    frequency_rows = np.array([q in FREQUENCY_QUANTITIES for q in quantities], dtype=bool)
+    if np.any(frequency_rows):  # Frequencies in Hz, without changing data
+        data = data.copy()
+        data[frequency_rows] = NOMINAL_FREQUENCY * (1.0 + data[frequency_rows])
+
+    times = [t for t in event_times(events_overview) if t < end_time]
+    table = np.zeros(len(times) * len(channels), dtype=_TABLE_FIELDS)
+    for k, t_event in enumerate(times):
+        t_end = times[k + 1] if k + 1 < len(times) else end_time
+        result = compute(time, data, t_event, t_end, **options)
+        rows = table[k * len(channels):(k + 1) * len(channels)]
+        rows["event_time"] = t_event
+        rows["channel"] = [c["index"] for c in channels]
+        rows["quantity"] = quantities
+        rows["bus"] = [c["bus"] if c["bus"] is not None else -1 for c in channels]
+        for name, values in result.items():
+            rows[name] = values
+        rows["angle_separation"] = np.nan
+        if np.any(angle_rows):
+            rows["angle_separation"][angle_rows] = angle_separation(time, data[angle_rows], t_event, t_end)[0]
+    return table
+
+
+def run_summary(table, time=None, angles=None):
+    """
+        One line per run for ranking scenarios: the worst value of each indicator over all events.
+        Input:
+            table: result of run_table
+            time, angles: optional time axis and (machines, time) ANGLE data for the angle separation over the
+                          whole run, None = the largest of the table's angle_separation
+        Output:
+            dictionary indicator -> value
+    """
+    frequency_rows = np.isin(table["quantity"], FREQUENCY_QUANTITIES)
+    summary = {"events": len(np.unique(table["event_time"]))}
+    with np.errstate(invalid="ignore"):
+        if np.any(frequency_rows):
+            f = table[frequency_rows]
+            summary["frequency_nadir"] = float(f["nadir"].min())
+            summary["frequency_peak_deviation"] = float(f["peak_deviation"][np.argmax(np.abs(f["peak_deviation"]))])
+            summary["max_rocof"] = float(np.nanmax(np.abs(f["rocof"]))) if np.any(np.isfinite(f["rocof"])) else np.nan
+            summary["steady_state_deviation"] = _largest(f["steady_state_deviation"])
+        settling = table["settling_time"]
+        summary["settling_time"] = np.inf if np.any(np.isnan(settling)) else float(settling.max(initial=0.0))
+        damping = table["damping"][np.isfinite(table["damping"])]
+        summary["min_damping"] = float(damping.min()) if len(damping) else np.nan
+        if len(damping):
+            summary["mode_frequency"] = float(table["frequency"][np.isfinite(table["damping"])][np.argmin(damping)])
+    if angles is not None:
+        summary["angle_separation"] = float(angle_separation(np.asarray(time), np.asarray(angles), time[0])[0])
+    elif np.any(np.isfinite(table["angle_separation"])):
+        summary["angle_separation"] = float(np.nanmax(table["angle_separation"]))
+    return summary
+
+
+# Private functions
+def _rows(time, t_start, t_end):
+    # Sample rows of [t_start, t_end], including both samples PSS/E writes at an event time
+    first = int(np.searchsorted(time, t_start, side="left"))
+    last = len(time) if t_end is None else int(np.searchsorted(time, t_end, side="right"))
+    if last <= first:
+        raise ValueError("No samples between %g and %s s" % (t_start, t_end))
+    return first, last
+
+
+def _largest(values):
+    # Value with the largest magnitude, with its sign, NaN if there is none
+    finite = values[np.isfinite(values)]
+    return float(finite[np.argmax(np.abs(finite))]) if len(finite) else np.nan
+
+
+def _final_value(time, values, t_end, final_window):
+    last = len(time) if t_end is None else int(np.searchsorted(time, t_end, side="right"))
+    t_last = time[last - 1]
+    first = min(int(np.searchsorted(time, t_last - final_window, side="left")), last - 1)
+    return values[..., first:last].mean(axis=-1)
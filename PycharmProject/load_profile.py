@@ -0,0 +1,150 @@
+# Standard Python-packages
+import csv
+import math
+import numpy as np
+
+# PSSPY-related packages
+import psspy
+
+# Custom packages
+import events
+
+
+_i = psspy.getdefaultint()
+_f = psspy.getdefaultreal()
+
+
+class LoadProfile(object):
+    """Active power (MW) per bus over time, total of all loads at the bus. HVDC buses are loads as well"""
+    def __init__(self, buses):
+        self.buses = np.asarray(buses, dtype=int)
+
+    # Public functions
+    def values_at(self, time):
+        # Array with the value of every bus at time (last sample at or before time), None before the first sample
+        raise NotImplementedError
+    def rewind(self):
+        # Start from the first sample again, for profiles that are read forward only
+        pass
+
+
+class ArrayProfile(LoadProfile):
+    """Profile matrix of shape buses x time with a fixed sample period, ex. a memory-mapped .npy file"""
+    def __init__(self, buses, values, start=0.0, period=0.1):
+        LoadProfile.__init__(self, buses)
+        if values.ndim != 2 or values.shape[0] != len(self.buses):
+            raise ValueError("Profile must be buses x time, got shape %r for %d buses" % (values.shape, len(self.buses)))
+        if period <= 0.0:
+            raise ValueError("Sample period must be positive, got %g" % period)
+        self.values = values
+        self.start = float(start)
+        self.period = float(period)
+
+    @classmethod
+    def from_npy(cls, path, buses, start=0.0, period=0.1):
+        # The file is mapped, only the columns that are used are read from disk
+        # A Fortran-ordered (time-major) file gives contiguous columns
+        return cls(buses, np.load(path, mmap_mode="r"), start, period)
+    def values_at(self, time):
+        if time < self.start - 1e-9:
+            return None
+        sample = int(math.floor((time - self.start) / self.period + 1e-9))
+        sample = min(sample, self.values.shape[1] - 1)  # Hold the last value after the end of the profile
+        return np.array(self.values[:, sample], dtype=float)
+
+
+class CsvProfile(LoadProfile):
+    """
+        Profile read row by row from a CSV file, only the present row is kept in memory.
+        Layout: header "time,<bus>,<bus>,...", then one row per sample with increasing time.
+        Times must be asked for in increasing order, as the dynamic simulation does.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path)
+        self._reader = csv.reader(self._file)
+        header = next(self._reader)
+        if header[0].strip().lower() != "time":
+            raise ValueError("First column of %s must be time" % path)
+        LoadProfile.__init__(self, [int(bus) for bus in header[1:]])
+        self._present = None  # (time, values) of the last row at or before the asked time
+        self._next = self._read_row()
+
+    # Public functions
+    def values_at(self, time):
+        while self._next is not None and self._next[0] <= time + 1e-9:
+            self._present = self._next
+            self._next = self._read_row()
+        if self._present is None:
+            return None
+        return self._present[1]
+    def rewind(self):
+        self.close()
+        self.__init__(self.path)
+    def close(self):
+        self._file.close()
+
+    # Private functions
+    def _read_row(self):
+        for row in self._reader:
+            if not row or not row[0].strip():  # Empty line
+                continue
+            values = np.array([float(value) for value in row], dtype=float)
+            if len(values) != len(self.buses) + 1:
+                raise ValueError("Row at time %s of %s has %d values, expected %d" % (row[0], self.path,
+                                                                                    len(values) - 1, len(self.buses)))
+            return values[0], values[1:]
+        return None
+
+
+class ProfileEvent(events.RecurringEvent):
+    """Apply a LoadProfile every segment seconds of the dynamic simulation, all buses in one batch"""
+    def __init__(self, profile, segment=0.1, start=0.0, end=None, tolerance=1e-3):
+        """
+            Input:
+                profile: LoadProfile
+                segment: time between updates (s), the simulation is run in segments of this length
+                start, end: first and last update (s), end None = until the end of the simulation
+                tolerance: loads that change less than this (MW) are not sent to PSS/E
+        """
+        events.RecurringEvent.__init__(self, start, segment, self._apply, end=end)
+        self.profile = profile
+        self.tolerance = tolerance
+        self.changes = 0  # Number of load_chng_4 calls of the last run
+
+    # Private functions
+    def _build_index(self, case):
+        # Every load at the profile buses, read once from the snapshot at the start of the run
+        rows, counts = [], []
+        for bus in self.profile.buses:
+            bus_rows = case.network.load_rows(bus)
+            if not bus_rows:
+                raise ValueError("No in-service load at bus %d of the profile" % bus)
+            rows.extend(bus_rows)
+            counts.append(len(bus_rows))
+        self._load_buses = case.network.get("load", "NUMBER")[rows].tolist()
+        self._load_ids = [load_id.strip() for load_id in case.network.get("load", "ID")[rows]]
+        self._base = case.network.get("load", "MVAACT")[rows].real
+        self._counts = np.array(counts)
+        self._base_total = np.bincount(np.repeat(np.arange(len(counts)), counts), weights=self._base,
+                                       minlength=len(counts))
+        self._present = self._base.copy()  # What PSS/E has now, so unchanged loads can be skipped
+    def _apply(self, case, time, occurrence):
+        if occurrence == 0:
+            self.profile.rewind()
+            self._build_index(case)
+            self.changes = 0
+        values = self.profile.values_at(time)
+        if values is None:
+            return
+
+        # The difference to the starting total of a bus is split evenly over its loads, as _exec_load_step does
+        new = self._base + np.repeat((values - self._base_total) / self._counts, self._counts)
+        changed = np.nonzero(np.abs(new - self._present) > self.tolerance)[0]
+        for k in changed:
+            psspy.load_chng_4(self._load_buses[k], self._load_ids[k], [_i, _i, _i, _i, _i, _i],
+                              [float(new[k]), _f, _f, _f, _f, _f])
+        if len(changed):
+            self._present[changed] = new[changed]
+            case.network.invalidate(["load"])  # Once per batch instead of a write-through per load
+            self.changes += len(changed)
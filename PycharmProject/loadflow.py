@@ -0,0 +1,330 @@
+# Standard Python-packages
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+# Custom packages
+import dispatch
+
+
+# Arrays describing a network, all of them are needed to build a LoadFlow
+_NETWORK_FIELDS = (
+    "bus_numbers", "bus_types", "bus_areas", "base_kv", "vm", "va",  # va in degrees, types as in PSS/E (3 = swing)
+    "shunts",  # Complex bus shunt (MW + jMvar at 1 p.u.)
+    "branch_from", "branch_to", "branch_r", "branch_x", "branch_b",  # p.u. on system base
+    "branch_ratio", "branch_shift",  # Off-nominal ratio (1.0 for lines) and phase shift (degrees)
+    "load_buses", "load_power",  # Complex load (MW + jMvar)
+    "machine_buses", "machine_pgen", "machine_qgen", "machine_pmax", "machine_pmin")
+
+# Branch arrays a network can do without, filled with these values when missing (ex. networks saved before)
+_OPTIONAL_FIELDS = {"branch_ids": "1", "branch_rating": 0.0}  # Circuit ID and RATEA (MVA, 0 = no rating)
+
+
+class NetworkData(object):
+    """Bus, branch, load and machine arrays of a case, can be exported from PSS/E and used without it"""
+    # Constructor
+    def __init__(self, sbase=100.0, **arrays):
+        missing = [field for field in _NETWORK_FIELDS if field not in arrays]
+        if missing:
+            raise ValueError("Missing network arrays: " + ", ".join(missing))
+        self.sbase = float(sbase)
+        for field in _NETWORK_FIELDS:
+            setattr(self, field, np.asarray(arrays[field]))
+        for field, default in _OPTIONAL_FIELDS.items():
+            setattr(self, field, np.asarray(arrays[field]) if field in arrays
+                    else np.full(len(self.branch_from), default))
+
+    # Public functions
+    @classmethod
+    def from_psspy(cls):
+        # Read the in-service network of the case loaded in PSS/E (lines and two-winding transformers)
+        import psspy
+
+        def column(function, *args):
+            return np.array(function(*args)[1][0])
+
+        bus_numbers = column(psspy.abusint, -1, 1, "NUMBER")
+        line_rx = column(psspy.abrncplx, -1, 1, 1, 1, 1, "RX")
+        trf_rx = column(psspy.atrncplx, -1, 1, 1, 1, 1, "RXACT")
+        n_trf = len(trf_rx)
+        return cls(sbase=psspy.sysmva(),
+                   bus_numbers=bus_numbers,
+                   bus_types=column(psspy.abusint, -1, 1, "TYPE"),
+                   bus_areas=column(psspy.abusint, -1, 1, "AREA"),
+                   base_kv=column(psspy.abusreal, -1, 1, "BASE"),
+                   vm=column(psspy.abusreal, -1, 1, "PU"),
+                   va=column(psspy.abusreal, -1, 1, "ANGLED"),
+                   shunts=column(psspy.abuscplx, -1, 1, "SHUNTACT"),
+                   branch_from=np.concatenate((column(psspy.abrnint, -1, 1, 1, 1, 1, "FROMNUMBER"),
+                                               column(psspy.atrnint, -1, 1, 1, 1, 1, "FROMNUMBER"))),
+                   branch_to=np.concatenate((column(psspy.abrnint, -1, 1, 1, 1, 1, "TONUMBER"),
+                                             column(psspy.atrnint, -1, 1, 1, 1, 1, "TONUMBER"))),
+                   branch_r=np.concatenate((line_rx.real, trf_rx.real)),
+                   branch_x=np.concatenate((line_rx.imag, trf_rx.imag)),
+                   branch_b=np.concatenate((column(psspy.abrnreal, -1, 1, 1, 1, 1, "CHARGING"), np.zeros(n_trf))),
+                   branch_ratio=np.concatenate((np.ones(len(line_rx)), column(psspy.atrnreal, -1, 1, 1, 1, 1, "RATIO"))),
+                   branch_shift=np.concatenate((np.zeros(len(line_rx)), column(psspy.atrnreal, -1, 1, 1, 1, 1, "ANGLE"))),
+                   branch_ids=np.array([str(ckt).strip() for ckt in
+                                        np.concatenate((column(psspy.abrnchar, -1, 1, 1, 1, 1, "ID"),
+                                                        column(psspy.atrnchar, -1, 1, 1, 1, 1, "ID")))]),
+                   branch_rating=np.concatenate((column(psspy.abrnreal, -1, 1, 1, 1, 1, "RATEA"),
+                                                 column(psspy.atrnreal, -1, 1, 1, 1, 1, "RATEA"))),
+                   load_buses=column(psspy.aloadint, -1, 1, "NUMBER"),
+                   load_power=column(psspy.aloadcplx, -1, 1, "TOTALACT"),
+                   machine_buses=column(psspy.amachint, -1, 1, "NUMBER"),
+                   machine_pgen=column(psspy.amachreal, -1, 1, "PGEN"),
+                   machine_qgen=column(psspy.amachreal, -1, 1, "QGEN"),
+                   machine_pmax=column(psspy.amachreal, -1, 1, "PMAX"),
+                   machine_pmin=column(psspy.amachreal, -1, 1, "PMIN"))
+    def save(self, path):
+        np.savez(path, sbase=self.sbase, **self._arrays())
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            values = dict((field, arrays[field]) for field in arrays.files)
+        return cls(**values)
+    def copy(self, **changes):
+        # Independent copy with some arrays replaced, ex. copy(machine_pgen=pgen)
+        arrays = dict((field, values.copy()) for field, values in self._arrays().items())
+        arrays.update(changes)
+        return NetworkData(self.sbase, **arrays)
+
+    # Private functions
+    def _arrays(self):
+        fields = _NETWORK_FIELDS + tuple(sorted(_OPTIONAL_FIELDS))
+        return dict((field, getattr(self, field)) for field in fields)
+
+
+class LoadFlowResult(object):
+    """Voltages and convergence information of one (or a batch of) load flow solution(s)"""
+    def __init__(self, converged, iterations, vm, va, mismatch):
+        self.converged = converged  # Bool, or boolean array with one entry per variant
+        self.iterations = iterations
+        self.vm = vm  # p.u., shape (buses,) or (buses, variants)
+        self.va = va  # degrees
+        self.mismatch = mismatch  # Largest power mismatch (p.u.) per solution
+
+    def __repr__(self):
+        return "LoadFlowResult(converged=%s, iterations=%d)" % (np.all(self.converged), self.iterations)
+
+
+class LoadFlow(object):
+    """Sparse Newton-Raphson and fast-decoupled load flow, factorizations are kept for later solves"""
+    # Constructor
+    def __init__(self, network):
+        self.network = network
+        self.n_buses = len(network.bus_numbers)
+        types = np.asarray(network.bus_types)
+        self.ref = np.nonzero(types == 3)[0]
+        self.pv = np.nonzero(types == 2)[0]
+        self.pq = np.nonzero(types == 1)[0]
+        self.pvpq = np.concatenate((self.pv, self.pq))
+        if len(self.ref) == 0:
+            raise ValueError("The network has no swing bus (type 3)")
+
+        self._load_rows = dispatch.lookup_rows(network.bus_numbers, network.load_buses)
+        self._machine_rows = dispatch.lookup_rows(network.bus_numbers, network.machine_buses)
+        self.ybus = self._make_ybus()
+        self._bp_solver = None  # Fast-decoupled matrices, factorized on first use
+        self._bpp_solver = None
+
+    # Public functions
+    def injections(self, machine_pgen=None, load_power=None):
+        # Complex bus injections (p.u.), machine PGEN and load as in the network unless given
+        network = self.network
+        if machine_pgen is None:
+            machine_pgen = network.machine_pgen
+        if load_power is None:
+            load_power = network.load_power
+        machine_pgen = np.asarray(machine_pgen)
+        if machine_pgen.ndim == 2:  # One column per variant
+            s = np.zeros((self.n_buses, machine_pgen.shape[1]), dtype=complex)
+            np.add.at(s, self._machine_rows, machine_pgen + 1j * network.machine_qgen[:, None])
+            np.add.at(s, self._load_rows, -np.asarray(load_power)[:, None] if np.ndim(load_power) == 1
+                      else -np.asarray(load_power))
+        else:
+            s = np.zeros(self.n_buses, dtype=complex)
+            np.add.at(s, self._machine_rows, machine_pgen + 1j * network.machine_qgen)
+            np.add.at(s, self._load_rows, -np.asarray(load_power))
+        return s / network.sbase
+    def initial_voltage(self):
+        return self.network.vm * np.exp(1j * np.deg2rad(self.network.va))
+    def newton(self, s_bus=None, v0=None, tolerance=1e-5, max_iterations=20):
+        # Full Newton-Raphson in polar coordinates with a sparse Jacobian
+        s_bus = self.injections() if s_bus is None else s_bus
+        v = self.initial_voltage() if v0 is None else np.array(v0, dtype=complex)
+        vm, va = np.abs(v), np.angle(v)
+        n_pvpq = len(self.pvpq)
+
+        for iteration in range(max_iterations + 1):
+            mismatch = v * np.conj(self.ybus.dot(v)) - s_bus
+            f = np.concatenate((mismatch[self.pvpq].real, mismatch[self.pq].imag))
+            largest = np.abs(f).max() if len(f) else 0.0
+            if largest < tolerance:
+                return LoadFlowResult(True, iteration, vm, np.rad2deg(va), largest)
+            if iteration == max_iterations:
+                break
+            dx = spla.spsolve(self.jacobian(v), -f)
+            va[self.pvpq] += dx[:n_pvpq]
+            vm[self.pq] += dx[n_pvpq:]
+            v = vm * np.exp(1j * va)
+        return LoadFlowResult(False, max_iterations, vm, np.rad2deg(va), largest)
+    def fast_decoupled(self, s_bus=None, v0=None, tolerance=1e-5, max_iterations=50):
+        # XB fast-decoupled load flow, B' and B'' are factorized once per LoadFlow object
+        return self._fast_decoupled(self.injections() if s_bus is None else s_bus, v0, tolerance, max_iterations)
+    def solve_batch(self, s_variants, v0=None, method="fdxb", tolerance=1e-5, max_iterations=50):
+        """
+            Solve many injection variants at once against one set of factorized matrices.
+            Input:
+                s_variants: complex injections (p.u.), shape (buses, variants), ex. injections(pgen_matrix)
+                v0: start voltage (buses,), None = case voltages
+                method: "fdxb" (B'/B'' of the fast-decoupled method) or "chord" (Newton-Raphson Jacobian
+                        of the base case, factorized once)
+            Output:
+                LoadFlowResult with arrays of shape (buses, variants) and a converged flag per variant
+        """
+        if method == "fdxb":
+            return self._fast_decoupled(np.asarray(s_variants), v0, tolerance, max_iterations)
+        if method != "chord":
+            raise ValueError("Unknown method: " + str(method))
+
+        s_variants = np.asarray(s_variants)
+        base = self.newton(s_variants.mean(axis=1), v0)
+        v_base = base.vm * np.exp(1j * np.deg2rad(base.va))
+        solver = spla.splu(self.jacobian(v_base).tocsc())
+        vm = np.repeat(base.vm[:, None], s_variants.shape[1], axis=1)
+        va = np.repeat(np.deg2rad(base.va)[:, None], s_variants.shape[1], axis=1)
+        n_pvpq = len(self.pvpq)
+        return self._iterate_batch(s_variants, vm, va, tolerance, max_iterations,
+                                   lambda f: _split(solver.solve(f), n_pvpq))
+    def jacobian(self, v):
+        # Sparse Jacobian [dP/dVa dP/dVm; dQ/dVa dQ/dVm] for the PV/PQ angles and PQ magnitudes
+        ybus = self.ybus
+        i_bus = ybus.dot(v)
+        diag_v = sp.diags(v)
+        diag_i = sp.diags(i_bus)
+        diag_v_norm = sp.diags(v / np.abs(v))
+        ds_dvm = diag_v.dot(np.conj(ybus.dot(diag_v_norm))) + np.conj(diag_i).dot(diag_v_norm)
+        ds_dva = 1j * diag_v.dot(np.conj(diag_i - ybus.dot(diag_v)))
+
+        ds_dva = ds_dva.tocsr()
+        ds_dvm = ds_dvm.tocsr()
+        j11 = ds_dva[self.pvpq][:, self.pvpq].real
+        j12 = ds_dvm[self.pvpq][:, self.pq].real
+        j21 = ds_dva[self.pq][:, self.pvpq].imag
+        j22 = ds_dvm[self.pq][:, self.pq].imag
+        return sp.bmat([[j11, j12], [j21, j22]], format="csc")
+    def branch_flows(self, vm, va):
+        # Complex power (p.u.) into each branch at the from end
+        v = vm * np.exp(1j * np.deg2rad(va))
+        return v[self._from] * np.conj(self._yf.dot(v))
+
+    # Private functions
+    def _make_ybus(self, ignore_r=False, ignore_shunts=False, ignore_taps=False, ignore_shifts=False):
+        network = self.network
+        self._from = dispatch.lookup_rows(network.bus_numbers, network.branch_from)
+        self._to = dispatch.lookup_rows(network.bus_numbers, network.branch_to)
+        r = np.zeros(len(self._from)) if ignore_r else network.branch_r.astype(float)
+        y_series = 1.0 / (r + 1j * network.branch_x)
+        b_charging = np.zeros(len(self._from)) if ignore_shunts else network.branch_b.astype(float)
+        ratio = np.ones(len(self._from)) if ignore_taps else network.branch_ratio.astype(float)
+        shift = np.zeros(len(self._from)) if ignore_shifts else np.deg2rad(network.branch_shift.astype(float))
+        tap = ratio * np.exp(1j * shift)
+
+        y_tt = y_series + 0.5j * b_charging
+        y_ff = y_tt / (tap * np.conj(tap))
+        y_ft = -y_series / np.conj(tap)
+        y_tf = -y_series / tap
+
+        n = self.n_buses
+        shunts = np.zeros(n) if ignore_shunts else network.shunts / network.sbase
+        rows = np.concatenate((self._from, self._from, self._to, self._to, np.arange(n)))
+        cols = np.concatenate((self._from, self._to, self._from, self._to, np.arange(n)))
+        values = np.concatenate((y_ff, y_ft, y_tf, y_tt, shunts))
+        ybus = sp.csr_matrix((values, (rows, cols)), shape=(n, n))  # Parallel branches are summed
+
+        if not (ignore_r or ignore_shunts or ignore_taps or ignore_shifts):
+            m = len(self._from)
+            self._yf = sp.csr_matrix((np.concatenate((y_ff, y_ft)),
+                                      (np.concatenate((np.arange(m), np.arange(m))),
+                                       np.concatenate((self._from, self._to)))), shape=(m, n))
+        return ybus
+    def _fast_decoupled_solvers(self):
+        if self._bp_solver is None:
+            # XB version: B' without resistance, charging, shunts and taps, B'' without phase shifts
+            b_p = -self._make_ybus(ignore_r=True, ignore_shunts=True, ignore_taps=True).imag
+            b_pp = -self._make_ybus(ignore_shifts=True).imag
+            self._bp_solver = spla.splu(b_p[self.pvpq][:, self.pvpq].tocsc())
+            self._bpp_solver = spla.splu(b_pp[self.pq][:, self.pq].tocsc())
+        return self._bp_solver, self._bpp_solver
+    def _fast_decoupled(self, s_bus, v0, tolerance, max_iterations):
+        bp_solver, bpp_solver = self._fast_decoupled_solvers()
+        v = self.initial_voltage() if v0 is None else np.array(v0, dtype=complex)
+        if s_bus.ndim == 2:  # Batch: same start voltage for every variant
+            v = np.repeat(v[:, None], s_bus.shape[1], axis=1)
+        vm, va = np.abs(v), np.angle(v)
+        return self._iterate_batch(s_bus, vm, va, tolerance, max_iterations, None, (bp_solver, bpp_solver))
+    def _iterate_batch(self, s_bus, vm, va, tolerance, max_iterations, newton_step=None, fd_solvers=None):
+        # Shared iteration for single solutions (1-D) and batches (one column per variant)
+        pvpq, pq = self.pvpq, self.pq
+        batch = s_bus.ndim == 2
+        converged = np.zeros(s_bus.shape[1], dtype=bool) if batch else False
+        largest = None
+        for iteration in range(max_iterations + 1):
+            v = vm * np.exp(1j * va)
+            mismatch = v * np.conj(self.ybus.dot(v)) - s_bus
+            p_mis, q_mis = mismatch[pvpq].real, mismatch[pq].imag
+            largest = np.maximum(np.abs(p_mis).max(axis=0) if len(pvpq) else 0.0,
+                                 np.abs(q_mis).max(axis=0) if len(pq) else 0.0)
+            converged = largest < tolerance
+            if np.all(converged) or iteration == max_iterations:
+                break
+            if newton_step is not None:  # Chord iteration with a fixed Jacobian
+                d_va, d_vm = newton_step(-np.concatenate((p_mis, q_mis)))
+                va[pvpq] += d_va
+                vm[pq] += d_vm
+            else:  # Fast-decoupled half iterations
+                bp_solver, bpp_solver = fd_solvers
+                va[pvpq] -= bp_solver.solve(np.ascontiguousarray(p_mis / vm[pvpq]))
+                v = vm * np.exp(1j * va)
+                mismatch = v * np.conj(self.ybus.dot(v)) - s_bus
+                vm[pq] -= bpp_solver.solve(np.ascontiguousarray(mismatch[pq].imag / vm[pq]))
+        return LoadFlowResult(converged, iteration, vm, np.rad2deg(va), largest)
+
+
+def hvdc_candidates(network, hvdc_bus_nr, hvdc_limits):
+    """
+        Machine dispatch and bus injections for many HVDC setpoints, as set_hvdc_active_power would set them.
+        Input:
+            network: NetworkData of the case before the HVDC change
+            hvdc_bus_nr: bus with the HVDC load
+            hvdc_limits: candidate HVDC loads (MW)
+        Output:
+            (PGEN per machine and candidate (machines, candidates), complex load per load and candidate)
+    """
+    hvdc_limits = np.asarray(hvdc_limits, dtype=float)
+    load_rows = np.nonzero(network.load_buses == hvdc_bus_nr)[0]
+    hvdc_area = network.bus_areas[dispatch.lookup_rows(network.bus_numbers, [hvdc_bus_nr])[0]]
+    in_area = dispatch.machine_areas(network.machine_buses, network.bus_numbers, network.bus_areas) == hvdc_area
+
+    pgen = np.empty((len(network.machine_buses), len(hvdc_limits)))
+    loads = np.repeat(np.asarray(network.load_power, dtype=complex)[:, None], len(hvdc_limits), axis=1)
+    for k, hvdc_limit in enumerate(hvdc_limits):
+        slack_p = hvdc_limit - network.load_power[load_rows[0]].real
+        pgen[:, k] = dispatch.distribute_hvdc_slack(network.machine_pgen, network.machine_pmax, in_area, slack_p)
+        loads[load_rows[0], k] = hvdc_limit + 1j * network.load_power[load_rows[0]].imag
+    return pgen, loads
+
+
+def screen_hvdc_candidates(network, hvdc_bus_nr, hvdc_limits, vm_limits=(0.9, 1.1), method="fdxb"):
+    # Solve all HVDC candidates in one batch, a candidate passes if it converges with all voltages inside vm_limits
+    flow = LoadFlow(network)
+    pgen, loads = hvdc_candidates(network, hvdc_bus_nr, hvdc_limits)
+    result = flow.solve_batch(flow.injections(pgen, loads), method=method)
+    inside = np.all((result.vm >= vm_limits[0]) & (result.vm <= vm_limits[1]), axis=0)
+    return result.converged & inside, result
+
+
+# Private functions
+def _split(dx, n_angles):
+    return dx[:n_angles], dx[n_angles:]
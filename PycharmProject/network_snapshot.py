@@ -0,0 +1,161 @@
+# Standard Python-packages
+import numpy as np
+
+# PSSPY-related packages
+import psspy
+
+
+_i = psspy.getdefaultint()
+_f = psspy.getdefaultreal()
+_s = psspy.getdefaultchar()
+
+# Array fetched per family, one psspy call per data type with all the fields at once
+# flag = 1 everywhere: in-service elements only, as in the rest of PsspyCase
+_FAMILIES = {
+    "bus": {"prefix": "abus",
+            "int": ("NUMBER", "AREA", "TYPE"),
+            "real": ("BASE", "PU", "ANGLED")},
+    "load": {"prefix": "aload",
+             "int": ("NUMBER", "AREA"),
+             "char": ("ID",),
+             "cplx": ("MVAACT", "MVANOM")},
+    "machine": {"prefix": "amach",
+                "int": ("NUMBER",),
+                "char": ("ID",),
+                "real": ("PGEN", "QGEN", "PMAX", "PMIN")},
+    "plant": {"prefix": "agenbus",
+              "int": ("NUMBER", "AREA"),
+              "real": ("PGEN", "PMAX")},
+    "branch": {"prefix": "abrn",
+               "args": (-1, 1, 1, 1, 1),  # sid, owner, ties, flag (in-service lines), entry (each branch once)
+               "int": ("FROMNUMBER", "TONUMBER"),
+               "char": ("ID",)},
+}
+
+
+class NetworkSnapshot(object):
+    """Full-system psspy arrays fetched once and kept until one of our own mutators changes the network"""
+    # Constructor
+    def __init__(self):
+        self._arrays = {}  # Family -> field -> numpy array, a missing family is dirty
+        self._indexes = {}  # Family -> lookup dictionary, built on first use
+        self.fetches = 0  # Number of psspy array calls, to see what the cache saves
+
+    # Public functions
+    def get(self, family, field):
+        # Array of one field, ex. get("machine", "PGEN"), fetched together with the rest of its family
+        # The array is shared with the snapshot: copy it before changing it
+        if family not in self._arrays:
+            self._fetch(family)
+        return self._arrays[family][field]
+    def bus_row(self, bus_number):
+        return self._index("bus")[int(bus_number)]
+    def bus_rows(self, bus_numbers):
+        index = self._index("bus")
+        return np.array([index[int(bus)] for bus in bus_numbers], dtype=int)
+    def machine_row(self, bus_number, machine_id):
+        return self._index("machine")[(int(bus_number), str(machine_id).strip())]
+    def load_rows(self, bus_number):
+        # Rows of all in-service loads at a bus, in the order psspy returns them
+        return self._index("load").get(int(bus_number), [])
+    def invalidate(self, families=None):
+        # Forget cached arrays, all of them or only the given families
+        for family in (_FAMILIES if families is None else families):
+            self._arrays.pop(family, None)
+            self._indexes.pop(family, None)
+
+    # Mutators: call psspy and keep the snapshot consistent
+    def load_chng_4(self, bus_number, load_id, intgar, realar):
+        ierr = psspy.load_chng_4(bus_number, load_id, intgar, realar)
+        if "load" not in self._arrays:
+            return ierr
+        if intgar[0] != _i:  # Status changed, rows change
+            self.invalidate(["load"])
+            return ierr
+
+        # Constant power part is known, write it through instead of fetching all loads again
+        # MVAACT is the setpoint only until the next solution or simulation step, those invalidate the loads
+        load_id = "1" if load_id == _s else str(load_id).strip()  # PSS/E uses ID 1 when none is given
+        for row in self.load_rows(bus_number):
+            if self._arrays["load"]["ID"][row].strip() != load_id:
+                continue
+            for field in ("MVAACT", "MVANOM"):
+                value = self._arrays["load"][field][row]
+                p = value.real if realar[0] == _f else realar[0]
+                q = value.imag if len(realar) < 2 or realar[1] == _f else realar[1]
+                self._arrays["load"][field][row] = complex(p, q)
+        return ierr
+    def machine_chng_2(self, bus_number, machine_id, intgar, realar):
+        ierr = psspy.machine_chng_2(bus_number, machine_id, intgar, realar)
+        self.invalidate(["plant"])  # Plant totals follow from the machines
+        if "machine" not in self._arrays:
+            return ierr
+        if intgar[0] != _i:  # Status changed, rows change
+            self.invalidate(["machine"])
+            return ierr
+
+        row = self.machine_row(bus_number, machine_id)
+        for position, field in ((0, "PGEN"), (1, "QGEN"), (4, "PMAX"), (5, "PMIN")):
+            if realar[position] != _f:
+                self._arrays["machine"][field][row] = realar[position]
+        return ierr
+    def bus_data_3(self, *args):
+        ierr = psspy.bus_data_3(*args)
+        self.invalidate()
+        return ierr
+    def load_data_4(self, *args):
+        ierr = psspy.load_data_4(*args)
+        self.invalidate(["load"])
+        return ierr
+    def branch_data(self, *args):
+        ierr = psspy.branch_data(*args)
+        self.invalidate()
+        return ierr
+    def branch_chng(self, *args):
+        ierr = psspy.branch_chng(*args)
+        self.invalidate()
+        return ierr
+    def fdns(self, options):
+        # A solved load flow changes voltages, slack generation and voltage dependent loads
+        ierr = psspy.fdns(options)
+        self.invalidate()
+        return ierr
+
+    # Private functions
+    def _fetch(self, family):
+        description = _FAMILIES[family]
+        arrays = {}
+        for kind in ("int", "real", "cplx", "char"):
+            fields = description.get(kind)
+            if not fields:
+                continue
+            function = getattr(psspy, description["prefix"] + kind)
+            values = function(*(description.get("args", (-1, 1)) + (list(fields),)))[1]
+            self.fetches += 1
+            for field, column in zip(fields, values):
+                if kind == "char":
+                    arrays[field] = np.array(column, dtype=object)
+                elif kind == "cplx":
+                    arrays[field] = np.array(column, dtype=complex)
+                elif kind == "real":
+                    arrays[field] = np.array(column, dtype=float)
+                else:
+                    arrays[field] = np.array(column, dtype=int)
+        self._arrays[family] = arrays
+        self._indexes.pop(family, None)
+    def _index(self, family):
+        if family not in self._indexes:
+            if family == "bus":
+                numbers = self.get("bus", "NUMBER").tolist()
+                self._indexes[family] = dict(zip(numbers, range(len(numbers))))
+            elif family == "machine":
+                keys = zip(self.get("machine", "NUMBER").tolist(), [i.strip() for i in self.get("machine", "ID")])
+                self._indexes[family] = dict((key, row) for row, key in enumerate(keys))
+            elif family == "load":
+                rows = {}
+                for row, bus in enumerate(self.get("load", "NUMBER").tolist()):
+                    rows.setdefault(bus, []).append(row)
+                self._indexes[family] = rows
+            else:
+                raise KeyError("No index for " + family)
+        return self._indexes[family]
@@ -0,0 +1,239 @@
+# Standard Python-packages
+import os
+import multiprocessing
+import numpy as np
+from matplotlib.figure import Figure  # Figures without pyplot: no GUI, safe in worker processes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Custom packages
+from channel_reader import ChannelFile, read_registry, channel_label, channels_from_ids, channels_from_monitor
+
+
+YLABELS = {
+    # Machine quantities
+    "ANGLE": "Angle (deg)",
+    "PELEC": "Active power (p.u.)",
+    "QELEC": "Reactive power (p.u.)",
+    "ETERM": "Terminal voltage (p.u.)",
+    "EFD": "UNDEFINED YLABEL",
+    "PMECH": "Mechanical power (p.u.)",
+    "SPEED": "Rotor speed (p.u.)",
+    "XADIFD": "UNDEFINED YLABEL",
+    "ECOMP": "UNDEFINED YLABEL",
+    "VOTHSG": "UNDEFINED YLABEL",
+    "VREF": "Reference voltage (p.u)",
+    "VUELL": "UNDEFINED YLABEL",
+    "VOEL": "UNDEFINED YLABEL",
+    "GREF": "UNDEFINED YLABEL",
+    "LCREF": "UNDEFINED YLABEL",
+    "WVLCTY": "UNDEFINED YLABEL",
+    "WTRBSP": "UNDEFINED YLABEL",
+    "WPITCH": "UNDEFINED YLABEL",
+    "WAEROT": "UNDEFINED YLABEL",
+    "WROTRV": "UNDEFINED YLABEL",
+    "WROTRI": "UNDEFINED YLABEL",
+    "WPCMND": "UNDEFINED YLABEL",
+    "WQCMND": "UNDEFINED YLABEL",
+
+    # Bus quantities
+    "FREQ": "Frequency deviation (p.u.)",
+    "VOLT": "Voltage (p.u.)",
+
+    # Branch quantities
+    "PBRANCH": "Active power flow (MW)",
+    "QBRANCH": "Reactive power flow (Mvar)"
+}
+
+
+def _speed_to_hz(values):
+    return 50.0 + 50.0 * values  # SPEED is the deviation from 50 Hz in p.u.
+
+
+# Quantity -> (conversion returning a new array, ylabel after conversion)
+CONVERSIONS = {"SPEED": (_speed_to_hz, "Frequency (Hz)"),
+               "FREQ": (_speed_to_hz, "Frequency (Hz)")}
+
+
+def convert(quantity, values):
+    # Plotted values and ylabel of a channel, values itself is never changed
+    if quantity in CONVERSIONS:
+        function, ylabel = CONVERSIONS[quantity]
+        return function(np.asarray(values, dtype=float)), ylabel
+    return values, YLABELS.get(quantity, quantity)
+
+
+def decimate_minmax(time, values, bins):
+    """
+        Keep the smallest and the largest sample of each of bins equal time intervals, in time order.
+        Peaks survive at any zoom level, which is what a line drawn at this pixel width can show anyway.
+        Works for uneven time steps.
+        Output:
+            (time, values) with at most 2 * bins + 2 samples
+    """
+    time = np.asarray(time)
+    values = np.asarray(values)
+    n = len(values)
+    if n <= 2 * bins + 2 or time[-1] <= time[0]:
+        return time, values
+    bin_of_sample = ((time - time[0]) * (bins / float(time[-1] - time[0]))).astype(int)
+    bin_of_sample = np.minimum(bin_of_sample, bins - 1)
+    order = np.lexsort((values, bin_of_sample))  # By bin, then by value: first of a bin is its min, last its max
+    sorted_bins = bin_of_sample[order]
+    new_bin = sorted_bins[1:] != sorted_bins[:-1]
+    first = np.concatenate(([True], new_bin))
+    last = np.concatenate((new_bin, [True]))
+    keep = np.unique(np.concatenate(([0], order[first], order[last], [n - 1])))
+    return time[keep], values[keep]
+
+
+def decimate_lttb(time, values, points):
+    """
+        Largest-Triangle-Three-Buckets: points samples that keep the visual shape of the trace.
+        Output:
+            (time, values) with points samples, first and last sample included
+    """
+    time = np.asarray(time, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= points or points < 3:
+        return time, values
+    edges = np.linspace(1, n - 1, points - 1).astype(int)  # Buckets between the fixed first and last sample
+    keep = np.zeros(points, dtype=int)
+    keep[-1] = n - 1
+    for k in range(points - 2):
+        start, end = edges[k], edges[k + 1]
+        if k + 2 < len(edges):  # Average of the next bucket is the third corner of the triangle
+            next_t = time[end:edges[k + 2]].mean()
+            next_v = values[end:edges[k + 2]].mean()
+        else:
+            next_t, next_v = time[-1], values[-1]
+        a = keep[k]
+        area = np.abs((time[a] - next_t) * (values[start:end] - values[a]) -
+                      (time[a] - time[start:end]) * (next_v - values[a]))
+        keep[k + 1] = start + int(np.argmax(area))
+    return time[keep], values[keep]
+
+
+def decimate(time, values, width, method="minmax"):
+    # Decimate a trace to the pixel width of the plot, method "minmax", "lttb" or None for all samples
+    if method == "minmax":
+        return decimate_minmax(time, values, width)
+    elif method == "lttb":
+        return decimate_lttb(time, values, 2 * width)
+    elif method is None:
+        return time, values
+    raise ValueError("Unknown decimation method: " + str(method))
+
+
+def draw_quantity(figure, time, traces, quantity, legend, width, method="minmax"):
+    """
+        Draw all channels of one quantity into figure, after unit conversion and decimation.
+        Input:
+            figure: matplotlib figure, from pyplot or Figure()
+            time: time array of the run
+            traces: list of channel arrays, they are not changed
+            quantity: quantity name, ex. "SPEED"
+            legend: one label per trace
+            width: plot width (pixels), sets the decimation
+    """
+    axes = figure.add_subplot(111)
+    ylabel = YLABELS.get(quantity, quantity)
+    for values in traces:
+        values, ylabel = convert(quantity, values)
+        axes.plot(*decimate(time, values, width, method))
+    axes.set_xlabel("Time (s)")
+    axes.set_ylabel(ylabel)
+    axes.legend(legend)
+    axes.grid()
+    return axes
+
+
+def channel_groups(channels):
+    # [(quantity, channel indices, legend)], one entry per quantity in the order of the channels
+    groups = []
+    for channel in channels:
+        for group in groups:
+            if group[0] == channel["quantity"]:
+                break
+        else:
+            group = (channel["quantity"], [], [])
+            groups.append(group)
+        group[1].append(channel["index"])
+        group[2].append(channel_label(channel))
+    return groups
+
+
+def plot_run(out_file, plot_dir, channels=None, name=None, width=1200, height=800, dpi=100,
+             method="minmax", image_format="png"):
+    """
+        Save one figure per monitored quantity of a run, off-screen.
+        Input:
+            out_file: .out file of the run
+            plot_dir: folder for the figures, created if missing
+            channels: ChannelRegistry, its list of channel metadata or a machine_monitor table,
+                      None = the registry saved with the run, or else the channel identifiers in the file
+            name: added to the file names, None = name of the .out file
+            width, height: figure size (pixels)
+            method: decimation, "minmax", "lttb" or None
+        Output:
+            list of the saved files
+    """
+    if not os.path.isdir(plot_dir):
+        try:
+            os.makedirs(plot_dir)
+        except OSError:  # Made by another worker in the meantime
+            pass
+    channel_file = ChannelFile(out_file)
+    if name is None:
+        name = os.path.splitext(os.path.basename(channel_file.path))[0]
+    if channels is None:
+        channels = read_registry(channel_file.path) or channels_from_ids(channel_file)
+    elif hasattr(channels, "channels"):  # ChannelRegistry
+        channels = channels.channels
+    elif isinstance(channels, np.ndarray):
+        channels = channels_from_monitor(channels)
+
+    files = []
+    try:
+        for quantity, indices, legend in channel_groups(channels):
+            traces = [channel_file.channel(index) for index in indices]
+            figure = Figure(figsize=(width / float(dpi), height / float(dpi)), dpi=dpi)
+            FigureCanvasAgg(figure)
+            draw_quantity(figure, channel_file.time, traces, quantity, legend, width, method)
+            path = os.path.join(plot_dir, quantity + "_" + name + "." + image_format)
+            figure.savefig(path)
+            files.append(path)
+    finally:
+        channel_file.close()
+    return files
+
+
+def plot_runs(runs, plot_dir, processes=None, **options):
+    """
+        Plot many runs on a pool of worker processes, one figure per quantity per run.
+        Input:
+            runs: list of .out files, or of (out_file, channels, name) tuples
+            plot_dir: folder for all figures
+            processes: number of workers, None = number of cores
+            options: passed on to plot_run, ex. width=1600, method="lttb"
+        Output:
+            list with the saved files of each run, in the order of runs
+        Scripts calling this on Windows must be guarded with if __name__ == "__main__".
+    """
+    jobs = []
+    for run in runs:
+        if not isinstance(run, (list, tuple)):
+            run = (run, None, None)
+        jobs.append((run[0], plot_dir, run[1], run[2], options))
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_plot_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# Private functions
+def _plot_job(job):
+    out_file, plot_dir, channels, name, options = job
+    return plot_run(out_file, plot_dir, channels, name, **options)
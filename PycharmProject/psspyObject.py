@@ -1,16 +1,25 @@
 
 # Standard Python-packages
 import os
-import matplotlib.pyplot as plt
+import json
+import hashlib
 import numpy as np
 
 # PSSPY-related packages
 import psspy
-import dyntools
 import redirect
 
 # Custom packages
 # from psse_models import load_models
+# matplotlib (plotting) and dyntools are imported where they are used, workers that only solve never load them
+from channel_reader import ChannelFile, channels_from_ids
+from channel_registry import ChannelRegistry
+import dispatch
+import events
+import kpi
+import load_profile
+import psspy_profiler
+from network_snapshot import NetworkSnapshot
 
 
 # Default variables for PSSPY
@@ -18,15 +27,28 @@ _i = psspy.getdefaultint()
 _f = psspy.getdefaultreal()
 _s = psspy.getdefaultchar()
 
+_DEFAULT_BUSES = 10000  # psseinit size for a case that has not been loaded before
+_SIZE_SUFFIX = ".size.json"  # Bus count of a .sav file, kept in the user cache folder when it is first loaded
+
 
 class PsspyCase(object):
     """Base class for cases"""
+    _psse_buses = 0  # Bus capacity of the PSS/E session, 0 = psseinit not called yet. Later cases reuse the session
+
     # Constructor
-    def __init__(self, output_name, input_network="Scenario1"):
+    def __init__(self, output_name, input_network="Scenario1", root_dir=None, output_dir=None, load_case=True,
+                 dynamics=True, buses=None, redirect_output=True):
         """
             Constructor for case.
             Input:
                 outputName: name of output-file
+                root_dir: folder holding "Models", None = parent of the working directory (changes directory)
+                output_dir: folder for .out/.sav results, None = root_dir
+                load_case: False to leave reading .sav/.dyr to load_case() or restore_state() (ex. CaseCache)
+                dynamics: False for a static-only case, the .dyr file is never read and dynamic runs raise ValueError
+                          With True the .dyr file is read when the dynamic simulation is first prepared
+                buses: bus capacity for psseinit, None = from the bus count of an earlier load of the case
+                redirect_output: False to leave the PSS/E output where it is, saves the redirect in short workers
         """
 
         self.output_name = output_name  # For naming of plots and output
@@ -36,13 +58,15 @@ class PsspyCase(object):
         self.filename = ""
 
         # Move this self.filename line to the function for setting max hvdc error, refresh every time bus is added
-        redirect.psse2py()  # Redirect the PSS/E output to the terminal
         psspy.throwPsseExceptions = True
 
         # Files and folders
-        os.chdir("..")
-        cwd = os.getcwd()  # Get the current directory
-        models = os.path.join(cwd, "Models")  # Name of the folder with the models
+        if root_dir is None:  # Scripts are started from PycharmProject, work from the folder above
+            os.chdir("..")
+            root_dir = os.getcwd()  # Get the current directory
+        self.root_dir = root_dir
+        self.output_dir = root_dir if output_dir is None else output_dir
+        models = os.path.join(root_dir, "Models")  # Name of the folder with the models
 
         self.input_network = input_network
         self.casefile = os.path.join(models, input_network + ".sav")  # Static network data
@@ -51,318 +75,190 @@ class PsspyCase(object):
         self.input_network = input_network
 
         self.events_overview = []  # For dynamic events, 1st column time, 2nd column type of fault, 3rd param bus nr
+        self.events = events.EventScheduler()  # Typed events of the dynamic simulation, fired in time order
+        self.sampling = None  # events.SamplingPolicy for the output density, None = fixed nplt
+        self.stop_monitor = None  # events.StopMonitor to end runs early, None = always run to end_time
+        self.stop_reason = None  # Why the last run ended before end_time, None = it reached end_time
+        self.stop_time = None  # Time the last run ended (s)
+        self.network = NetworkSnapshot()  # Cached psspy arrays, all network changes go through it
+        self.channels = ChannelRegistry(self.network)  # Monitored channels and their metadata
+        self.dynamics = dynamics
+        self._dynamics_loaded = False  # .dyr file read into the present PSS/E case
 
         # Initialize case
         # * Why are these initializations not in local scope?
         #   -> Because they are part of constructor?
         # * How do the other member functions access the psspy case?
-        psspy.psseinit(10000)
-        psspy.case(self.casefile)  # Read in the power flow data
-        psspy.dyre_new([1, 1, 1, 1], self.dyrfile, "", "", "")
+        if PsspyCase._psse_buses == 0 and redirect_output:
+            redirect.psse2py()  # Redirect the PSS/E output to the terminal
+        if buses is None:
+            buses = self._case_buses()
+        if buses > PsspyCase._psse_buses:  # Only a larger case needs psseinit again, nothing is loaded yet
+            psspy.psseinit(buses)
+            PsspyCase._psse_buses = buses
+        if load_case:
+            self.load_case()
 
     # Public functions
+    def load_case(self):
+        psspy.case(self.casefile)  # Read in the power flow data
+        self._dynamics_loaded = False  # The .dyr file is read by _load_dynamics, static studies never need it
+        self.network.invalidate()
+        self._store_case_buses()
+    def save_state(self, casefile, snapfile):
+        # Store the solved, converted network and the dynamics data (after prepare_dynamic_simulation)
+        psspy.save(casefile)
+        psspy.snap([-1, -1, -1, -1, -1], snapfile)
+    def restore_state(self, casefile, snapfile, hvdc_bus_nrs=(), hvdc_limits=(), time_step=0.005):
+        # Continue from a state written by save_state, instead of load_case + HVDC setup + load conversion
+        # Raises ValueError if PSS/E cannot read the files, ex. a cache entry removed by another worker
+        ierr = psspy.case(casefile)
+        if ierr == 0:
+            ierr = psspy.rstr(snapfile)
+        if ierr != 0:
+            raise ValueError("Could not restore %s / %s, PSS/E error %d" % (casefile, snapfile, ierr))
+        self._dynamics_loaded = True  # The snapshot holds the dynamics data
+        self.network.invalidate()
+        self.hvdc_bus_nrs = list(hvdc_bus_nrs)
+        self.hvdc_limits = list(hvdc_limits)
+        if self.hvdc_bus_nrs:
+            self._update_filename()
+        self._set_dynamics_parameters(time_step)
     def set_hvdc_active_power(self, hvdc_bus_nr=5610, hvdc_limit=1400):
-
+        # Set the HVDC load to hvdc_limit and cover the change with the machines, area of the HVDC bus first
+        # Returns the new PGEN of every in-service machine (order of psspy.amachreal)
 
         # Define bus number and read load at this bus
         self.hvdc_bus_nrs.append(hvdc_bus_nr)  # PSS/E bus number
         self.hvdc_limits.append(hvdc_limit)  # Maximum capacity of this HVDC link
-        buses_str = ""
-        for i in range(len(self.hvdc_bus_nrs)):
-            buses_str = buses_str + "_" + str(self.hvdc_bus_nrs[i])
-        self.filename = "limited_buses" + str(buses_str) + "_" + self.input_network + "_" + self.output_name
+        self._update_filename()
 
         # Read the load at the HVDC bus
-        load_p = np.array(psspy.aloadcplx(-1, 1, "MVAACT")[1][
-                             0])  # Actual MVA (MVAACT) and Nominal MVA (MVANOM) seem to give same value
-        load_numbers = np.array(psspy.aloadint(-1, 1, "NUMBER")[1][0])  # Load all bus numbers
-        load_p = load_p[
-            np.where(load_numbers == hvdc_bus_nr)[0][0]]  # load_p now has the value of the load at hvdc bus before adjustment
+        load_p = self.network.get("load", "MVAACT")  # Actual MVA (MVAACT) and Nominal MVA (MVANOM) seem to give same value
+        load_p = load_p[self.network.load_rows(hvdc_bus_nr)[0]]  # load_p now has the value of the load at hvdc bus before adjustment
 
         # Set cable to max export
-        psspy.load_chng_4(hvdc_bus_nr, _s, [_i, _i, _i, _i, _i, _i],
+        self.network.load_chng_4(hvdc_bus_nr, _s, [_i, _i, _i, _i, _i, _i],
                           [hvdc_limit, _f, _f, _f, _f, _f])
 
         # The generation necessary for increased export or import at the cable is distributed over available capacity in the system
         # This is so the slack bus doesn't have to adjust too much
         slack_p = hvdc_limit - load_p  # Warning: load_p is a complex value
         slack_p = slack_p.real  # Convert to real value, no longer complex as
-        increase_gen = slack_p > 0.0  # Bool
-
-
-        # Area of the HVDC bus
-        bus_numbers = np.array(psspy.abusint(-1, 1, "NUMBER")[1][0])  # Get all bus numbers
-        bus_areas = np.array(psspy.abusint(-1, 1, "AREA")[1][0])
-        hvdc_bus_area = bus_areas[
-            np.where(bus_numbers == hvdc_bus_nr)[0][0]]  # Use bus numbers to index for the area of HVDC bus
-
-        if increase_gen:  # If we want to increase generation due to increased export
-            # Find generation capacity of this specific area
-            area_buses = np.array(psspy.agenbusint(-1, 1, "AREA")[1][0])
-            indices = np.where(area_buses == hvdc_bus_area)[0]
-            sys_gen = np.array(psspy.agenbusreal(-1, 1, "PGEN")[1][0])  # Extract active power generation of all plants
-            area_gen = sys_gen[indices]  # Only include area of hvdc bus
-            sys_gen_cap = np.array(psspy.agenbusreal(-1, 1, "PMAX")[1][0])  # Extract generation capacity of all plants
-            area_gen_cap = sys_gen_cap[indices]
-            area_rem_gen_cap = (sum(area_gen_cap) - sum(area_gen))  # Remaining generation capacity in the HVDC area
-            sys_rem_gen_cap = (sum(sys_gen_cap)) - sum(sys_gen)
-
-            print("Bus count is: ", psspy.agenbuscount(-1, 1)[1])
-
-            # psspy.amachint can not return "AREA", thus we need a workaround using machine numbers and bus areas
-            # Find "AREA" of each machine
-            machine_numbers = np.array(psspy.amachint(-1, 1, "NUMBER")[1][0])
-            machine_areas = np.zeros(len(machine_numbers))
-            for i in range(len(machine_numbers)):
-                machine_areas[i] = bus_areas[np.where(bus_numbers == machine_numbers[i])]
-
-            indices = np.where(machine_areas == hvdc_bus_area)[0]
-            machGen = np.array(psspy.amachreal(-1, 1, "PGEN")[1][0])  # Read PGEN of machines
-            mach_gen_cap = np.array(psspy.amachreal(-1, 1, "PMAX")[1][0])  # Read PMAX of machines
-            mach_slack = mach_gen_cap - machGen  # NB: mach_slack includes ALL machines, not just the ones in HVDC area
-
-            current_machine_nr = 0  # machine_chng_2 needs both number and ID
-            machine_id = 0  # which complicates the iteration through the machines
-
-            # Distribute slack
-            if area_rem_gen_cap > slack_p:  # If true distribute slack over local area
-                slack_ratio = slack_p / area_rem_gen_cap
-                mach_slack = mach_slack * slack_ratio
-
-                # Set each generator to unique value
-                for i in indices:  # Iterate through each in-service machine and set load
-                    if current_machine_nr != machine_numbers[i]:  # new machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [machGen[i] + mach_slack[i], _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f,
-                                          _f, _f])
-
-            else:
-                # 1st set all generation to max in local area
-                for i in indices:  # Iterate through machines in local area and set max generation
-                    if current_machine_nr != machine_numbers[i]:  # new machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [mach_gen_cap[i], _f, _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f, _f])
-
-                # Recalculate slack
-                slack_p = slack_p - sum(mach_slack[indices])  # Recalculate the slack that needs to be distributed
-                sys_rem_gen_cap = sys_rem_gen_cap - sum(mach_slack[indices])  # Recalculate remaining generation capacity
-                mach_slack[indices] = 0  # Maxed generators = can't take more slack
-                slack_ratio = slack_p / sys_rem_gen_cap
-                mach_slack = mach_slack * slack_ratio
-
-                # Distribute this new slack across the rest of the system
-                machine_id = 0
-                current_machine_nr = 0
-                for i in range(len(mach_slack)):  # Increase generation of all generators in system
-                    if current_machine_nr != machine_numbers[i]:  # New machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [machGen[i] + mach_slack[i], _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f,
-                                          _f,
-                                          _f])
-
-        else:  # If we want to decrease generation due to increased import
-               # This code is basically exactly the same as the case of increased export! Some adjustments
-               # Very inefficient way of doing it, but time constraints
-
-            # Find generation capacity of this specific area
-            area_buses = np.array(psspy.agenbusint(-1, 1, "AREA")[1][0])
-            indices = np.where(area_buses == hvdc_bus_area)[0]
-            sys_gen = np.array(psspy.agenbusreal(-1, 1, "PGEN")[1][0])  # Extract active power generation of all plants
-            area_gen = sys_gen[indices]  # Only include area of hvdc bus
-            sys_gen_cap = np.array(psspy.agenbusreal(-1, 1, "PMAX")[1][0])  # Extract generation capacity of all plants
-            area_gen_cap = sys_gen_cap[indices]
-            area_rem_gen = sum(area_gen)  # Currently active generation in the HVDC area
-            sys_rem_gen = sum(sys_gen)  # Currently active generation in the system
-
-            print("Bus count is: ", psspy.agenbuscount(-1, 1)[1])
-
-            # psspy.amachint can not return "AREA", thus we need a workaround using machine numbers and bus areas
-            # Find "AREA" of each machine
-            machine_numbers = np.array(psspy.amachint(-1, 1, "NUMBER")[1][0])
-            machine_areas = np.zeros(len(machine_numbers))
-            for i in range(len(machine_numbers)):
-                machine_areas[i] = bus_areas[np.where(bus_numbers == machine_numbers[i])]
-
-            indices = np.where(machine_areas == hvdc_bus_area)[0]
-            machGen = np.array(psspy.amachreal(-1, 1, "PGEN")[1][0])  # Read PGEN of machines
-            mach_gen_cap = np.array(psspy.amachreal(-1, 1, "PMAX")[1][0])  # Read PMAX of machines
-            mach_slack = machGen    # The generation that can be reduced when import is increased
-                                    # NB: mach_slack includes ALL machines, not just the ones in HVDC area
-
-            current_machine_nr = 0  # machine_chng_2 needs both number and ID
-            machine_id = 0  # which complicates the iteration through the machines
-
-            # Distribute slack
-            if abs(area_rem_gen) > abs(slack_p):  # Distribute slack over local area if the generators can take it all
-                slack_ratio = abs(slack_p) / area_rem_gen
-                mach_slack = mach_slack * slack_ratio
-
-                # Set each generator to unique value
-                for i in indices:  # Iterate through each in-service machine and set generation
-                    if current_machine_nr != machine_numbers[i]:  # new machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [machGen[i] - mach_slack[i], _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f,
-                                          _f, _f])
-
-            else:
-                # First set all generation to 0 in local area
-                for i in indices:  # Iterate through machines in local area and set to zero generation
-                    if current_machine_nr != machine_numbers[i]:  # new machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [0.0, _f, _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f, _f])
-
-                # Recalculate slack
-                slack_p = slack_p + sum(mach_slack[indices])  # Recalculate the slack that needs to be distributed
-                sys_rem_gen_cap = sys_rem_gen - sum(
-                    mach_slack[indices])  # Recalculate remaining generation capacity
-                mach_slack[indices] = 0  # Generators at 0 = can't take more slack
-                slack_ratio = abs(slack_p) / sys_rem_gen_cap
-                mach_slack = mach_slack * slack_ratio
-
-                # Distribute this new slack across the rest of the system
-                machine_id = 0
-                current_machine_nr = 0
-                for i in range(len(mach_slack)):  # Increase generation of all generators in system
-                    if current_machine_nr != machine_numbers[i]:  # New machine
-                        machine_id = 1
-                        current_machine_nr = machine_numbers[i]
-                    else:  # Same machine as previous
-                        machine_id = machine_id + 1
-                    psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                         [_i, _i, _i, _i, _i, _i],
-                                         [machGen[i] - mach_slack[i], _f, _f, _f, _f, _f, _f,
-                                          _f, _f, _f, _f, _f, _f, _f, _f,
-                                          _f,
-                                          _f])
-
-                # All generation has now been distributed
-
-            # Now all slack has been distributed
+
+        # Area of the HVDC bus and of every machine
+        bus_numbers = self.network.get("bus", "NUMBER")  # Get all bus numbers
+        bus_areas = self.network.get("bus", "AREA")
+        hvdc_bus_area = bus_areas[self.network.bus_row(hvdc_bus_nr)]
+        machine_numbers = self.network.get("machine", "NUMBER")
+        machine_ids = self.network.get("machine", "ID")  # machine_chng_2 needs both number and ID
+        in_area = dispatch.machine_areas(machine_numbers, bus_numbers, bus_areas) == hvdc_bus_area
+
+        mach_gen = np.array(self.network.get("machine", "PGEN"))  # Copy of PGEN, the snapshot is updated below
+        mach_gen_cap = self.network.get("machine", "PMAX")  # Read PMAX of machines
+        new_gen = dispatch.distribute_hvdc_slack(mach_gen, mach_gen_cap, in_area, slack_p)
+
+        # Only machines whose generation changes are sent to PSS/E
+        for i in np.nonzero(np.abs(new_gen - mach_gen) > 1e-6)[0]:
+            self.network.machine_chng_2(int(machine_numbers[i]), machine_ids[i].strip(),
+                                 [_i, _i, _i, _i, _i, _i],
+                                 [new_gen[i], _f, _f, _f, _f, _f, _f,
+                                  _f, _f, _f, _f, _f, _f, _f, _f,
+                                  _f, _f])
+
+        return new_gen
     def run_static_load_flow(self):
-        psspy.fdns([0, 0, 0, 1, 1, 1, 99, 0])  # Fixed slope decoupled Newton-Raphson
+        self.network.fdns([0, 0, 0, 1, 1, 1, 99, 0])  # Fixed slope decoupled Newton-Raphson
     def prepare_dynamic_simulation(self,time_step = 0.005, p_zip = [10.0, 10.0], q_zip = [10.0, 10.0]):
-        self.outputfile = os.path.join(os.getcwd(), self.filename)  # Store dynamic simulation
+        self._load_dynamics()
 
         # Convert the loads for dynamic simulation
         psspy.cong(0)
         psspy.conl(0, 1, 1, [0, 0], [p_zip[0], p_zip[1], q_zip[0], q_zip[1]])  # Active power IY(P), Reactive power IY(P)
         psspy.conl(0, 1, 2, [0, 0], [p_zip[0], p_zip[1], q_zip[0], q_zip[1]])  # p_zip[0] = I, p_zip[1] = Y for IYP model, another name for ZIP-load model
         psspy.conl(0, 1, 3, [0, 0], [p_zip[0], p_zip[1], q_zip[0], q_zip[1]])  # Default tuning from S. M. Hamre's thesis tuning
+        self.network.invalidate()
 
-        # Set the time step for the dynamic simulation
-        psspy.dynamics_solution_params(realar=[_f, _f, time_step, _f, _f, _f, _f, _f])
-
-        # Enable relative angle monitoring
-        ibusex = 0  # = 3300 for setting 3300 as reference
-        psspy.set_relang(1, ibusex)
+        self._set_dynamics_parameters(time_step)
 
     def set_monitor_channels(self,buses = (5600, 3300, 7000), quantities = (1,2,4,7)):
-
-        machine_monitor = np.zeros([len(buses)*len(quantities), 3])
-        for i in range(len(buses)):
-            for j in range(len(quantities)):
-                # Add channels to monitor
-                # machine_array_channel(channel index, quantity to monitor (ex. PELEC), bus number)
-                psspy.machine_array_channel([4*i+j+1, quantities[j], buses[i]])
-
-                # Store for plotting later on
-                machine_monitor[4*i+j][0] = int(4*i+j+1)
-                machine_monitor[4*i+j][1] = int(quantities[j])
-                machine_monitor[4*i+j][2] = int(buses[i])
-
-        self.machine_monitor = machine_monitor
-    def run_dynamic_simulation(self,end_time = 10.0):
+        # Machine channels (machine ID 1) at each bus, channel indices follow bus then quantity
+        # Bus and branch channels and selections by area or kV through self.channels,
+        # ex. self.channels.add_area_buses(["VOLT"], min_kv=400)
+        self._load_dynamics()
+        self.channels.add_machines(quantities, buses)
+
+        # Store for plotting later on
+        self.machine_monitor = self.channels.machine_monitor()
+    def set_output_sampling(self, dense_nplt=1, sparse_nplt=20, before=0.1, after=5.0, nprt=100):
+        # Write every dense_nplt time steps from before an event until after it, every sparse_nplt time steps otherwise
+        # The .out file then has an uneven time axis, the numpy reader and plotting use the actual times
+        self.sampling = events.SamplingPolicy(dense_nplt, sparse_nplt, before, after, nprt)
+        return self.sampling
+    def set_stop_monitor(self, segment=0.2, hold=5.0, frequency_band=0.01, angle_band=1.0, max_angle_separation=180.0,
+                         max_speed_deviation=0.05):
+        # End the run after the last event once the SPEED/FREQ/ANGLE channels settle, or when they go unstable
+        # The reason and time end up in stop_reason and stop_time, see events.StopMonitor
+        self.stop_monitor = events.StopMonitor(segment, hold, frequency_band, angle_band, max_angle_separation,
+                                               max_speed_deviation)
+        return self.stop_monitor
+    def run_dynamic_simulation(self,end_time = 10.0, nprt=100, nplt=10):
+        self._load_dynamics()
         self.ierr = psspy.strt(0, self.outputfile)  # Tell PSS/E to write to the output file
-
-        # Run and perform scheduled faults in queue
-        # First need the initial run
-        time = self.events_overview[0][0]  # The first event
-        psspy.run(0, time, 100, 10, 0)  # Run until the first event occurs
-
-        # Now iterate through all faults
-        time = self._find_unique_times()  # Returns a numpy array
-        for i in range(len(time)):
-            indices = np.where(time == time[i])[0]
-            self._exec_fault(indices)
-            if (i + 1) < len(time):  # Avoid going out of bounds
-                psspy.run(0, time[i + 1], 100, 10, 0)
-
-        # At the last fault, run till end_time
-        psspy.run(0, end_time, 100, 10, 0)
-    def read_results(self):
+        self.channels.save(self.outputfile)  # Channel metadata next to the .out file, for plots without the case
+
+        # Run to each distinct event time, fire all events of that time, and at the last event run till end_time
+        # nprt and nplt are used when no output sampling policy is set
+        self.events.run(self, end_time, nprt, nplt, self.sampling, self.stop_monitor)
+        self.stop_reason, self.stop_time = self.events.stop if self.events.stop is not None else (None, end_time)
+        psspy_profiler.save_run(self.outputfile)  # Call profile of this run next to the .out file, if profiling is on
+    def read_results(self, reader="chnf"):
         # Read the output file
-        chnf = dyntools.CHNF(self.outputfile + ".out")
-        # assign the data to variables
-        self.sh_ttl, self.ch_id, self.ch_data = chnf.get_data()
-    def plot_results(self, show_plots = True, lcl_plcmnt=True):
-
-        plt.close("all")# Close plots from previous runs
-
-        # Directory of plot files
-        if lcl_plcmnt:  # Local placement, save in folder near script being run
-            os.chdir("Plots")  # To save in a separate folder for Plots
-        else:  # Save in folder for LaTeX-document for rapid changes
-            os.chdir("C:\Users\Espen\OneDrive - NTNU\Prosjekt\LaTeX\plots")
-
-
-        machine_quantities = ("ANGLE", "PELEC", "QELEC", "ETERM", "EFD", "PMECH",
-                               "SPEED", "XADIFD", "ECOMP", "VOTHSG", "VREF", "VUELL",
-                               "VOEL", "GREF", "LCREF", "WVLCTY", "WTRBSP", "WPITCH",
-                               "WAEROT", "WROTRV", "WROTRI", "WPCMND", "WQCMND")
-
-        quantities = np.unique(self.machine_monitor[:,1])
-        for i in range(len(quantities)):
-            plot_title = machine_quantities[int(quantities[i]) - 1]
-            plt.figure(plot_title)
-            indices = np.where(self.machine_monitor[:,1] == quantities[i])[0]
-            for j in range(len(indices)):
-                if plot_title == "SPEED":
-                    for k in range(len(self.ch_data[indices[j]+1])):  # Adjust data so that frequency is appropriate
-                        self.ch_data[indices[j]+1][k] = 50 + self.ch_data[indices[j]+1][k]*50
-                plt.plot(self.ch_data['time'], self.ch_data[indices[j]+1])
-
-            plt.xlabel("Time (s)")
-            plt.ylabel(self.generate_ylabel(plot_title))  # Remains work on ylabel!!!!
-            plt.legend(self.generate_legend(indices))  # Remains work on legend!!!
-            plt.grid()
-            plt.savefig(machine_quantities[int(quantities[i]-1)] + "_" + self.filename)
-
-        if show_plots:
-            plt.show()
+        # reader="chnf" uses dyntools (lists in memory), reader="numpy" maps the file and hands out array views
+        if reader == "numpy":
+            self.channel_file = ChannelFile(self.outputfile + ".out")
+            self.sh_ttl, self.ch_id, self.ch_data = self.channel_file.get_data()
+        elif reader == "chnf":
+            import dyntools  # Only loaded for this reader
+            chnf = dyntools.CHNF(self.outputfile + ".out")
+            # assign the data to variables
+            self.sh_ttl, self.ch_id, self.ch_data = chnf.get_data()
+        else:
+            raise ValueError("Unknown reader: " + str(reader))
+    def compute_kpis(self, end_time=None):
+        # Stability indicators (nadir, RoCoF, settling, damping, ...) per event and channel, see kpi.run_table
+        channel_file = ChannelFile(self.outputfile + ".out")
+        channels = self.channels.channels or channels_from_ids(channel_file)
+        data = channel_file.data.T[[c["index"] - 1 for c in channels]]
+        self.kpi_table = kpi.run_table(channel_file.time, data, channels, self.events_overview, end_time)
+        return self.kpi_table
+    def plot_results(self, show_plots = True, plot_dir=None, method="minmax", width=1200):
+        # One figure per monitored quantity, saved to plot_dir (None = root_dir/Plots), ch_data is left untouched
+        # show_plots=False renders off-screen straight from the .out file, plotting.plot_runs does many runs in parallel
+        # method: trace decimation to the plot width, "minmax", "lttb" or None
+        import plotting  # matplotlib is loaded on the first plot
+        if plot_dir is None:
+            plot_dir = os.path.join(self.root_dir, "Plots")
+        if not show_plots:
+            return plotting.plot_run(self.outputfile + ".out", plot_dir, self.channels, self.filename,
+                                     width=width, method=method)
+        if not os.path.isdir(plot_dir):
+            os.makedirs(plot_dir)
+
+        import matplotlib.pyplot as plt  # GUI backend, only for plots on screen
+        plt.close("all")  # Close plots from previous runs
+        files = []
+        time = np.asarray(self.ch_data['time'])
+        for plot_title in self.channels.quantities():
+            indices = self.channels.find(quantity=plot_title)
+            traces = [np.asarray(self.ch_data[k]) for k in indices]
+            figure = plt.figure(plot_title)
+            plotting.draw_quantity(figure, time, traces, plot_title, self.generate_legend(indices), width, method)
+            files.append(os.path.join(plot_dir, plot_title + "_" + self.filename + ".png"))
+            figure.savefig(files[-1])
+
+        plt.show()
+        return files
     def add_hvdc_buses(self):
         # North Sea Link nsl ( http://www.statnett.no/en/Projects/Cable-to-the-UK/ )
         nsl_nr = 6010
@@ -372,12 +268,12 @@ class PsspyCase(object):
         nsl_reactance = 0.006
         nsl_initial_power = 0.0
 
-        psspy.bus_data_3(nsl_nr, [_i, nsl_area, _i, _i], [nsl_voltage, _f, _f, _f, _f, _f, _f], _s)
-        psspy.load_data_4(nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [_f, _f, _f, _f, _f, _f])  # Create bus before any values can be set
-        psspy.load_chng_4(nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [nsl_initial_power, _f, _f, _f, _f, _f])  # Set values (power)
-        psspy.branch_data(nsl_connection, nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
+        self.network.bus_data_3(nsl_nr, [_i, nsl_area, _i, _i], [nsl_voltage, _f, _f, _f, _f, _f, _f], _s)
+        self.network.load_data_4(nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [_f, _f, _f, _f, _f, _f])  # Create bus before any values can be set
+        self.network.load_chng_4(nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [nsl_initial_power, _f, _f, _f, _f, _f])  # Set values (power)
+        self.network.branch_data(nsl_connection, nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
                           [_f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f])  # Create branch before setting values
-        psspy.branch_chng(nsl_connection, nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
+        self.network.branch_chng(nsl_connection, nsl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
                           [_f, nsl_reactance, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f])  # Set values (reactance)
 
 
@@ -389,144 +285,207 @@ class PsspyCase(object):
         nl_reactance = 0.006
         nl_initial_power = 0.0
 
-        psspy.bus_data_3(nl_nr, [_i, nl_area, _i, _i], [nl_voltage, _f, _f, _f, _f, _f, _f], _s)
-        psspy.load_data_4(nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [_f, _f, _f, _f, _f, _f])  # Create bus before any values can be set
-        psspy.load_chng_4(nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [nl_initial_power, _f, _f, _f, _f, _f])  # Set values (power)
-        psspy.branch_data(nl_connection, nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
+        self.network.bus_data_3(nl_nr, [_i, nl_area, _i, _i], [nl_voltage, _f, _f, _f, _f, _f, _f], _s)
+        self.network.load_data_4(nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [_f, _f, _f, _f, _f, _f])  # Create bus before any values can be set
+        self.network.load_chng_4(nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i], [nl_initial_power, _f, _f, _f, _f, _f])  # Set values (power)
+        self.network.branch_data(nl_connection, nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
                           [_f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f])  # Create branch before setting values
-        psspy.branch_chng(nl_connection, nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
+        self.network.branch_chng(nl_connection, nl_nr, r"""1""", [_i, _i, _i, _i, _i, _i],
                           [_f, nl_reactance, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f, _f])  # Set values (reactance)
     def read_slackbus_generation(self,slack_bus_number = 3300):
-        plant_bus_numbers = np.array(psspy.agenbusint(-1,1,"NUMBER")[1][0])
-        plant_gen = np.array(psspy.agenbusreal(-1,1,"PGEN")[1][0])
+        plant_bus_numbers = self.network.get("plant", "NUMBER")
+        plant_gen = self.network.get("plant", "PGEN")
         index = np.where(plant_bus_numbers == slack_bus_number)
         return plant_gen[index]
     def save_network_data(self):
-        psspy.save(os.path.join(os.getcwd(), self.filename+".sav"))
-    def add_fault(self,time, type, bus, extras):
+        psspy.save(os.path.join(self.output_dir, self.filename+".sav"))
+    def export_network(self, path=None):
+        # Bus/branch/load/machine arrays for the license-free load flow in loadflow.py
+        from loadflow import NetworkData
+        network = NetworkData.from_psspy()
+        network.save(os.path.join(self.output_dir, self.filename + "_network.npz") if path is None else path)
+        return network
+    def add_fault(self,time, type, bus, extras=()):
         # Input param extras will be read differently depending on type
         # Example: time=0.1, type=1, bus=5600, extras=(6000) to trip branch connecting 5600 and 6000
-        if type == 1 or 2 or 3:  # Load step
-            self.events_overview.append((time,type,bus,extras))
-        else:
-            return "Faulty argument type given"
+        # type 1 = branch trip, 2 = load step (extras = [MW]), 3 = bus trip, anything else raises ValueError
+        event = events.make_event(time, type, bus, extras)
+        self.events.add(event)
+        self.events_overview.append(event.as_tuple())
+        return event
+    def add_event(self, event):
+        # Any events.Event, ex. events.LoadRamp or events.RecurringEvent
+        self.events.add(event)
+        if event.as_tuple() is not None:
+            self.events_overview.append(event.as_tuple())
+        return event
+    def add_load_profile(self, profile, segment=0.1, start=0.0, end=None):
+        # Drive the loads of profile.buses (load_profile.LoadProfile) during the run, updated every segment seconds
+        return self.add_event(load_profile.ProfileEvent(profile, segment, start, end))
 
     # Private functions
-    def _exec_fault(self,indices):  # Index of fault in events_overview
-        # indices = indices of faults to execute (potentially multiple at once)
-        # Remember for the run_dynamic_simulation to use np.unique to decide for each time
-        for i in range(len(indices)):
-            type_of_fault = self.events_overview[indices[i]][1]  # Type of fault at the specified index
-
-            if type_of_fault == 1:  # Branch trip
-                self._exec_branch_trip(indices[i])
-            elif type_of_fault == 2:
-                self._exec_load_step(indices[i])  # Load step
-            elif type_of_fault == 3:
-                self._exec_bus_trip(indices[i])  # Disconnect bus
-            else:
-                return "Undefined fault type"
-    def _exec_branch_trip(self, index):
-        # Function not yet tested
-        time = self.events_overview[index][0]
-        bus = self.events_overview[index][2]
-
-        otherEnd = self.events_overview[index][3][0]
-        branchStart = min(bus, otherEnd)
-        branchEnd = max(bus, otherEnd)
-        psspy.dist_branch_trip(branchStart, branchEnd, 1)  # Last integer assumes branch ID 1!!!!
-    def _exec_bus_trip(self, index):
-        # Function not yet tested
-        bus_number = self.events_overview[index][2]
+    def _exec_branch_trip(self, bus, other_end, branch_id="1"):
+        branchStart = min(bus, other_end)
+        branchEnd = max(bus, other_end)
+        psspy.dist_branch_trip(branchStart, branchEnd, branch_id)
+        self.network.invalidate()
+    def _exec_bus_trip(self, bus_number):
         psspy.dist_bus_trip(bus_number)
-    def _exec_load_step(self, index):
-        # Applies a step load (MW) at the specified time (in seconds)
-        bus_number = self.events_overview[index][2]
-        load_step = self.events_overview[index][3][0]  # Third index refers to list of 'extras' for the specific type of fault
-
-        load_numbers = np.array(psspy.aloadint(-1,1,"NUMBER")[1][0])
-        load_index = np.where(load_numbers == bus_number)[0]
+        self.network.invalidate()
+    def _exec_load_step(self, bus_number, load_step):
+        # Applies a step load (MW) at the present simulation time
+        load_index = self.network.load_rows(bus_number)  # No array round-trip unless the loads have changed
         load_step = load_step / len(load_index)  # To split step over all loads at bus
-        load_p = np.array(psspy.aloadcplx(-1, 1, "MVAACT")[1][0])
-        present_load = load_p[load_index]
-        for i in range(len(load_index)):  # CREATE FOR LOOP NOW TO ITERATE THROUGH AND STEP LOAD AT EACH LOAD AT BUS
-            load_id = str(i + 1)
-            psspy.load_chng_4(bus_number, load_id, [_i, _i, _i, _i, _i, _i], [present_load[i] + load_step, _f, _f, _f, _f, _f])
+        present_load = self.network.get("load", "MVAACT")[load_index].real
+        load_ids = self.network.get("load", "ID")[load_index]
+        for i in range(len(load_index)):  # Step load at each load at bus
+            self.network.load_chng_4(bus_number, load_ids[i].strip(), [_i, _i, _i, _i, _i, _i], [present_load[i] + load_step, _f, _f, _f, _f, _f])
         # NB!! The present_load seems to take values from the Machines-tab
-    def _find_unique_times(self):
-        time = []
-        for i in range(len(self.events_overview)):
-            time.append(self.events_overview[i][0])
-        time.sort()
-        return np.array(time)
+    def _load_dynamics(self):
+        # Read the .dyr file on first use, after the load flow and before the conversions
+        if not self.dynamics:
+            raise ValueError("Static-only case (dynamics=False) of %s, no dynamic simulation" % self.input_network)
+        if not self._dynamics_loaded:
+            psspy.dyre_new([1, 1, 1, 1], self.dyrfile, "", "", "")
+            self._dynamics_loaded = True
+    def _case_buses(self):
+        # psseinit size for this case: its bus count from an earlier load with room for added buses
+        try:
+            with open(_size_path(self.casefile)) as f:
+                stored = json.load(f)
+            if stored["version"] != _file_version(self.casefile):  # The .sav file changed since
+                return _DEFAULT_BUSES
+            count = stored["buses"]
+        except (IOError, OSError, ValueError, KeyError):
+            return _DEFAULT_BUSES
+        return int(1.25 * count) + 100
+    def _store_case_buses(self):
+        # Remember the bus count of the .sav file for _case_buses, written once per version of the file
+        # Written to a private file first and renamed, parallel workers load the same case at once
+        path = _size_path(self.casefile)
+        version = _file_version(self.casefile)
+        try:
+            with open(path) as f:
+                if json.load(f)["version"] == version:
+                    return
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        temporary = path + ".tmp%d" % os.getpid()
+        try:
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(temporary, "w") as f:
+                json.dump({"casefile": os.path.abspath(self.casefile), "version": version,
+                           "buses": len(self.network.get("bus", "NUMBER"))}, f)
+            if os.path.exists(path):  # os.rename does not overwrite on Windows
+                os.remove(path)
+            os.rename(temporary, path)
+        except (IOError, OSError):  # No cache folder or another worker was first, psseinit keeps the default size
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    def _update_filename(self):
+        buses_str = ""
+        for i in range(len(self.hvdc_bus_nrs)):
+            buses_str = buses_str + "_" + str(self.hvdc_bus_nrs[i])
+        self.filename = "limited_buses" + str(buses_str) + "_" + self.input_network + "_" + self.output_name
+    def _set_dynamics_parameters(self, time_step):
+        self.outputfile = os.path.join(self.output_dir, self.filename)  # Store dynamic simulation
+
+        # Set the time step for the dynamic simulation
+        psspy.dynamics_solution_params(realar=[_f, _f, time_step, _f, _f, _f, _f, _f])
+
+        # Enable relative angle monitoring
+        ibusex = 0  # = 3300 for setting 3300 as reference
+        psspy.set_relang(1, ibusex)
     def generate_ylabel(self, quantity="ANGLE"):
-        return {  # Define dictionary
-            # Machine quantities
-            "ANGLE": "Angle (deg)",
-            "PELEC": "Active power (p.u.)",
-            "QELEC": "Reactive power (p.u.)",
-            "ETERM": "Terminal voltage (p.u.)",
-            "EFD": "UNDEFINED YLABEL",
-            "PMECH": "Mechanical power (p.u.)",
-            "SPEED": "Rotor speed (p.u.)",
-            "XADIFD": "UNDEFINED YLABEL",
-            "ECOMP": "UNDEFINED YLABEL",
-            "VOTHSG": "UNDEFINED YLABEL",
-            "VREF": "Reference voltage (p.u)",
-            "VUELL": "UNDEFINED YLABEL",
-            "VOEL": "UNDEFINED YLABEL",
-            "GREF": "UNDEFINED YLABEL",
-            "LCREF": "UNDEFINED YLABEL",
-            "WVLCTY": "UNDEFINED YLABEL",
-            "WTRBSP": "UNDEFINED YLABEL",
-            "WPITCH": "UNDEFINED YLABEL",
-            "WAEROT": "UNDEFINED YLABEL",
-            "WROTRV": "UNDEFINED YLABEL",
-            "WROTRI": "UNDEFINED YLABEL",
-            "WPCMND": "UNDEFINED YLABEL",
-            "WQCMND": "UNDEFINED YLABEL"
-
-            # Bus quantities
-        }[quantity]  # Return key quantity
+        from plotting import YLABELS
+        return YLABELS[quantity]
     def generate_legend(self, indices):
-        legend = []
-        for i in range(len(indices)):
-            legend.append("Bus " + str(int(self.machine_monitor[indices[i]][2])))
-
-        return legend
-    def redist_slack(self, slack_bus_number = 3300):
-        # Use same methodology as described in setHvdcToMax
-        # Continue until the excess slack is less than 1% of max slack generator capacity
-
-
-        machGen = np.array(psspy.amachreal(-1, 1, "PGEN")[1][0])  # Read PGEN of machines
-        mach_gen_cap = np.array(psspy.amachreal(-1, 1, "PMAX")[1][0])  # Read PMAX of machines
-        mach_slack = mach_gen_cap - machGen  # NB: mach_slack includes ALL machines, not just the ones in HVDC area
-        mach_indices = np.array(psspy.amachint(-1, 1, "NUMBER")[1][0])
-        slack_mach_indices = np.where(mach_indices == slack_bus_number)
-        slack_mach_exceeded = sum(mach_slack[slack_mach_indices])
-        machine_numbers = np.array(psspy.amachint(-1, 1, "NUMBER")[1][0])
-
-        # Distribute this new slack across the rest of the system
-        machine_id = 0
-        current_machine_nr = 0
-        for i in range(len(mach_slack)):  # Increase generation of all generators in system
-            if current_machine_nr != machine_numbers[i]:  # New machine
-                machine_id = 1
-                current_machine_nr = machine_numbers[i]
-            else:  # Same machine as previous
-                machine_id = machine_id + 1
-            psspy.machine_chng_2(current_machine_nr, str(machine_id),
-                                 [_i, _i, _i, _i, _i, _i],
-                                 [machGen[i] + mach_slack[i], _f, _f, _f, _f, _f, _f,
-                                  _f, _f, _f, _f, _f, _f, _f, _f,
-                                  _f,
-                                  _f])
-
-            # All generation has now been distributed
-            # Run new power flow and see if limits are exceeded more than 1% of slack bus
-            # Recursive algorithm if
-            self.runStaticLoadFlow()
-            pass
-        
-        pass
\ No newline at end of file
+        # Legend of the channels with these (1-based) indices
+        return self.channels.legend(indices)
+    def redist_slack(self, slack_bus_number = 3300, tolerance=None, participation="headroom", area=None,
+                     max_iterations=10, flat_start=True):
+        """
+            Distributed slack: solve the load flow and move the slack bus deviation over the other machines.
+            Call instead of run_static_load_flow. The slack machines should end at the output they have now.
+            Input:
+                slack_bus_number: bus of the swing machine(s)
+                tolerance: allowed slack deviation (MW), None = 1% of the slack machines' PMAX
+                participation: "headroom" (PMAX-PGEN up, PGEN-PMIN down), "area" (headroom, machines in
+                               area only) or an array with one factor per in-service machine
+                area: area for participation="area", None = area of the last HVDC bus
+                max_iterations: maximum number of load flows
+                flat_start: flat start for the first load flow, the following ones start from the previous solution
+            Output:
+                (converged, array with the slack deviation (MW) after each load flow)
+        """
+        machine_numbers = self.network.get("machine", "NUMBER")
+        slack_rows = np.nonzero(machine_numbers == slack_bus_number)[0]
+        target = self.network.get("machine", "PGEN")[slack_rows].sum()  # Slack output before the mismatch
+        if tolerance is None:
+            tolerance = 0.01 * self.network.get("machine", "PMAX")[slack_rows].sum()
+
+        deviations = []
+        for iteration in range(max_iterations):
+            self.network.fdns([0, 0, 0, 1, 1, 1 if (flat_start and iteration == 0) else 0, 99, 0])
+            mach_gen = np.array(self.network.get("machine", "PGEN"))
+            deviation = mach_gen[slack_rows].sum() - target  # > 0: slack produces too much, others must increase
+            deviations.append(deviation)
+            if abs(deviation) <= tolerance:
+                return True, np.array(deviations)
+
+            factors = self._participation_factors(participation, area, mach_gen, deviation > 0.0)
+            factors[slack_rows] = 0.0
+            new_gen, _ = dispatch.distribute_with_limits(mach_gen, self.network.get("machine", "PMIN"),
+                                                         self.network.get("machine", "PMAX"), factors, deviation)
+            changed = np.nonzero(np.abs(new_gen - mach_gen) > 1e-6)[0]
+            if len(changed) == 0:  # All participating machines are at their limits
+                break
+            machine_ids = self.network.get("machine", "ID")
+            for i in changed:
+                self.network.machine_chng_2(int(machine_numbers[i]), machine_ids[i].strip(),
+                                            [_i, _i, _i, _i, _i, _i],
+                                            [new_gen[i], _f, _f, _f, _f, _f, _f,
+                                             _f, _f, _f, _f, _f, _f, _f, _f,
+                                             _f, _f])
+            machine_numbers = self.network.get("machine", "NUMBER")
+
+        return False, np.array(deviations)
+    def _participation_factors(self, participation, area, mach_gen, increase):
+        if not isinstance(participation, str):  # User supplied
+            return np.array(participation, dtype=float)
+
+        if increase:
+            factors = self.network.get("machine", "PMAX") - mach_gen
+        else:
+            factors = mach_gen - self.network.get("machine", "PMIN")
+        factors = np.maximum(factors, 0.0)
+        if participation == "area":
+            if area is None:
+                area = self.network.get("bus", "AREA")[self.network.bus_row(self.hvdc_bus_nrs[-1])]
+            in_area = dispatch.machine_areas(self.network.get("machine", "NUMBER"),
+                                             self.network.get("bus", "NUMBER"), self.network.get("bus", "AREA")) == area
+            factors = np.where(in_area, factors, 0.0)
+        elif participation != "headroom":
+            raise ValueError("Unknown participation: " + participation)
+        return factors
+
+
+def _size_path(casefile):
+    # Bus count file of a .sav file in the user cache folder, one per path of the .sav file
+    if os.environ.get("LOCALAPPDATA"):  # Windows
+        folder = os.path.join(os.environ["LOCALAPPDATA"], "psspyObject")
+    else:
+        folder = os.path.join(os.path.expanduser("~"), ".cache", "psspyObject")
+    digest = hashlib.sha1(os.path.abspath(casefile).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(folder, os.path.splitext(os.path.basename(casefile))[0] + "_" + digest + _SIZE_SUFFIX)
+
+
+def _file_version(path):
+    # (size, modification time) of a file, None if it does not exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
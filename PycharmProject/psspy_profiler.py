@@ -0,0 +1,271 @@
+# Standard Python-packages
+import os
+import sys
+import json
+import bisect
+import timeit
+import importlib
+
+
+# Modules whose psspy calls are counted, the ones a PsspyCase run goes through
+_MODULES = ("psspyObject", "network_snapshot", "channel_registry", "events", "load_profile")
+
+# Latency histogram: bucket k holds calls faster than _BUCKET_EDGES[k], the last one the slower calls
+_BUCKET_EDGES = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+_BUCKET_NAMES = ("<10us", "<100us", "<1ms", "<10ms", "<100ms", "<1s", "<10s", ">=10s")
+
+# Functions that make PSS/E compute, the rest are round-trips through the API
+SOLVER_FUNCTIONS = ("fdns", "fnsl", "solv", "run", "strt", "case", "dyre_new", "cong", "conl", "rstr", "save", "snap")
+
+LARGE_ARGUMENT = 1000  # Arguments with more elements than this are recorded
+_PROFILE_SUFFIX = ".profile.json"  # Call profile of a run, next to its .out file
+_ENVIRONMENT = "PSSPY_PROFILE"  # Set to 1 to profile every case of the process (ex. sweep workers)
+
+_active = {"profile": None, "proxy": None, "modules": []}
+
+
+class CallProfile(object):
+    """Calls, time and latency histogram per psspy function, and time per calling PsspyCase method"""
+    # Constructor
+    def __init__(self):
+        self.functions = {}  # Function -> {"calls", "seconds", "max", "histogram"}
+        self.methods = {}  # Calling method -> function -> [calls, seconds]
+        self.large_arguments = {}  # Function -> {"calls", "max_size", "method"}
+        self.started = timeit.default_timer()
+        self.wall = None  # Wall time from start to save (s)
+
+    # Public functions
+    def record(self, function, method, seconds, size=0):
+        entry = self.functions.get(function)
+        if entry is None:
+            entry = self.functions[function] = {"calls": 0, "seconds": 0.0, "max": 0.0,
+                                                "histogram": [0] * len(_BUCKET_NAMES)}
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        if seconds > entry["max"]:
+            entry["max"] = seconds
+        entry["histogram"][bisect.bisect_right(_BUCKET_EDGES, seconds)] += 1
+
+        by_function = self.methods.setdefault(method, {})
+        totals = by_function.get(function)
+        if totals is None:
+            totals = by_function[function] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+
+        if size > LARGE_ARGUMENT:
+            large = self.large_arguments.setdefault(function, {"calls": 0, "max_size": 0, "method": method})
+            large["calls"] += 1
+            if size > large["max_size"]:
+                large["max_size"] = size
+                large["method"] = method
+    def summary(self):
+        # Totals of the profile: calls, time in solves and time in the other API calls
+        solver = sum(e["seconds"] for f, e in self.functions.items() if f in SOLVER_FUNCTIONS)
+        api = sum(e["seconds"] for f, e in self.functions.items() if f not in SOLVER_FUNCTIONS)
+        return {"calls": sum(e["calls"] for e in self.functions.values()),
+                "solver_seconds": solver, "api_seconds": api, "psspy_seconds": solver + api,
+                "wall_seconds": self.wall if self.wall is not None else timeit.default_timer() - self.started}
+    def to_dict(self):
+        return {"summary": self.summary(), "buckets": list(_BUCKET_NAMES), "functions": self.functions,
+                "methods": self.methods, "large_arguments": self.large_arguments}
+    def save(self, path):
+        self.wall = timeit.default_timer() - self.started
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            values = json.load(f)
+        profile = cls()
+        profile.functions = values["functions"]
+        profile.methods = values["methods"]
+        profile.large_arguments = values["large_arguments"]
+        profile.wall = values["summary"]["wall_seconds"]
+        return profile
+    def table(self, limit=20):
+        # Text table of the functions with the most time
+        lines = ["%-26s %8s %10s %10s  %s" % ("function", "calls", "total ms", "max ms", " ".join(_BUCKET_NAMES))]
+        ranked = sorted(self.functions.items(), key=lambda item: -item[1]["seconds"])
+        for function, entry in ranked[:limit]:
+            histogram = " ".join(str(n) for n in entry["histogram"])
+            lines.append("%-26s %8d %10.2f %10.3f  %s" % (function, entry["calls"], 1e3 * entry["seconds"],
+                                                         1e3 * entry["max"], histogram))
+        return "\n".join(lines)
+
+
+class PsspyProxy(object):
+    """Stands in for the psspy module: every function call is timed and recorded in a CallProfile"""
+    def __init__(self, module, profile):
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "_profile", profile)
+
+    def __getattr__(self, name):
+        value = getattr(self._module, name)
+        if not callable(value):
+            return value
+        wrapper = self._wrap(name, value)
+        object.__setattr__(self, name, wrapper)  # Later lookups skip __getattr__
+        return wrapper
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)  # Ex. psspy.throwPsseExceptions = True
+
+    def _wrap(self, name, function):
+        profile = self._profile
+
+        def wrapper(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = timeit.default_timer() - start
+                profile.record(name, calling_method(sys._getframe(1)), seconds, _largest(args, kwargs))
+        wrapper.__name__ = name
+        return wrapper
+
+
+def enable(modules=_MODULES):
+    """
+        Count and time every psspy call of the given modules until disable(). Nothing is wrapped before,
+        so cases run without the profiler pay nothing for it.
+        Output:
+            CallProfile that collects the calls
+    """
+    if _active["profile"] is not None:
+        return _active["profile"]
+    profile = CallProfile()
+    proxy = PsspyProxy(present_psspy(modules), profile)
+    _active["modules"] = patch_modules(proxy, modules)
+    _active["profile"] = profile
+    _active["proxy"] = proxy
+    return profile
+
+
+def disable():
+    # Give the modules their psspy back, returns the last CallProfile
+    profile = _active["profile"]
+    restore_modules(_active["modules"])
+    _active["profile"] = _active["proxy"] = None
+    _active["modules"] = []
+    return profile
+
+
+def active():
+    # CallProfile being collected, None when profiling is off
+    return _active["profile"]
+
+
+def profile_path(out_file):
+    # Call profile file of a run, out_file with or without the .out extension
+    if out_file.endswith(".out"):
+        out_file = out_file[:-4]
+    return out_file + _PROFILE_SUFFIX
+
+
+def save_run(out_file):
+    """
+        Write the calls since the last save (or since enable) next to the .out file and start a new profile,
+        so every run of a process gets its own. Does nothing when profiling is off.
+        Output:
+            path of the profile, None when profiling is off
+    """
+    profile = _active["profile"]
+    if profile is None:
+        return None
+    path = profile_path(out_file)
+    profile.save(path)
+    new_profile = CallProfile()
+    object.__setattr__(_active["proxy"], "_profile", new_profile)
+    for name in list(_active["proxy"].__dict__):  # Wrappers hold the old profile
+        if not name.startswith("_"):
+            object.__delattr__(_active["proxy"], name)
+    _active["profile"] = new_profile
+    return path
+
+
+def diff(before, after):
+    """
+        Difference of two run profiles per function.
+        Input:
+            before, after: CallProfile or path of a saved profile (out file or profile file)
+        Output:
+            list of (function, calls before, calls after, seconds before, seconds after), largest time change first
+    """
+    before, after = _profile(before), _profile(after)
+    rows = []
+    for function in set(before.functions) | set(after.functions):
+        a = before.functions.get(function, {"calls": 0, "seconds": 0.0})
+        b = after.functions.get(function, {"calls": 0, "seconds": 0.0})
+        rows.append((function, a["calls"], b["calls"], a["seconds"], b["seconds"]))
+    rows.sort(key=lambda row: -abs(row[4] - row[3]))
+    return rows
+
+
+def format_diff(before, after, limit=20):
+    # Text summary of diff(before, after) with the totals of both runs
+    before, after = _profile(before), _profile(after)
+    lines = []
+    totals_before, totals_after = before.summary(), after.summary()
+    for key in ("calls", "solver_seconds", "api_seconds", "wall_seconds"):
+        lines.append("%-16s %12.4g -> %12.4g" % (key, totals_before[key], totals_after[key]))
+    lines.append("%-26s %17s %23s" % ("function", "calls", "total ms"))
+    for function, calls_a, calls_b, seconds_a, seconds_b in diff(before, after)[:limit]:
+        lines.append("%-26s %8d -> %6d %10.2f -> %10.2f" % (function, calls_a, calls_b, 1e3 * seconds_a,
+                                                            1e3 * seconds_b))
+    return "\n".join(lines)
+
+
+def present_psspy(modules=_MODULES):
+    # The psspy the modules use now: the PSS/E module or a proxy installed earlier
+    module = sys.modules.get(modules[0]) or importlib.import_module(modules[0])
+    return module.psspy
+
+
+def patch_modules(replacement, modules=_MODULES):
+    # Point the psspy name of the modules to replacement, returns (module, previous psspy) for restore_modules
+    present = present_psspy(modules)
+    patched = []
+    for name in modules:
+        module = sys.modules.get(name) or importlib.import_module(name)
+        if getattr(module, "psspy", None) is present:
+            module.psspy = replacement
+            patched.append((module, present))
+    return patched
+
+
+def restore_modules(patched):
+    for module, previous in patched:
+        module.psspy = previous
+
+
+def calling_method(frame):
+    # Innermost PsspyCase method on the stack from frame on, else the function of frame itself
+    first = frame
+    while frame is not None:
+        if frame.f_globals.get("__name__") == "psspyObject":
+            return "PsspyCase." + frame.f_code.co_name
+        frame = frame.f_back
+    return "%s.%s" % (first.f_globals.get("__name__"), first.f_code.co_name)
+
+
+# Private functions
+
+
+def _largest(args, kwargs):
+    # Number of elements of the largest list-like argument
+    size = 0
+    for value in list(args) + list(kwargs.values()):
+        if hasattr(value, "__len__") and not isinstance(value, (str, type(u""))):
+            size = max(size, len(value))
+    return size
+
+
+def _profile(value):
+    if isinstance(value, CallProfile):
+        return value
+    return CallProfile.load(value if value.endswith(_PROFILE_SUFFIX) else profile_path(value))
+
+
+if os.environ.get(_ENVIRONMENT, "0") not in ("", "0"):
+    enable()
@@ -0,0 +1,322 @@
+# Standard Python-packages
+import os
+import sys
+import zlib
+import pickle
+import numpy as np
+
+# Custom packages
+import psspy_profiler
+
+
+_MAGIC = b"PSSPYLOG"
+_VERSION = 1
+_DEFAULTS = ("getdefaultint", "getdefaultreal", "getdefaultchar")  # Constants, kept out of the call sequence
+_ARRAY_LENGTH = 8  # Number lists longer than this are stored as numpy arrays
+_LOOKAHEAD = 50  # Recorded calls searched for a match after a divergence when not strict
+
+_active = {"session": None, "patched": [], "modules": {}}
+
+
+class ReplayDivergence(ValueError):
+    """The replayed script made a call the recording does not have at this point"""
+
+
+class SessionRecorder(object):
+    """Stands in for the psspy module and keeps every call with its arguments and return value"""
+    def __init__(self, module):
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "calls", [])  # (function, args, kwargs, result, error, calling method)
+        object.__setattr__(self, "defaults", dict((name, getattr(module, name)()) for name in _DEFAULTS))
+
+    def __getattr__(self, name):
+        value = getattr(self._module, name)
+        if not callable(value) or name in _DEFAULTS:
+            return value
+        calls = self.calls
+
+        def wrapper(*args, **kwargs):
+            method = psspy_profiler.calling_method(sys._getframe(1))
+            try:
+                result = value(*args, **kwargs)
+            except Exception as error:
+                calls.append((name, _plain(args), _plain(kwargs), None, "%s: %s" % (type(error).__name__, error),
+                              method))
+                raise
+            calls.append((name, _plain(args), _plain(kwargs), _pack(result), None, method))
+            return result
+        wrapper.__name__ = name
+        object.__setattr__(self, name, wrapper)
+        return wrapper
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def save(self, path, outputs=True):
+        """
+            Write the session log: header, then the calls as one compressed pickle (protocol 2, Python 2 and 3).
+            Input:
+                outputs: True to include the .out files written by strt, so a replay can post-process them
+        """
+        files = {}
+        if outputs:
+            for name, args, kwargs, _, error, _ in self.calls:
+                if name == "strt" and error is None:
+                    out_file = _out_file(args, kwargs)
+                    if out_file and os.path.exists(out_file):
+                        with open(out_file, "rb") as f:
+                            files[out_file] = f.read()
+        log = {"version": _VERSION, "defaults": self.defaults, "calls": self.calls, "outputs": files}
+        with open(path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(zlib.compress(pickle.dumps(log, 2), 6))
+        return path
+
+
+class ReplayBackend(object):
+    """Serves the return values of a recorded session in order, without PSS/E"""
+    def __init__(self, log, strict=True, output_dir=None):
+        """
+            Input:
+                log: path of a log written by SessionRecorder.save
+                strict: True to raise ReplayDivergence at the first call that differs from the recording,
+                        False to note it in divergences, resynchronize on the next matching call and go on
+                output_dir: folder for the .out files kept in the log, None = where they were recorded
+        """
+        with open(log, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("%s is not a psspy session log" % log)
+            values = _loads(zlib.decompress(f.read()))
+        if values["version"] != _VERSION:
+            raise ValueError("Session log version %r, expected %d" % (values["version"], _VERSION))
+        object.__setattr__(self, "_calls", values["calls"])
+        object.__setattr__(self, "_defaults", values["defaults"])
+        object.__setattr__(self, "_outputs", values["outputs"])
+        object.__setattr__(self, "_attributes", {"throwPsseExceptions": False})
+        object.__setattr__(self, "strict", strict)
+        object.__setattr__(self, "output_dir", output_dir)
+        object.__setattr__(self, "position", 0)  # Next recorded call
+        object.__setattr__(self, "divergences", [])  # Text of every divergence, in order
+
+    def __getattr__(self, name):
+        if name in self._defaults:
+            value = self._defaults[name]
+            return lambda: value
+        if name in self._attributes:
+            return self._attributes[name]
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def function(*args, **kwargs):
+            return self._replay(name, args, kwargs, psspy_profiler.calling_method(sys._getframe(1)))
+        function.__name__ = name
+        return function
+
+    def __setattr__(self, name, value):
+        self._attributes[name] = value
+
+    def remaining(self):
+        # Recorded calls the replay has not reached, ex. after the modified script stopped early
+        return len(self._calls) - self.position
+
+    def report(self, limit=10):
+        # Text summary of the replay with the first limit divergences
+        lines = ["Replayed %d of %d recorded calls, %d divergences" % (self.position, len(self._calls),
+                                                                      len(self.divergences))]
+        lines.extend(self.divergences[:limit])
+        if len(self.divergences) > limit:
+            lines.append("... %d more" % (len(self.divergences) - limit))
+        if self.remaining():
+            lines.append("%d recorded calls not made, next: %s" % (self.remaining(),
+                                                                   _describe(self._calls[self.position])))
+        if not self.divergences and not self.remaining():
+            lines.append("Call sequence identical to the recording")
+        return "\n".join(lines)
+
+    def _replay(self, name, args, kwargs, method):
+        args, kwargs = _plain(args), _plain(kwargs)
+        position = self.position
+        record = self._calls[position] if position < len(self._calls) else None
+        if record is None or record[0] != name or not _same(record[1], args) or not _same(record[2], kwargs):
+            record = self._diverged(name, args, kwargs, method, record)
+            if record is None:
+                return 0  # Call the recording does not have, PSS/E would mostly answer ierr = 0
+        else:
+            object.__setattr__(self, "position", position + 1)
+
+        if name == "strt":
+            self._restore_output(record[1], record[2])
+        if record[4] is not None:
+            raise RuntimeError("Recorded psspy error in %s: %s" % (name, record[4]))
+        return _unpack(record[3])
+
+    def _diverged(self, name, args, kwargs, method, record):
+        text = "Call %d: %s from %s, recording has %s" % (
+            self.position, _describe((name, args, kwargs)), method,
+            "nothing more" if record is None else "%s from %s" % (_describe(record), record[5]))
+        if self.strict:
+            raise ReplayDivergence(text)
+
+        # Resynchronize on the next call with the same function and arguments, or else the same function
+        window = self._calls[self.position:self.position + _LOOKAHEAD]
+        for matches in (lambda r: r[0] == name and _same(r[1], args) and _same(r[2], kwargs),
+                        lambda r: r[0] == name):
+            for offset, candidate in enumerate(window):
+                if matches(candidate):
+                    self.divergences.append(text + (", skipped %d recorded calls" % offset if offset else ""))
+                    object.__setattr__(self, "position", self.position + offset + 1)
+                    return candidate
+        self.divergences.append(text + ", no match, answered 0")
+        return None
+
+    def _restore_output(self, args, kwargs):
+        out_file = _out_file(args, kwargs)
+        if out_file not in self._outputs:
+            return
+        if self.output_dir is not None:
+            out_file = os.path.join(self.output_dir, _file_name(out_file))
+        with open(out_file, "wb") as f:
+            f.write(self._outputs[_out_file(args, kwargs)])
+
+
+def record():
+    """
+        Record every psspy call of a PsspyCase session from now on, stop() ends it.
+        Output:
+            SessionRecorder, save(path) writes the log
+    """
+    if _active["session"] is not None:
+        raise ValueError("A psspy session is already being recorded or replayed")
+    recorder = SessionRecorder(psspy_profiler.present_psspy())
+    _active["patched"] = psspy_profiler.patch_modules(recorder)
+    _active["session"] = recorder
+    return recorder
+
+
+def replay(log, strict=True, output_dir=None):
+    """
+        Serve psspy from a recorded session log until stop(). Works without PSS/E: call it before psspyObject
+        is imported, the log then stands in for psspy, dyntools reads .out files with channel_reader and
+        redirect does nothing.
+        Output:
+            ReplayBackend, see divergences, remaining() and report()
+    """
+    if _active["session"] is not None:
+        raise ValueError("A psspy session is already being recorded or replayed")
+    backend = ReplayBackend(log, strict, output_dir)
+    _active["modules"] = {}
+    for name, stand_in in (("psspy", backend), ("dyntools", _Dyntools()), ("redirect", _Redirect())):
+        try:
+            __import__(name)
+        except ImportError:
+            _active["modules"][name] = stand_in
+            sys.modules[name] = stand_in
+    _active["patched"] = psspy_profiler.patch_modules(backend)
+    _active["session"] = backend
+    return backend
+
+
+def stop():
+    # End recording or replay, the modules get their psspy back. Returns the recorder or the backend
+    session = _active["session"]
+    psspy_profiler.restore_modules(_active["patched"])
+    for name, stand_in in _active["modules"].items():
+        if sys.modules.get(name) is stand_in:
+            del sys.modules[name]
+    _active["session"] = None
+    _active["patched"] = []
+    _active["modules"] = {}
+    return session
+
+
+class _Redirect(object):
+    def psse2py(self):
+        return None
+    def py2psse(self):
+        return None
+
+
+class _Dyntools(object):
+    class CHNF(object):
+        """Same data as dyntools.CHNF(...).get_data(), read with the numpy reader"""
+        def __init__(self, *outfiles):
+            from channel_reader import ChannelFile
+            self._files = [ChannelFile(outfile) for outfile in outfiles]
+
+        def get_data(self, outfile=""):
+            sh_ttl, ch_id, ch_data = self._files[0].get_data()
+            return sh_ttl, ch_id, dict((key, values.tolist()) for key, values in ch_data.items())
+
+
+# Private functions
+def _plain(value):
+    # Arguments as plain Python values, so they pickle small and compare across Python and numpy versions
+    if isinstance(value, dict):
+        return dict((key, _plain(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_plain(item) for item in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _pack(value):
+    # Return values with long number lists as numpy arrays, the rest as it is
+    if isinstance(value, list) and len(value) > _ARRAY_LENGTH and all(
+            isinstance(item, (int, float, complex)) and not isinstance(item, bool) for item in value):
+        return np.array(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_pack(item) for item in value)
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unpack(item) for item in value)
+    return value
+
+
+def _same(recorded, actual):
+    # Equal arguments, floats up to rounding and paths by their file name
+    if isinstance(recorded, (tuple, list)) and isinstance(actual, (tuple, list)):
+        return len(recorded) == len(actual) and all(_same(a, b) for a, b in zip(recorded, actual))
+    if isinstance(recorded, dict) and isinstance(actual, dict):
+        return sorted(recorded) == sorted(actual) and all(_same(recorded[k], actual[k]) for k in recorded)
+    if isinstance(recorded, float) or isinstance(actual, float):
+        try:
+            return abs(recorded - actual) <= 1e-9 * max(1.0, abs(recorded), abs(actual))
+        except TypeError:
+            return False
+    if isinstance(recorded, (str, type(u""))) and isinstance(actual, (str, type(u""))):
+        return _file_name(recorded) == _file_name(actual)  # Paths differ between the recording and the replay host
+    return recorded == actual
+
+
+def _file_name(text):
+    return text.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+def _describe(call):
+    name, args, kwargs = call[:3]
+    text = ", ".join([_short(arg) for arg in args] + ["%s=%s" % (k, _short(v)) for k, v in sorted(kwargs.items())])
+    return "%s(%s)" % (name, text)
+
+
+def _short(value):
+    text = repr(value)
+    return text if len(text) <= 60 else text[:57] + "..."
+
+
+def _out_file(args, kwargs):
+    out_file = kwargs.get("outfile", args[1] if len(args) > 1 else "")
+    if out_file and not os.path.splitext(out_file)[1]:
+        out_file += ".out"
+    return out_file
+
+
+def _loads(data):
+    if sys.version_info[0] >= 3:  # Logs recorded with Python 2 (PSS/E 33) hold byte strings
+        return pickle.loads(data, encoding="latin1")
+    return pickle.loads(data)
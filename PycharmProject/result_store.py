@@ -0,0 +1,166 @@
+# Standard Python-packages
+import os
+import json
+import glob
+import numpy as np
+
+# Custom packages
+from channel_reader import ChannelFile, parse_channel_id, MACHINE_QUANTITIES, ID_QUANTITIES
+
+
+_INDEX_SUFFIX = ".idx.json"  # Sidecar index, one per run so parallel converters never share a file
+_DATA_SUFFIX = ".npz"  # Compressed columns, one zip member per channel and time chunk
+
+
+class ResultStore(object):
+    """Time-chunked, compressed column store for dynamic simulation results"""
+    # Constructor
+    def __init__(self, root, chunk_seconds=5.0):
+        """
+            Open (or create) a store.
+            Input:
+                root: folder holding the runs
+                chunk_seconds: simulated time covered by each chunk of a column
+        """
+        self.root = root
+        self.chunk_seconds = chunk_seconds
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        self.runs = {}  # Run name -> sidecar index
+        self.refresh()
+
+    # Public functions
+    def refresh(self):
+        # Read the sidecar indexes of runs added since the store was opened (ex. by other processes)
+        for path in glob.glob(os.path.join(self.root, "*" + _INDEX_SUFFIX)):
+            name = os.path.basename(path)[:-len(_INDEX_SUFFIX)]
+            if name not in self.runs:
+                with open(path) as f:
+                    self.runs[name] = json.load(f)
+    def add_run(self, name, out_file, machine_monitor=None, metadata=None):
+        """
+            Convert a .out file into compressed chunked columns.
+            Input:
+                name: run name, ex. case.filename
+                out_file: path of the .out file
+                machine_monitor: channel table from set_monitor_channels, gives the full quantity names
+                metadata: extra JSON-serializable information stored with the run
+        """
+        channel_file = ChannelFile(out_file)
+        time = channel_file.time
+
+        # Chunk boundaries on the time axis, the axis does not need to be uniform
+        if channel_file.n_samples > 0:
+            edges = np.arange(np.floor(time[0] / self.chunk_seconds) + 1,
+                              np.floor(time[-1] / self.chunk_seconds) + 1) * self.chunk_seconds
+        else:
+            edges = np.zeros(0)
+        bounds = np.concatenate(([0], np.searchsorted(time, edges, side="left"), [channel_file.n_samples]))
+        bounds = np.unique(bounds)
+
+        columns = {}
+        chunks = []
+        for k in range(len(bounds) - 1):
+            first, last = int(bounds[k]), int(bounds[k + 1])
+            if first == last:
+                continue
+            chunk = len(chunks)
+            chunks.append([float(time[first]), float(time[last - 1]), first, last])
+            columns["t_%d" % chunk] = np.array(time[first:last])
+            block = np.array(channel_file.data[first:last])
+            for c in range(channel_file.n_channels):
+                columns["c%d_%d" % (c, chunk)] = block[:, c]
+
+        data_path = os.path.join(self.root, name + _DATA_SUFFIX)
+        np.savez_compressed(data_path, **columns)
+
+        index = {"name": name,
+                 "source": os.path.abspath(channel_file.path),
+                 "title": channel_file.title,
+                 "chunks": chunks,
+                 "channels": self._describe_channels(channel_file, machine_monitor),
+                 "metadata": metadata or {}}
+        index_path = os.path.join(self.root, name + _INDEX_SUFFIX)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        if os.path.exists(index_path):  # os.rename does not overwrite on Windows
+            os.remove(index_path)
+        os.rename(index_path + ".tmp", index_path)  # Readers never see a half written index
+        self.runs[name] = index
+        return index
+    def add_case(self, case, metadata=None):
+        # Store the output of a PsspyCase after run_dynamic_simulation
+        return self.add_run(case.filename, case.outputfile + ".out",
+                            getattr(case, "machine_monitor", None), metadata)
+    def channels(self, name, quantity=None, bus=None, machine_id=None):
+        # Channel metadata of a run, filtered on quantity (full name or .out abbreviation), bus and machine ID
+        selected = []
+        for channel in self.runs[name]["channels"]:
+            if quantity is not None and quantity not in (channel["quantity"], channel["id_quantity"]):
+                continue
+            if bus is not None and channel["bus"] != bus:
+                continue
+            if machine_id is not None and channel["machine_id"] != str(machine_id):
+                continue
+            selected.append(channel)
+        return selected
+    def query(self, quantity=None, bus=None, machine_id=None, t_start=None, t_end=None, runs=None):
+        """
+            Read matching channels between t_start and t_end, touching only the chunks that overlap.
+            Output:
+                dictionary run name -> (time, values with one column per channel, channel metadata)
+        """
+        results = {}
+        for name in (sorted(self.runs) if runs is None else runs):
+            channels = self.channels(name, quantity, bus, machine_id)
+            if not channels:
+                continue
+            chunks = [k for k, (t0, t1, _, _) in enumerate(self.runs[name]["chunks"])
+                      if (t_end is None or t0 <= t_end) and (t_start is None or t1 >= t_start)]
+
+            archive = np.load(os.path.join(self.root, name + _DATA_SUFFIX))  # Members are decompressed on access
+            try:
+                time = np.concatenate([archive["t_%d" % k] for k in chunks]) if chunks else np.zeros(0, "<f4")
+                values = np.empty((len(time), len(channels)), dtype="<f4")
+                for j, channel in enumerate(channels):
+                    if chunks:
+                        values[:, j] = np.concatenate([archive["c%d_%d" % (channel["column"], k)] for k in chunks])
+            finally:
+                archive.close()
+
+            keep = np.ones(len(time), dtype=bool)
+            if t_start is not None:
+                keep &= time >= t_start
+            if t_end is not None:
+                keep &= time <= t_end
+            results[name] = (time[keep], values[keep], channels)
+        return results
+    def remove_run(self, name):
+        for suffix in (_INDEX_SUFFIX, _DATA_SUFFIX):
+            path = os.path.join(self.root, name + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs.pop(name, None)
+
+    # Private functions
+    def _describe_channels(self, channel_file, machine_monitor):
+        # Quantity, bus and machine ID of every column, taken from ch_id and (if given) machine_monitor
+        monitored = {}
+        if machine_monitor is not None:
+            for row in np.asarray(machine_monitor):
+                monitored[int(row[0])] = (MACHINE_QUANTITIES[int(row[1]) - 1], int(row[2]))
+
+        channels = []
+        for c, channel_id in enumerate(channel_file.channel_ids):
+            id_quantity, bus, bus_name, base_kv, machine_id = parse_channel_id(channel_id)
+            quantity, monitored_bus = monitored.get(c + 1, (ID_QUANTITIES.get(id_quantity, id_quantity), bus))
+            channels.append({"column": c,
+                             "channel": c + 1,
+                             "id": channel_id,
+                             "quantity": quantity,
+                             "id_quantity": id_quantity,
+                             "bus": monitored_bus,
+                             "bus_name": bus_name,
+                             "base_kv": base_kv,
+                             "machine_id": machine_id})
+        return channels
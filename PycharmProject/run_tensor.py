@@ -0,0 +1,292 @@
+# Standard Python-packages
+import os
+import json
+import numpy as np
+
+# Custom packages
+from channel_reader import ChannelFile, channels_from_ids, read_registry
+
+
+_DATA_SUFFIX = ".npy"  # runs x channels x time float32, NaN where a run has no value
+_INDEX_SUFFIX = ".json"  # Runs, channels and time grid
+_BLOCK_BYTES = 64 * 1024 ** 2  # Memory per block of the interpolation and of the reductions
+_KEY_FIELDS = ("kind", "quantity", "bus", "to_bus", "id")
+_TIME_DIGITS = 6
+
+# Reductions over time of ranking, on the difference to the baseline (or the values without a baseline)
+_METRICS = {"max_abs": lambda values: np.nanmax(np.abs(values), axis=-1),
+            "rms": lambda values: np.sqrt(np.nanmean(values ** 2, axis=-1)),
+            "min": lambda values: np.nanmin(values, axis=-1),
+            "max": lambda values: np.nanmax(values, axis=-1),
+            "final": lambda values: _last_finite(values)}  # Last value of each run, also of runs stopped early
+
+
+class RunTensor(object):
+    """Runs x channels x time array of many runs on a common time grid, memory-mapped from disk"""
+    # Constructor
+    def __init__(self, path, mode="r"):
+        """
+            Open a tensor written by build_tensor.
+            Input:
+                path: file name without extension, the data is path.npy and the index path.json
+                mode: "r" to read, "r+" to change values in place
+        """
+        self.path = path
+        with open(path + _INDEX_SUFFIX) as f:
+            index = json.load(f)
+        self.runs = index["runs"]  # One dictionary per run: name, source, metadata, first and last time
+        self.channels = index["channels"]  # One dictionary per channel: kind, quantity, bus, to_bus, id
+        self.time = np.array(index["time"])
+        self.data = np.load(path + _DATA_SUFFIX, mmap_mode=mode)
+        self._runs = dict((run["name"], k) for k, run in enumerate(self.runs))
+        self._channels = dict((_key(channel), k) for k, channel in enumerate(self.channels))
+
+    # Public functions
+    @property
+    def shape(self):
+        return self.data.shape
+    def run_rows(self, names=None):
+        # Rows of the runs with these names, all runs for None
+        if names is None:
+            return np.arange(len(self.runs))
+        try:
+            return np.array([self._runs[name] for name in names], dtype=int)
+        except KeyError as error:
+            raise ValueError("No run %r in %s" % (error.args[0], self.path))
+    def select(self, quantity=None, bus=None, kind=None, channel_id=None):
+        # Rows of the channels matching quantity, bus (number or list), kind and machine/branch ID
+        rows = []
+        for k, channel in enumerate(self.channels):
+            if quantity is not None and channel["quantity"] != quantity:
+                continue
+            if bus is not None and channel["bus"] not in np.atleast_1d(bus):
+                continue
+            if kind is not None and channel["kind"] != kind:
+                continue
+            if channel_id is not None and channel["id"] != str(channel_id):
+                continue
+            rows.append(k)
+        return np.array(rows, dtype=int)
+    def channel_row(self, kind, quantity, bus, to_bus=None, channel_id="1"):
+        key = (kind, quantity, bus, to_bus, str(channel_id))
+        if key not in self._channels:
+            raise ValueError("No channel %r in %s" % (key, self.path))
+        return self._channels[key]
+    def envelope(self, channels=None, runs=None):
+        # (minimum, maximum) over the runs, channels x time, NaN where no run has a value
+        return (self._reduce(lambda block: np.nanmin(block, axis=0), channels, runs),
+                self._reduce(lambda block: np.nanmax(block, axis=0), channels, runs))
+    def percentiles(self, q, channels=None, runs=None):
+        # Percentiles q (0-100) over the runs, len(q) x channels x time
+        q = np.atleast_1d(q)
+        return self._reduce(lambda block: np.nanpercentile(block, q, axis=0), channels, runs, axis=1)
+    def difference(self, baseline, channels=None, runs=None, out=None):
+        """
+            Every run minus the baseline run, a few channels at a time.
+            Input:
+                baseline: name of the run
+                channels, runs: rows and names to keep, None = all
+                out: file name (.npy) to write the result to as a memory-mapped array, None = in memory
+            Output:
+                float32 array runs x channels x time, a memmap of out if given
+        """
+        base_row = self.run_rows([baseline])[0]
+        run_rows = self.run_rows(runs)
+        channel_rows = self._channel_rows(channels)
+        shape = (len(run_rows), len(channel_rows), len(self.time))
+        if out is None:
+            result = np.empty(shape, dtype="<f4")
+        else:
+            result = np.lib.format.open_memmap(out, mode="w+", dtype="<f4", shape=shape)
+        for start, rows in self._channel_blocks(run_rows, channel_rows):
+            base = np.asarray(self.data[base_row, rows], dtype=float)
+            result[:, start:start + len(rows)] = self._block(run_rows, rows) - base[None]
+        if out is not None:
+            result.flush()
+        return result
+    def ranking(self, channel, metric="max_abs", baseline=None, runs=None, ascending=False):
+        """
+            Runs ordered on one number per run of a channel.
+            Input:
+                channel: channel row, ex. channel_row("machine", "SPEED", 5600)
+                metric: "max_abs", "rms", "min", "max", "final" or function(values runs x time) -> runs
+                baseline: name of the run the others are compared with, None = the values themselves
+                ascending: False = largest first
+            Output:
+                list of (run name, value), runs without a value (NaN) last
+        """
+        function = _METRICS[metric] if not callable(metric) else metric
+        rows = self.run_rows(runs)
+        values = np.array(self.data[rows, channel], dtype=float)
+        if baseline is not None:
+            values -= self.data[self.run_rows([baseline])[0], channel]
+        with np.errstate(invalid="ignore"), _quiet_nan_warnings():
+            scores = function(values)
+        order = np.argsort(np.where(np.isnan(scores), np.inf, scores if ascending else -scores), kind="mergesort")
+        return [(self.runs[rows[k]]["name"], float(scores[k])) for k in order]
+
+    # Private functions
+    def _channel_rows(self, channels):
+        return np.arange(len(self.channels)) if channels is None else np.atleast_1d(channels).astype(int)
+    def _block(self, run_rows, channel_rows):
+        # Copy of data[run_rows][:, channel_rows] without reading other runs or channels
+        return np.array(self.data[np.ix_(run_rows, channel_rows)], dtype=float)
+    def _channel_blocks(self, run_rows, channel_rows):
+        # (position, channel rows) of blocks of channels that fit in _BLOCK_BYTES for these runs
+        step = max(1, _BLOCK_BYTES // max(len(run_rows) * len(self.time) * 8, 1))
+        for start in range(0, len(channel_rows), step):
+            yield start, channel_rows[start:start + step]
+    def _reduce(self, function, channels, runs, axis=0):
+        # function(runs x channels x time) -> reduction over runs, done a few channels at a time
+        run_rows = self.run_rows(runs)
+        parts = []
+        with _quiet_nan_warnings():
+            for _, rows in self._channel_blocks(run_rows, self._channel_rows(channels)):
+                parts.append(function(self._block(run_rows, rows)))
+        if not parts:
+            return np.zeros((0, len(self.time)))
+        return np.concatenate(parts, axis=axis)
+
+
+def build_tensor(outputs, path, names=None, metadata=None, time_step=None, t_start=0.0, t_end=None, channels=None):
+    """
+        Resample the channels of many .out files onto one time grid and write them as one memory-mapped array.
+        Channels are matched on (kind, quantity, bus, to_bus, machine or branch ID) from the channel metadata
+        next to each .out file, or from the channel identifiers for runs without it.
+        Input:
+            outputs: paths of the .out files (with or without extension)
+            path: file name without extension for the tensor, path.npy and path.json are written
+            names: run names, None = the file names
+            metadata: one JSON-serializable dictionary per run stored in the index, ex. the ScenarioSpec as a dict
+            time_step: grid step (s), None = the smallest median step of the runs
+            t_start, t_end: grid range (s), t_end None = the last time of the longest run
+            channels: keys (kind, quantity, bus, to_bus, id) to keep, None = every channel of any run
+        Output:
+            RunTensor, values outside a run's time axis and channels a run does not have are NaN
+    """
+    outputs = list(outputs)
+    names = [_run_name(output) for output in outputs] if names is None else list(names)
+    metadata = [{}] * len(outputs) if metadata is None else list(metadata)
+    if not len(outputs) == len(names) == len(metadata):
+        raise ValueError("Need as many names and metadata entries as outputs")
+    if len(set(names)) < len(names):
+        raise ValueError("Run names must be unique")
+
+    # Channel keys and time axis of every run, the .out files are only mapped
+    files, run_keys = [], []
+    for output in outputs:
+        channel_file = ChannelFile(output)
+        files.append(channel_file)
+        run_keys.append([_key(channel) + (channel["index"],) for channel in _run_channels(channel_file)])
+    if channels is None:
+        keys = sorted(set(key[:-1] for keys in run_keys for key in keys), key=_sort_key)
+    else:
+        keys = [tuple(key) for key in channels]
+    rows = dict((key, k) for k, key in enumerate(keys))
+
+    if time_step is None:
+        steps = [np.median(np.diff(f.time)) for f in files if f.n_samples > 1]
+        time_step = round(float(min(step for step in steps if step > 0.0)), _TIME_DIGITS) if steps else 1.0
+    if t_end is None:  # Times are float32 in the .out file, rounded so the grid does not inherit their error
+        t_end = round(max(float(f.time[-1]) for f in files if f.n_samples > 0), _TIME_DIGITS) \
+            if any(f.n_samples for f in files) else t_start
+    time = t_start + time_step * np.arange(int(np.floor((t_end - t_start) / time_step + 1e-9)) + 1)
+
+    data = np.lib.format.open_memmap(path + _DATA_SUFFIX, mode="w+", dtype="<f4",
+                                     shape=(len(outputs), len(keys), len(time)))
+    runs = []
+    for r, (channel_file, keys_of_run) in enumerate(zip(files, run_keys)):
+        selected = [(rows[key[:-1]], key[-1] - 1) for key in keys_of_run if key[:-1] in rows]
+        data[r] = np.nan
+        if selected and channel_file.n_samples > 0:
+            target = np.array([row for row, _ in selected], dtype=int)
+            columns = np.array([column for _, column in selected], dtype=int)
+            order = np.argsort(target)  # Rows in order, a view-friendly write into the tensor
+            target, columns = target[order], columns[order]
+            step = max(1, _BLOCK_BYTES // max(len(columns) * 8, 1))
+            for start in range(0, len(time), step):
+                data[r, target, start:start + step] = _interpolate(channel_file, columns, time[start:start + step]).T
+        runs.append({"name": names[r], "source": os.path.abspath(channel_file.path), "metadata": metadata[r],
+                     "first": float(channel_file.time[0]) if channel_file.n_samples else None,
+                     "last": float(channel_file.time[-1]) if channel_file.n_samples else None,
+                     "channels": len(selected)})
+        channel_file.close()
+    data.flush()
+    del data
+
+    index = {"runs": runs, "channels": [dict(zip(_KEY_FIELDS, key)) for key in keys], "time": time.tolist()}
+    with open(path + _INDEX_SUFFIX + ".tmp", "w") as f:
+        json.dump(index, f)
+    if os.path.exists(path + _INDEX_SUFFIX):  # os.rename does not overwrite on Windows
+        os.remove(path + _INDEX_SUFFIX)
+    os.rename(path + _INDEX_SUFFIX + ".tmp", path + _INDEX_SUFFIX)
+    return RunTensor(path)
+
+
+def from_sweep(results, path, **options):
+    # Tensor of the runs of run_sweep that finished, with the ScenarioSpec and the stop of each run as metadata
+    results = [result for result in results if result.status == "ok"]
+    metadata = [dict(result.spec.to_dict(), stop_reason=result.stop_reason, stop_time=result.stop_time)
+                for result in results]
+    return build_tensor([result.outputfile for result in results], path, [result.name for result in results],
+                        metadata, **options)
+
+
+# Private functions
+def _run_name(output):
+    name = os.path.basename(output)
+    return name[:-4] if name.endswith(".out") else name
+
+
+def _run_channels(channel_file):
+    # Channel metadata of the run, from ChannelRegistry's file when there is one
+    channels = read_registry(channel_file.path)
+    return channels if channels is not None else channels_from_ids(channel_file)
+
+
+def _key(channel):
+    # (kind, quantity, bus, to_bus, id), id is the machine ID or the branch ID
+    channel_id = channel.get("id")
+    if channel_id is None:
+        channel_id = channel.get("machine_id") if channel["kind"] != "branch" else channel.get("branch_id")
+    return (channel["kind"], channel["quantity"], channel["bus"], channel.get("to_bus"),
+            None if channel_id is None else str(channel_id))
+
+
+def _sort_key(key):
+    return tuple((value is None, value) for value in key)
+
+
+def _last_finite(values):
+    # Last finite value along the time axis, NaN where there is none
+    finite = np.isfinite(values)
+    last = values.shape[-1] - 1 - np.argmax(finite[..., ::-1], axis=-1)
+    found = np.any(finite, axis=-1)
+    return np.where(found, np.take_along_axis(values, last[..., None], axis=-1)[..., 0], np.nan)
+
+
+def _interpolate(channel_file, columns, grid):
+    # Linear interpolation of the columns at the grid times (grid x columns), NaN outside the run
+    # At a time written twice (before and after an event) the later sample is used
+    time = channel_file.time
+    right = np.searchsorted(time, grid, side="right")
+    left = np.clip(right - 1, 0, len(time) - 1)
+    right = np.clip(right, 0, len(time) - 1)
+    span = time[right] - time[left]
+    weight = np.where(span > 0.0, (grid - time[left]) / np.where(span > 0.0, span, 1.0), 0.0)[:, None]
+    first, last = left.min(), right.max() + 1  # Only the rows around the grid block are read
+    block = np.asarray(channel_file.data[first:last][:, columns], dtype=float)
+    values = block[left - first] * (1.0 - weight) + block[right - first] * weight
+    values[(grid < time[0]) | (grid > time[-1])] = np.nan
+    return values
+
+
+class _quiet_nan_warnings(object):
+    # All-NaN slices (runs that ended early, missing channels) give NaN without a RuntimeWarning
+    def __enter__(self):
+        import warnings
+        self._catcher = warnings.catch_warnings()
+        self._catcher.__enter__()
+        warnings.simplefilter("ignore", RuntimeWarning)
+    def __exit__(self, *args):
+        return self._catcher.__exit__(*args)
@@ -0,0 +1,234 @@
+# Standard Python-packages
+import os
+import time
+import itertools
+import traceback
+import multiprocessing
+
+
+class ScenarioSpec(object):
+    """Everything needed to set up and run one PsspyCase scenario"""
+    # Constructor
+    def __init__(self, name, hvdc=(), faults=(), time_step=0.005, p_zip=(10.0, 10.0), q_zip=(10.0, 10.0),
+                 buses=(5600, 3300, 7000), quantities=(1, 2, 4, 7), end_time=10.0, input_network="Scenario1",
+                 add_hvdc_buses=True, save_network=False, sampling=None, stop=None):
+        """
+            Input:
+                name: scenario name, used as output_name of the case
+                hvdc: (bus number, limit) pairs for set_hvdc_active_power, applied in order
+                faults: (time, type, bus, extras) tuples for add_fault
+                time_step, p_zip, q_zip: parameters for prepare_dynamic_simulation
+                buses, quantities: monitored channels for set_monitor_channels
+                end_time: end of the dynamic simulation (s)
+                sampling: optional keyword arguments of set_output_sampling, ex. {"sparse_nplt": 50}
+                stop: optional keyword arguments of set_stop_monitor, ex. {"hold": 10.0}, to end the run early
+        """
+        self.name = name
+        self.hvdc = [tuple(pair) for pair in hvdc]
+        self.faults = [tuple(fault) for fault in faults]
+        self.time_step = time_step
+        self.p_zip = list(p_zip)
+        self.q_zip = list(q_zip)
+        self.buses = list(buses)
+        self.quantities = list(quantities)
+        self.end_time = end_time
+        self.input_network = input_network
+        self.add_hvdc_buses = add_hvdc_buses
+        self.save_network = save_network
+        self.sampling = dict(sampling) if sampling is not None else None
+        self.stop = dict(stop) if stop is not None else None
+
+    # Public functions
+    def to_dict(self):
+        return dict(self.__dict__)
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+    def copy(self, **changes):
+        values = self.to_dict()
+        values.update(changes)
+        return ScenarioSpec(**values)
+    def __repr__(self):
+        return "ScenarioSpec(%r, hvdc=%r, faults=%r)" % (self.name, self.hvdc, self.faults)
+
+
+class ScenarioResult(object):
+    """Outcome of one scenario, returned by run_sweep in the order of the specs"""
+    def __init__(self, spec, status, outputfile=None, elapsed=0.0, worker=None, error=None, values=None,
+                 record=None, stop_reason=None, stop_time=None, post_error=None):
+        self.spec = spec
+        self.name = spec.name
+        self.status = status  # "ok" or "failed"
+        self.outputfile = outputfile  # Without the .out extension, as PsspyCase.outputfile
+        self.elapsed = elapsed  # Wall time in the worker (s)
+        self.worker = worker  # Process ID of the worker
+        self.error = error  # Traceback text if the scenario failed
+        self.post_error = post_error  # Traceback text if the simulation ran but post-processing or the record failed
+        self.values = values if values is not None else {}  # Return value of the post-processing hook
+        self.record = record  # Catalog record made in the worker, see catalog.run_record
+        self.stop_reason = stop_reason  # "settled", "angle_separation" or "speed_deviation" if the run ended early
+        self.stop_time = stop_time  # Time the run ended (s)
+
+    def __repr__(self):
+        return "ScenarioResult(%r, %s, %.1f s)" % (self.name, self.status, self.elapsed)
+
+
+def scenario_grid(base, **axes):
+    """
+        Cartesian product of scenario variations.
+        Input:
+            base: ScenarioSpec with the common settings
+            axes: attribute name -> list of values, ex. hvdc=[[(5610, -1400)], [(5610, 1400)]]
+        Output:
+            list of ScenarioSpec, named base.name + "_" + index of the combination
+    """
+    names = sorted(axes)
+    specs = []
+    for k, combination in enumerate(itertools.product(*[axes[name] for name in names])):
+        changes = dict(zip(names, combination))
+        changes["name"] = "%s_%d" % (base.name, k)
+        specs.append(base.copy(**changes))
+    return specs
+
+
+def run_sweep(specs, processes=None, root_dir=None, output_dir=None, post=None, cache_dir=None, catalog_path=None,
+              pool=None):
+    """
+        Run scenarios on a pool of worker processes, each worker keeps its PSS/E session for many scenarios.
+        Input:
+            specs: list of ScenarioSpec
+            processes: number of workers, None = number of cores
+            root_dir: folder holding "Models", None = parent of the working directory
+            output_dir: results go to output_dir/worker_<pid>, None = root_dir/Output
+            post: optional module-level function post(case, spec) -> dict, run in the worker after the simulation
+            cache_dir: folder of a CaseCache shared by the workers, None = build every case from scratch
+            catalog_path: SQLite Catalog that gets every scenario, ok or failed, in one batch at the end
+            pool: pool of start_pool to run on, it is left open for more sweeps (processes, root_dir, output_dir
+                  and cache_dir are then those of the pool)
+        Output:
+            list of ScenarioResult in the same order as specs
+        Scripts calling this on Windows must be guarded with if __name__ == "__main__".
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = start_pool(processes, root_dir, output_dir, cache_dir)
+    try:
+        results = pool.map(_run_scenario, [(spec, post, catalog_path is not None) for spec in specs], chunksize=1)
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+    if catalog_path is not None:  # Workers only make the records, one process writes them
+        from catalog import Catalog
+        catalog = Catalog(catalog_path)
+        try:
+            catalog.add_runs([result.record for result in results if result.record is not None])
+        finally:
+            catalog.close()
+    return results
+
+
+def kpi_summary(case, spec):
+    # Post-processing hook for run_sweep and the tools on top of it: kpi.run_summary of the case's indicators,
+    # frequency nadir, RoCoF, settling, damping and the angle separation of the ANGLE channels
+    import kpi
+    return kpi.run_summary(case.compute_kpis())
+
+
+def start_pool(processes=None, root_dir=None, output_dir=None, cache_dir=None):
+    # Worker processes for run_sweep(..., pool=pool), so several sweeps share the workers and their PSS/E sessions
+    if root_dir is None:
+        root_dir = os.path.dirname(os.path.abspath(os.getcwd()))
+    if output_dir is None:
+        output_dir = os.path.join(root_dir, "Output")
+    return multiprocessing.Pool(processes, initializer=_init_worker, initargs=(root_dir, output_dir, cache_dir))
+
+
+def start_executor(processes=None, root_dir=None, output_dir=None, cache_dir=None):
+    # Same workers as start_pool as a concurrent.futures executor (Python 3.7+), submit run_in_worker to it
+    # A worker that dies (ex. PSS/E crashing) breaks the executor instead of leaving its scenario waiting forever
+    from concurrent.futures import ProcessPoolExecutor  # Python 3 only, the rest of the module runs on Python 2
+    if root_dir is None:
+        root_dir = os.path.dirname(os.path.abspath(os.getcwd()))
+    if output_dir is None:
+        output_dir = os.path.join(root_dir, "Output")
+    return ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(root_dir, output_dir, cache_dir))
+
+
+def run_in_worker(spec, post=None, record=False):
+    # Run a scenario in a worker of start_pool or start_executor, with that worker's folder and cache
+    return run_scenario(spec, _worker["root_dir"], _worker["output_dir"], post, _worker["cache"], record)
+
+
+def run_scenario(spec, root_dir, output_dir, post=None, cache=None, record=False):
+    # Run a single scenario in this process, same steps as a worker, record=True adds the catalog record
+    import psspyObject  # PSS/E is only imported where a case is actually run
+    import catalog
+
+    start = time.time()
+    try:
+        case = psspyObject.PsspyCase(spec.name, spec.input_network, root_dir=root_dir, output_dir=output_dir,
+                                     load_case=cache is None)
+        case.filename = spec.input_network + "_" + spec.name  # Replaced by set_hvdc_active_power if there is HVDC
+        if cache is not None:  # Restore the dynamics-ready state, or build and store it
+            cache.prepare(case, spec.hvdc, spec.time_step, spec.p_zip, spec.q_zip, spec.add_hvdc_buses)
+            if spec.save_network:
+                case.save_network_data()
+        else:
+            for hvdc_bus_nr, hvdc_limit in spec.hvdc:
+                case.set_hvdc_active_power(hvdc_bus_nr, hvdc_limit)
+            if spec.add_hvdc_buses:
+                case.add_hvdc_buses()
+            case.run_static_load_flow()
+            if spec.save_network:
+                case.save_network_data()
+            case.prepare_dynamic_simulation(spec.time_step, spec.p_zip, spec.q_zip)
+        for fault in spec.faults:
+            case.add_fault(*fault)
+        case.set_monitor_channels(spec.buses, spec.quantities)
+        if spec.sampling is not None:
+            case.set_output_sampling(**spec.sampling)
+        if spec.stop is not None:
+            case.set_stop_monitor(**spec.stop)
+        case.run_dynamic_simulation(spec.end_time)
+    except Exception:
+        error = traceback.format_exc()
+        run_record = catalog.failed_record(spec, time.time() - start, error) if record else None
+        return ScenarioResult(spec, "failed", elapsed=time.time() - start, worker=os.getpid(), error=error,
+                              record=run_record)
+
+    # The .out file is there whatever happens below, an error here does not make the scenario fail
+    values, run_record, post_errors = None, None, []
+    try:
+        values = post(case, spec) if post is not None else None
+    except Exception:
+        post_errors.append(traceback.format_exc())
+    try:
+        run_record = catalog.run_record(case, spec, time.time() - start) if record else None
+    except Exception:
+        post_errors.append(traceback.format_exc())
+    return ScenarioResult(spec, "ok", case.outputfile, time.time() - start, os.getpid(), values=values,
+                          record=run_record, stop_reason=case.stop_reason, stop_time=case.stop_time,
+                          post_error="\n".join(post_errors) if post_errors else None)
+
+
+# Private functions
+_worker = {}  # Settings of the worker process, filled by _init_worker
+
+
+def _init_worker(root_dir, output_dir, cache_dir=None):
+    # Every worker writes to its own folder and only changes its own working directory
+    worker_dir = os.path.join(output_dir, "worker_%d" % os.getpid())
+    if not os.path.isdir(worker_dir):
+        os.makedirs(worker_dir)
+    os.chdir(worker_dir)  # PSS/E writes its own scratch files to the working directory
+    _worker["root_dir"] = root_dir
+    _worker["output_dir"] = worker_dir
+    _worker["cache"] = None
+    if cache_dir is not None:
+        from case_cache import CaseCache
+        _worker["cache"] = CaseCache(cache_dir)
+
+
+def _run_scenario(args):
+    return run_in_worker(*args)
@@ -0,0 +1,251 @@
+# Standard Python-packages
+import os
+import numpy as np
+
+# Custom packages
+import events
+
+
+EXPORT = 1  # HVDC load above zero: power leaves the system at the HVDC bus
+IMPORT = -1
+
+
+class Criterion(object):
+    """Pass/fail limit on one run_summary value, ex. Criterion("frequency_nadir", minimum=49.0)"""
+    def __init__(self, name, minimum=None, maximum=None, scale=None):
+        """
+            Input:
+                name: key of kpi.run_summary, ex. "frequency_nadir", "max_rocof", "angle_separation"
+                minimum, maximum: the value must stay at or above minimum and at or below maximum
+                scale: unit of the margin, None = the size of the limit, so margins of criteria compare
+        """
+        if minimum is None and maximum is None:
+            raise ValueError("Criterion on %s needs a minimum or a maximum" % name)
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        limit = minimum if minimum is not None else maximum
+        self.scale = float(scale) if scale is not None else (abs(float(limit)) or 1.0)
+    def margin(self, summary):
+        # Distance to the limit in scale units, positive = inside, -inf when the value is missing (NaN)
+        if self.name not in summary:
+            raise ValueError("run_summary has no %r, found %s" % (self.name, ", ".join(sorted(summary))))
+        value = summary[self.name]
+        if value is None or np.isnan(value):
+            return -np.inf
+        margins = []
+        if self.minimum is not None:
+            margins.append((value - self.minimum) / self.scale)
+        if self.maximum is not None:
+            margins.append((self.maximum - value) / self.scale)
+        return min(margins)
+    def __repr__(self):
+        return "Criterion(%r, minimum=%r, maximum=%r)" % (self.name, self.minimum, self.maximum)
+
+
+class Probe(object):
+    """One simulated HVDC setpoint of a transfer limit search"""
+    def __init__(self, transfer, hvdc_limit, result, margin, binding):
+        self.transfer = transfer  # MW in the search direction, >= 0
+        self.hvdc_limit = hvdc_limit  # Setpoint given to set_hvdc_active_power
+        self.status = result.status  # "ok" or "failed", a failed simulation does not pass
+        self.outputfile = result.outputfile
+        self.elapsed = result.elapsed
+        self.error = result.error
+        self.post_error = result.post_error  # The run has no run_summary to judge, it does not pass
+        self.values = result.values  # run_summary of the run
+        self.margin = margin  # Smallest criterion margin, >= 0 passes
+        self.binding = binding  # Name of the criterion with that margin
+        self.passed = result.status == "ok" and margin >= 0.0
+    def __repr__(self):
+        return "Probe(%g MW, %s, margin %.4g)" % (self.hvdc_limit, "pass" if self.passed else "fail", self.margin)
+
+
+class TransferLimit(object):
+    """Outcome of search_transfer_limit"""
+    def __init__(self, hvdc_bus_nr, direction, tolerance):
+        self.hvdc_bus_nr = hvdc_bus_nr
+        self.direction = direction
+        self.tolerance = tolerance
+        self.probes = []  # In the order they were simulated
+        self.passing = None  # Largest transfer (MW) known to pass, None = not even the lower bound passes
+        self.failing = None  # Smallest transfer known to fail above passing, None = the upper bound passes
+        self.monotonic = True  # False if a transfer passed above one that failed
+
+    # Public functions
+    @property
+    def limit(self):
+        # Largest HVDC setpoint that passed, signed as for set_hvdc_active_power
+        return None if self.passing is None else self.direction * self.passing
+    @property
+    def simulations(self):
+        return len(self.probes)
+    @property
+    def converged(self):
+        return self.passing is not None and (self.failing is None or
+                                             self.failing - self.passing <= self.tolerance)
+    def table(self):
+        # Text table of the probes in transfer order
+        lines = ["%10s %6s %10s %-24s %8s" % ("MW", "result", "margin", "binding", "s")]
+        for probe in sorted(self.probes, key=lambda probe: probe.transfer):
+            lines.append("%10.1f %6s %10.4g %-24s %8.1f" % (probe.hvdc_limit, "pass" if probe.passed else "fail",
+                                                           probe.margin, probe.binding or probe.status,
+                                                           probe.elapsed))
+        return "\n".join(lines)
+    def __repr__(self):
+        return "TransferLimit(bus %d, limit %s MW, %d simulations)" % (self.hvdc_bus_nr, self.limit, self.simulations)
+
+
+def hvdc_trip(time):
+    # Fault set of search_transfer_limit: the HVDC load stepped back to zero at time, as a trip of the link would
+    def faults(hvdc_bus_nr, hvdc_limit):
+        return [(time, events.LOAD_STEP, hvdc_bus_nr, [-hvdc_limit])]
+    return faults
+
+
+def search_transfer_limit(base, hvdc_bus_nr, direction, criteria, maximum, minimum=0.0, faults=None, tolerance=10.0,
+                          parallel=1, root_dir=None, output_dir=None, cache_dir=None, catalog_path=None):
+    """
+        Largest HVDC import or export that meets the criteria, by bracketing and safeguarded secant/bisection.
+        Every probe is a dynamic simulation of base with the HVDC setpoint of hvdc_bus_nr changed.
+        Input:
+            base: ScenarioSpec with the other HVDC setpoints, channels, time step and end time
+            direction: EXPORT or IMPORT
+            criteria: list of Criterion, all of them must hold
+            maximum, minimum: transfer (MW, >= 0) searched between, minimum is expected to pass
+            faults: list of add_fault tuples, or function(hvdc_bus_nr, hvdc_limit) -> list, ex. hvdc_trip(10.0),
+                    None = the faults of base
+            tolerance: search ends when the passing and failing transfers are this close (MW), at least 0.1 MW
+            parallel: probes per round; 1 runs in this process, more run on a pool of that many workers
+            cache_dir: CaseCache of the dynamics-ready states, probes of earlier searches are not built again
+            catalog_path: Catalog that gets every probe
+        Output:
+            TransferLimit, limit is the largest setpoint that passed
+        Scripts calling this with parallel > 1 on Windows must be guarded with if __name__ == "__main__".
+    """
+    import scenario_sweep  # Workers are only started here
+
+    if direction not in (EXPORT, IMPORT):
+        raise ValueError("Direction must be EXPORT (1) or IMPORT (-1), got %r" % (direction,))
+    if not 0.0 <= minimum < maximum:
+        raise ValueError("Need 0 <= minimum < maximum, got %r and %r" % (minimum, maximum))
+    if not criteria:
+        raise ValueError("No criteria to search against")
+    if tolerance < 0.1:
+        raise ValueError("Tolerance must be at least 0.1 MW, the step of the probed transfers, got %r" % (tolerance,))
+    if root_dir is None:
+        root_dir = os.path.dirname(os.path.abspath(os.getcwd()))
+    if output_dir is None:
+        output_dir = os.path.join(root_dir, "Output")
+    if parallel <= 1 and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    search = TransferLimit(hvdc_bus_nr, direction, tolerance)
+    pool = scenario_sweep.start_pool(parallel, root_dir, output_dir, cache_dir) if parallel > 1 else None
+    cache = None
+    if pool is None and cache_dir is not None:
+        from case_cache import CaseCache
+        cache = CaseCache(cache_dir)
+
+    def simulate(transfers):
+        specs = [_probe_spec(base, hvdc_bus_nr, direction * transfer, faults) for transfer in transfers]
+        if pool is not None:
+            results = scenario_sweep.run_sweep(specs, post=scenario_sweep.kpi_summary, catalog_path=catalog_path,
+                                               pool=pool)
+        else:
+            results = [scenario_sweep.run_scenario(spec, root_dir, output_dir, scenario_sweep.kpi_summary, cache,
+                                                   catalog_path is not None) for spec in specs]
+            if catalog_path is not None:
+                _catalog_add(catalog_path, results)
+        for transfer, result in zip(transfers, results):
+            margin, binding = _margin(criteria, result)
+            search.probes.append(Probe(transfer, direction * transfer + 0.0, result, margin, binding))
+        _bracket(search)
+
+    try:
+        simulate([minimum, maximum] + _interior(minimum, maximum, parallel - 2))  # Both ends, and more if workers
+        bisect_next = False
+        while search.passing is not None and search.failing is not None and not search.converged:
+            width = search.failing - search.passing
+            # A secant step next to a bracket end can round onto it, the middle is probed instead
+            transfers = _next_transfers(search, parallel, bisect_next) or _next_transfers(search, parallel, True)
+            if not transfers:  # Every proposal was probed already, the bracket is as narrow as the 0.1 MW steps
+                break
+            simulate(transfers)
+            # Bisect next round if the secant step did not at least halve the bracket
+            bisect_next = search.passing is not None and search.failing is not None and \
+                search.failing - search.passing > 0.5 * width
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return search
+
+
+# Private functions
+def _probe_spec(base, hvdc_bus_nr, hvdc_limit, faults):
+    hvdc = [(bus, limit) for bus, limit in base.hvdc if bus != hvdc_bus_nr] + [(hvdc_bus_nr, hvdc_limit)]
+    if faults is None:
+        probe_faults = base.faults
+    elif callable(faults):
+        probe_faults = faults(hvdc_bus_nr, hvdc_limit)
+    else:
+        probe_faults = faults
+    setpoint = ("%g" % hvdc_limit).replace(".", "p")  # A dot would start the extension of the .out file
+    return base.copy(name="%s_%d_%s" % (base.name, hvdc_bus_nr, setpoint), hvdc=hvdc, faults=probe_faults)
+
+
+def _margin(criteria, result):
+    if result.status != "ok" or result.post_error is not None:
+        return -np.inf, None
+    margins = [(criterion.margin(result.values), criterion.name) for criterion in criteria]
+    return min(margins)
+
+
+def _bracket(search):
+    # Largest passing transfer below the smallest failing one, from every probe so far
+    passed = sorted(probe.transfer for probe in search.probes if probe.passed)
+    failed = sorted(probe.transfer for probe in search.probes if not probe.passed)
+    if failed and passed and passed[-1] > failed[0]:
+        search.monotonic = False
+    search.failing = failed[0] if failed else None
+    below = [transfer for transfer in passed if search.failing is None or transfer < search.failing]
+    search.passing = below[-1] if below else None
+
+
+def _next_transfers(search, count, bisect):
+    # Secant estimate of the zero margin between the bracket ends (when both margins are finite), else the middle,
+    # with count - 1 more transfers evenly inside the bracket when probes run in parallel
+    low, high = search.passing, search.failing
+    width = high - low
+    guess = 0.5 * (low + high)
+    if not bisect:
+        margin_low = _probe_at(search, low).margin
+        margin_high = _probe_at(search, high).margin
+        if np.isfinite(margin_low) and np.isfinite(margin_high) and margin_low > margin_high:
+            guess = low + width * margin_low / (margin_low - margin_high)
+            guess = min(max(guess, low + 0.05 * width), high - 0.05 * width)  # Keep clear of the ends
+    transfers = [guess]
+    for transfer in _interior(low, high, count - 1):
+        if all(abs(transfer - other) > 0.5 * search.tolerance for other in transfers):
+            transfers.append(transfer)
+    probed = set(round(probe.transfer, 1) for probe in search.probes)
+    transfers = set(round(transfer, 1) for transfer in transfers)  # 0.1 MW steps keep probe names and cache keys short
+    return sorted(transfers - probed)
+
+
+def _interior(low, high, count):
+    return list(np.linspace(low, high, count + 2)[1:-1]) if count > 0 else []
+
+
+def _probe_at(search, transfer):
+    return [probe for probe in search.probes if probe.transfer == transfer][-1]
+
+
+def _catalog_add(catalog_path, results):
+    from catalog import Catalog
+    catalog = Catalog(catalog_path)
+    try:
+        catalog.add_runs([result.record for result in results if result.record is not None])
+    finally:
+        catalog.close()